@@ -18,6 +18,8 @@ import scipy.linalg as spl
 
 
 import FiniteDifference.utils as utils
+import FiniteDifference.instrument as instrument
+import FiniteDifference.observers as observers
 
 import FiniteDifference.BandedOperator as BO
 cimport FiniteDifference.BandedOperator as BO
@@ -44,9 +46,10 @@ def initialized(f):
     """
     def newf(self, *args, **kwargs):
         if not self._initialized:
-            FiniteDifferenceEngine.__init__(self, self.grid, coefficients=self.coefficients,
-                    boundaries=self.boundaries, schemes=self.schemes)
-            self.make_discrete_operators()
+            with self._instrument().span('init'):
+                FiniteDifferenceEngine.__init__(self, self.grid, coefficients=self.coefficients,
+                        boundaries=self.boundaries, schemes=self.schemes)
+                self.make_discrete_operators()
             self._initialized = True
         return f(self, *args, **kwargs)
     newf.__name__ = f.__name__
@@ -245,12 +248,19 @@ cdef class FiniteDifferenceEngineADI(FiniteDifferenceEngine):
     cdef public:
         force_bandwidth
         _initialized
+        instrument
+        observers
 
 
     def __init__(self, grid, coefficients={}, boundaries={}, schemes={},
-            force_bandwidth=None):
+            force_bandwidth=None, instrument=None, observers=None):
         """
         The main class describing a FiniteDifferenceEngine that will use the ADI schemes.
+
+        @instrument@ is an instrument.Instrument to time the build and the
+        solves with, by default none. @observers@ is a list of
+        observers.Observer watching the time steps of every solve, by default
+        none.
         """
         self.grid = grid
         self.coefficients = coefficients
@@ -258,6 +268,20 @@ cdef class FiniteDifferenceEngineADI(FiniteDifferenceEngine):
         self.schemes = schemes
         self.force_bandwidth = force_bandwidth
         self._initialized = False
+        self.instrument = instrument
+        self.observers = observers
+
+
+    def _instrument(self):
+        if self.instrument is None:
+            return instrument.NULL
+        return self.instrument
+
+
+    property instrumentation:
+        """The spans and counters of the engine's instrument, as a dict."""
+        def __get__(self):
+            return self._instrument().results()
 
 
     @initialized
@@ -431,118 +455,122 @@ cdef class FiniteDifferenceEngineADI(FiniteDifferenceEngine):
         coeffs = self.coefficients
         bounds = self.boundaries
         force_bandwidth = self.force_bandwidth
-        # d = (0,0), for example ...
-        for d in coeffs.keys():
-            # Don't need an operator for the 0th derivative
-            if d == ():
-                continue
-
-            # Mixed derivatives are handled specially
-            mix = BO.check_derivative(d)
-            if mix:
-                mixed_derivs[d] = True
-                continue
-
-            dim = d[0]
-
-            # Make an operator template for this dimension
-            low, high = self._min_possible_bandwidth(d)
-            bw = force_bandwidth
-            # print "Minimum bandwidth for %s: %s" % (d, (low, high))
-            if bw:
-                if (bw[0] > low or bw[1] < high):
-                    raise ValueError("Your chosen scheme is too wide for the"
-                            " specified bandwidth. (%s needs %s)" %
-                            (bw, (low, high)))
-                low, high = bw
-            B = self.make_operator_template(d, dim,
-                                            force_bandwidth=(low, high))
-            assert B.axis == dim, "B.axis %s, dim %s" % (B.axis, dim)
-            offs = B.D.offsets
-            assert max(offs) >= high, "(%s < %s)" % (max(offs), high)
-            assert min(offs) <= low,  "(%s > %s)" % (min(offs), low)
-
-            # Adjust the boundary conditions as necessary
-            lowbound = []
-            highbound = []
-            if d in bounds:
-                # Take cartesian product of other dimension values
-                otherdims = range(self.grid.ndim)
-                otherdims.remove(B.axis)
-                argset = itertools.product(*(self.grid.mesh[i] for i in otherdims))
-
-                # Pair our current dimension with all combinations of the other
-                # dimension values
-                for a in argset:
-                    b = bounds[d]
-                    lowfunc  = self._wrapscalarfunc(b[0][1], a, dim)
-                    highfunc = self._wrapscalarfunc(b[1][1], a, dim)
-                    b = ((b[0][0], lowfunc(0)), (b[1][0], highfunc(-1)))
-
-                    B.applyboundary(b, self.grid.mesh)
-                    # If we have a dirichlet boundary, save our function
-                    if b[0][0] == 0:
-                        lowbound.append(b[0][1])
-                    if b[1][0] == 0:
-                        highbound.append(b[1][1])
-
-            Bs = _replicate(self.grid.size / self.grid.shape[B.axis], B)
-            Bs = _flatten_tensor_aligned(Bs)
-            if lowbound:
-                Bs.dirichlet[0] = tuple(lowbound) if len(lowbound) > 1 else lowbound[0]
-            if highbound:
-                Bs.dirichlet[1] = tuple(highbound) if len(highbound) > 1 else highbound[0]
-            # if not Bs.is_tridiagonal():
-                # Bs.diagonalize()
-            templates[d] = Bs
+        inst = self._instrument()
+        with inst.span('templates'):
+            # d = (0,0), for example ...
+            for d in coeffs.keys():
+                # Don't need an operator for the 0th derivative
+                if d == ():
+                    continue
+
+                # Mixed derivatives are handled specially
+                mix = BO.check_derivative(d)
+                if mix:
+                    mixed_derivs[d] = True
+                    continue
+
+                dim = d[0]
+
+                # Make an operator template for this dimension
+                low, high = self._min_possible_bandwidth(d)
+                bw = force_bandwidth
+                # print "Minimum bandwidth for %s: %s" % (d, (low, high))
+                if bw:
+                    if (bw[0] > low or bw[1] < high):
+                        raise ValueError("Your chosen scheme is too wide for the"
+                                " specified bandwidth. (%s needs %s)" %
+                                (bw, (low, high)))
+                    low, high = bw
+                B = self.make_operator_template(d, dim,
+                                                force_bandwidth=(low, high))
+                assert B.axis == dim, "B.axis %s, dim %s" % (B.axis, dim)
+                offs = B.D.offsets
+                assert max(offs) >= high, "(%s < %s)" % (max(offs), high)
+                assert min(offs) <= low,  "(%s > %s)" % (min(offs), low)
+
+                # Adjust the boundary conditions as necessary
+                lowbound = []
+                highbound = []
+                if d in bounds:
+                    # Take cartesian product of other dimension values
+                    otherdims = range(self.grid.ndim)
+                    otherdims.remove(B.axis)
+                    argset = itertools.product(*(self.grid.mesh[i] for i in otherdims))
+
+                    # Pair our current dimension with all combinations of the other
+                    # dimension values
+                    for a in argset:
+                        b = bounds[d]
+                        lowfunc  = self._wrapscalarfunc(b[0][1], a, dim)
+                        highfunc = self._wrapscalarfunc(b[1][1], a, dim)
+                        b = ((b[0][0], lowfunc(0)), (b[1][0], highfunc(-1)))
+
+                        B.applyboundary(b, self.grid.mesh)
+                        # If we have a dirichlet boundary, save our function
+                        if b[0][0] == 0:
+                            lowbound.append(b[0][1])
+                        if b[1][0] == 0:
+                            highbound.append(b[1][1])
+
+                Bs = _replicate(self.grid.size / self.grid.shape[B.axis], B)
+                inst.count('operator_copies', len(Bs))
+                Bs = _flatten_tensor_aligned(Bs)
+                if lowbound:
+                    Bs.dirichlet[0] = tuple(lowbound) if len(lowbound) > 1 else lowbound[0]
+                if highbound:
+                    Bs.dirichlet[1] = tuple(highbound) if len(highbound) > 1 else highbound[0]
+                # if not Bs.is_tridiagonal():
+                    # Bs.diagonalize()
+                templates[d] = Bs
 
         # TODO
         # This expects only 2 dimensions
         self._check_mixed_derivative_parameters(mixed_derivs.keys())
-        for d in mixed_derivs.keys():
-            d0_size = len(self.grid.mesh[d[0]])
-            d1_size = len(self.grid.mesh[d[1]])
-
-            # TODO: We'll need to do complicated transposing for this in the
-            # general case
-            Bs = BO.for_vector(self.grid.mesh[d[0]], "center", 1, 2, None, None, 0)
-            Bm1 = BO.for_vector(self.grid.mesh[d[1]], "center", 1, 2, None, None, 1)
-            Bb1 = Bm1.copy()
-            Bp1 = Bm1.copy()
-
-            # TODO: Hardcoding in for centered differencing
-            Bps = [Bp1 * 0, Bp1 * 0] + _replicate(d0_size-2, Bp1)
-            Bbs = [Bb1 * 0] + _replicate(d0_size-2, Bb1) +  [Bb1 * 0]
-            Bms = _replicate(d0_size-2, Bm1) + [Bm1 * 0, Bm1 * 0]
-
-            offsets = Bs.D.offsets
-            data = [Bps, Bbs, Bms]
-            for row, o in enumerate(offsets):
-                if o >= 0:
-                    for i in range(Bs.shape[0]-o):
-                        # a = (np.array(self.grid.mesh[d[0]][i]).repeat(d1_size),)
-                        # vec = self._evalvectorfunc(coeffs[d], a, 1)
-                        # data[row][i+o].vectorized_scale(vec)
-                        data[row][i+o] *= Bs.D.data[row, i+o]
-                else:
-                    for i in range(abs(o), Bs.shape[0]):
-                        # a = (np.array(self.grid.mesh[d[0]][i]).repeat(d1_size),)
-                        # vec = self._evalvectorfunc(coeffs[d], a, 1)
-                        # data[row][i-abs(o)].vectorized_scale(vec)
-                        data[row][i-abs(o)] *= Bs.D.data[row, i-abs(o)]
-
-            # We flatten here because it's faster
-            # Check is set to False because we're only faking that the offsets
-            # are correct. The resulting operator will take the offsets from
-            # only the first in the list.
-            Bps[0].D.offsets += d1_size
-            Bms[0].D.offsets -= d1_size
-            BP = _flatten_tensor_aligned(Bps, check=False)
-            BB = _flatten_tensor_aligned(Bbs, check=False)
-            BM = _flatten_tensor_aligned(Bms, check=False)
-            templates[d] = BP + BM + BB
-            templates[d].is_mixed_derivative = True
-            templates[d].deltas = np.array([np.nan])
+        with inst.span('mixed_derivatives'):
+            for d in mixed_derivs.keys():
+                d0_size = len(self.grid.mesh[d[0]])
+                d1_size = len(self.grid.mesh[d[1]])
+
+                # TODO: We'll need to do complicated transposing for this in the
+                # general case
+                Bs = BO.for_vector(self.grid.mesh[d[0]], "center", 1, 2, None, None, 0)
+                Bm1 = BO.for_vector(self.grid.mesh[d[1]], "center", 1, 2, None, None, 1)
+                Bb1 = Bm1.copy()
+                Bp1 = Bm1.copy()
+
+                # TODO: Hardcoding in for centered differencing
+                Bps = [Bp1 * 0, Bp1 * 0] + _replicate(d0_size-2, Bp1)
+                Bbs = [Bb1 * 0] + _replicate(d0_size-2, Bb1) +  [Bb1 * 0]
+                Bms = _replicate(d0_size-2, Bm1) + [Bm1 * 0, Bm1 * 0]
+
+                offsets = Bs.D.offsets
+                data = [Bps, Bbs, Bms]
+                for row, o in enumerate(offsets):
+                    if o >= 0:
+                        for i in range(Bs.shape[0]-o):
+                            # a = (np.array(self.grid.mesh[d[0]][i]).repeat(d1_size),)
+                            # vec = self._evalvectorfunc(coeffs[d], a, 1)
+                            # data[row][i+o].vectorized_scale(vec)
+                            data[row][i+o] *= Bs.D.data[row, i+o]
+                    else:
+                        for i in range(abs(o), Bs.shape[0]):
+                            # a = (np.array(self.grid.mesh[d[0]][i]).repeat(d1_size),)
+                            # vec = self._evalvectorfunc(coeffs[d], a, 1)
+                            # data[row][i-abs(o)].vectorized_scale(vec)
+                            data[row][i-abs(o)] *= Bs.D.data[row, i-abs(o)]
+
+                # We flatten here because it's faster
+                # Check is set to False because we're only faking that the offsets
+                # are correct. The resulting operator will take the offsets from
+                # only the first in the list.
+                Bps[0].D.offsets += d1_size
+                Bms[0].D.offsets -= d1_size
+                BP = _flatten_tensor_aligned(Bps, check=False)
+                BB = _flatten_tensor_aligned(Bbs, check=False)
+                BM = _flatten_tensor_aligned(Bms, check=False)
+                templates[d] = BP + BM + BB
+                templates[d].is_mixed_derivative = True
+                templates[d].deltas = np.array([np.nan])
         self.simple_operators = templates
         self.scale_and_combine_operators()
         return mixed_derivs
@@ -568,28 +596,31 @@ cdef class FiniteDifferenceEngineADI(FiniteDifferenceEngine):
         coeffs = self.coefficients
         self.operators = {}
 
-        for d, op in sorted(self.simple_operators.items()):
-            op = op.copy()
-            dim = op.axis
-            if d in coeffs:
-                op.vectorized_scale(self.coefficient_vector(coeffs[d], self.t, dim))
-
-            if len(set(d)) > 1:
-                self.operators[d] = op
-            else:
-                # Combine scaled derivatives for this dimension
-                if dim not in self.operators:
-                    self.operators[dim] = op
-                    # 0th derivative (r * V) is split evenly among each dimension
-                    #TODO: This function is ONLY dependent on time. NOT MESH
-                    if () in coeffs:
-                        self.operators[dim] += coeffs[()](self.t) / float(self.grid.ndim)
+        inst = self._instrument()
+        with inst.span('scale_and_combine'):
+            for d, op in sorted(self.simple_operators.items()):
+                op = op.copy()
+                inst.count('operator_copies')
+                dim = op.axis
+                if d in coeffs:
+                    op.vectorized_scale(self.coefficient_vector(coeffs[d], self.t, dim))
+
+                if len(set(d)) > 1:
+                    self.operators[d] = op
                 else:
-                    if tuple(self.operators[dim].D.offsets) == tuple(op.D.offsets):
-                        self.operators[dim] += op
+                    # Combine scaled derivatives for this dimension
+                    if dim not in self.operators:
+                        self.operators[dim] = op
+                        # 0th derivative (r * V) is split evenly among each dimension
+                        #TODO: This function is ONLY dependent on time. NOT MESH
+                        if () in coeffs:
+                            self.operators[dim] += coeffs[()](self.t) / float(self.grid.ndim)
                     else:
-                        # print col, dim, combined_ops[dim].axis, self.simple_operators[dim].axis
-                        self.operators[dim] = self.operators[dim] + op
+                        if tuple(self.operators[dim].D.offsets) == tuple(op.D.offsets):
+                            self.operators[dim] += op
+                        else:
+                            # print col, dim, combined_ops[dim].axis, self.simple_operators[dim].axis
+                            self.operators[dim] = self.operators[dim] + op
 
 
     def cross_term(self, V, numpy=True):
@@ -628,33 +659,38 @@ cdef class FiniteDifferenceEngineADI(FiniteDifferenceEngine):
             V = self.grid.domain[-1].copy()
             self.grid.domain.append(V)
 
-        Lis = [(o * -dt).add(1, inplace=True)
-               for d, o in sorted(self.operators.iteritems())
-               if type(d) != tuple]
-
-        Lis = np.roll(Lis, -1)
-
-        crossop = None
-        if (0,1) in self.operators:
-            crossop = self.operators[(0,1)].copy() * dt
-
-        print_step = max(1, int(n / 10))
-        to_percent = 100.0 / n
-        utils.tic("solve_implicit:\t")
-        for k in range(n):
-            if not k % print_step:
-                if np.isnan(V).any():
-                    print "Impl fail @ t = %f (%i steps)" % (dt * k, k)
-                    return V
-                print int(k * to_percent),
-                sys.stdout.flush()
-            if callback is not None:
-                callback(V, ((n - k) * dt))
-            if crossop:
-                V += crossop.apply(V)
-            for L in Lis:
-                V = L.solve(V)
-        utils.toc(':  \t')
+        inst = self._instrument()
+        with inst.span('implicit'):
+            with inst.span('setup'):
+                Lis = [(o * -dt).add(1, inplace=True)
+                       for d, o in sorted(self.operators.iteritems())
+                       if type(d) != tuple]
+
+                Lis = np.roll(Lis, -1)
+
+                crossop = None
+                if (0,1) in self.operators:
+                    crossop = self.operators[(0,1)].copy() * dt
+                inst.count('operator_copies', len(Lis) + 2 * (crossop is not None))
+            Lis = inst.timed(Lis)
+
+            obs = self.observers or ()
+            observers.start(obs, self, "solve_implicit", n, dt, V)
+            for k in range(n):
+                inst.step("solve_implicit", k, n)
+                if obs and observers.step(obs, self, k, V):
+                    break
+                if callback is not None:
+                    callback(V, ((n - k) * dt))
+                if crossop:
+                    with inst.span('cross'):
+                        V += crossop.apply(V)
+                    inst.count('temporaries')
+                for L in Lis:
+                    V = L.solve(V)
+            else:
+                k = n
+        observers.finish(obs, self, k, V)
         self.grid.domain.append(V.copy())
         return V
 
@@ -671,27 +707,30 @@ cdef class FiniteDifferenceEngineADI(FiniteDifferenceEngine):
             V = self.grid.domain[-1].copy()
             self.grid.domain.append(V)
 
-        Ls = [(o * dt)
-               for d, o in sorted(self.operators.iteritems())
-               if type(d) != tuple]
-
-
-        print_step = max(1, int(n / 10))
-        to_percent = 100.0 / n
-        utils.tic("solve_explicit:\t")
-        for k in range(n):
-            if not k % print_step:
-                if np.isnan(V).any():
-                    print "Expl fail @ t = %f (%i steps)" % (dt * k, k)
-                    return V
-                print int(k * to_percent),
-                sys.stdout.flush()
-            if callback is not None:
-                callback(V, ((n - k) * dt))
-            V += self.cross_term(V, numpy=numpy) * dt
-            for L in Ls:
-                V += L.apply(V)
-        utils.toc(':  \t')
+        inst = self._instrument()
+        with inst.span('explicit'):
+            with inst.span('setup'):
+                Ls = [(o * dt)
+                       for d, o in sorted(self.operators.iteritems())
+                       if type(d) != tuple]
+                inst.count('operator_copies', len(Ls))
+            Ls = inst.timed(Ls)
+
+            obs = self.observers or ()
+            observers.start(obs, self, "solve_explicit", n, dt, V)
+            for k in range(n):
+                inst.step("solve_explicit", k, n)
+                if obs and observers.step(obs, self, k, V):
+                    break
+                if callback is not None:
+                    callback(V, ((n - k) * dt))
+                with inst.span('cross'):
+                    V += self.cross_term(V, numpy=numpy) * dt
+                for L in Ls:
+                    V += L.apply(V)
+            else:
+                k = n
+        observers.finish(obs, self, k, V)
         self.grid.domain.append(V.copy())
         return V
 
@@ -710,67 +749,69 @@ cdef class FiniteDifferenceEngineADI(FiniteDifferenceEngine):
             V = self.grid.domain[-1].copy()
             self.grid.domain.append(V)
 
-        Firsts = [(o * dt) for o in self.operators.values()]
-
-        Les = [(o * theta * dt)
-               for d, o in sorted(self.operators.iteritems())
-               if type(d) != tuple]
-        Lis = [(o * (theta * -dt)).add(1, inplace=True)
-               for d, o in sorted(self.operators.iteritems())
-               if type(d) != tuple]
-
-        for L in itertools.chain(Les, Lis):
-            L.R = None
-
-        tags = dict()
-        for L in itertools.chain(Les, Lis, Firsts):
-            if L.is_foldable():
-                L.diagonalize()
-                tags[id(L)] = 1
-
-        print_step = max(1, int(n / 10))
-        to_percent = 100.0 / n
-        utils.tic("Hundsdorfer-Verwer:\t")
-        for k in range(n):
-            if not k % print_step:
-                if np.isnan(V).any():
-                    print "Hundsdorfer-Verwer fail @ t = %f (%i steps)" % (dt * k, k)
-                    return V
-                print int(k * to_percent),
-                sys.stdout.flush()
-            if callback is not None:
-                callback(V, ((n - k) * dt))
+        inst = self._instrument()
+        with inst.span('hundsdorferverwer'):
+            with inst.span('setup'):
+                Firsts = [(o * dt) for o in self.operators.values()]
+
+                Les = [(o * theta * dt)
+                       for d, o in sorted(self.operators.iteritems())
+                       if type(d) != tuple]
+                Lis = [(o * (theta * -dt)).add(1, inplace=True)
+                       for d, o in sorted(self.operators.iteritems())
+                       if type(d) != tuple]
+                inst.count('operator_copies', len(Firsts) + 2 * len(Les))
+
+                for L in itertools.chain(Les, Lis):
+                    L.R = None
+
+            with inst.span('fold'):
+                for L in itertools.chain(Les, Lis, Firsts):
+                    if L.is_foldable():
+                        L.diagonalize()
+            Firsts, Les, Lis = map(inst.timed, (Firsts, Les, Lis))
+
+            obs = self.observers or ()
+            observers.start(obs, self, "Hundsdorfer-Verwer", n, dt, V)
+            for k in range(n):
+                inst.step("Hundsdorfer-Verwer", k, n)
+                if obs and observers.step(obs, self, k, V):
+                    break
+                if callback is not None:
+                    callback(V, ((n - k) * dt))
 
-            Y = V.copy()
+                Y = V.copy()
 
-            for L in Firsts:
-                V += L.apply(Y)
+                for L in Firsts:
+                    V += L.apply(Y)
 
-            Z = V.copy()
+                Z = V.copy()
+                inst.count('temporaries', 2)
 
-            for Le, Li in zip(Les, Lis):
-                Z -= Le.apply(Y)
-                Z = Li.solve(Z)
+                for Le, Li in zip(Les, Lis):
+                    Z -= Le.apply(Y)
+                    Z = Li.solve(Z)
 
-            Y -= Z
+                Y -= Z
 
-            for L in Firsts:
-                no_residual = L.R
-                L.R = None
-                V -= 0.5 * L.apply(Y)
-                L.R = no_residual
+                for L in Firsts:
+                    no_residual = L.R
+                    L.R = None
+                    V -= 0.5 * L.apply(Y)
+                    L.R = no_residual
 
-            for Le, Li in zip(Les, Lis):
-                V -= Le.apply(Z)
-                V = Li.solve(V)
+                for Le, Li in zip(Les, Lis):
+                    V -= Le.apply(Z)
+                    V = Li.solve(V)
+            else:
+                k = n
 
-        for i in tags:
-            for L in itertools.chain(Les, Lis, Firsts):
-                if id(L) == i:
-                    L.undiagonalize()
-                    break
+            with inst.span('unfold'):
+                for L in itertools.chain(Les, Lis, Firsts):
+                    if L.is_folded():
+                        L.undiagonalize()
 
-        utils.toc(':  \t')
+        observers.finish(obs, self, k, V)
         self.grid.domain.append(V.copy())
         return V
 
@@ -789,52 +830,56 @@ cdef class FiniteDifferenceEngineADI(FiniteDifferenceEngine):
             V = self.grid.domain[-1].copy()
             self.grid.domain.append(V)
 
-        Firsts = [(o * dt) for o in self.operators.values()]
-
-        Les = [(o * theta * dt)
-               for d, o in sorted(self.operators.iteritems())
-               if type(d) != tuple]
-        Lis = [(o * (theta * -dt)).add(1, inplace=True)
-               for d, o in sorted(self.operators.iteritems())
-               if type(d) != tuple]
-
-        for L in itertools.chain(Les, Lis):
-            L.R = None
-
-
-        print_step = max(1, int(n / 10))
-        to_percent = 100.0 / n
-        utils.tic("Craig-Sneyd 2:\t")
-        for k in range(n):
-            if not k % print_step:
-                if np.isnan(V).any():
-                    print "Craig-Sneyd 2 fail @ t = %f (%i steps)" % (dt * k, k)
-                    return V
-                print int(k * to_percent),
-                sys.stdout.flush()
-            if callback is not None:
-                callback(V, ((n - k) * dt))
-
-            Y = V.copy()
-            for L in Firsts:
-                Y += L.apply(V)
-            Y0 = Y.copy()
-
-            for Le, Li in zip(Les, Lis):
-                Y -= Le.apply(V)
-                Y = Li.solve(Y)
-            Y2 = Y.copy()
-
-            Y = Y0 + theta * dt * self.cross_term(Y2 - V, numpy=False)
-            for L in Firsts:
-                Y += (0.5 - theta) * L.apply(Y2-V)
-
-            for Le, Li in zip(Les, Lis):
-                Y -= Le.apply(V)
-                Y = Li.solve(Y)
-            V = Y
-
-        utils.toc(':  \t')
+        inst = self._instrument()
+        with inst.span('craigsneyd2'):
+            with inst.span('setup'):
+                Firsts = [(o * dt) for o in self.operators.values()]
+
+                Les = [(o * theta * dt)
+                       for d, o in sorted(self.operators.iteritems())
+                       if type(d) != tuple]
+                Lis = [(o * (theta * -dt)).add(1, inplace=True)
+                       for d, o in sorted(self.operators.iteritems())
+                       if type(d) != tuple]
+                inst.count('operator_copies', len(Firsts) + 2 * len(Les))
+
+                for L in itertools.chain(Les, Lis):
+                    L.R = None
+            Firsts, Les, Lis = map(inst.timed, (Firsts, Les, Lis))
+
+
+            obs = self.observers or ()
+            observers.start(obs, self, "Craig-Sneyd 2", n, dt, V)
+            for k in range(n):
+                inst.step("Craig-Sneyd 2", k, n)
+                if obs and observers.step(obs, self, k, V):
+                    break
+                if callback is not None:
+                    callback(V, ((n - k) * dt))
+
+                Y = V.copy()
+                for L in Firsts:
+                    Y += L.apply(V)
+                Y0 = Y.copy()
+
+                for Le, Li in zip(Les, Lis):
+                    Y -= Le.apply(V)
+                    Y = Li.solve(Y)
+                Y2 = Y.copy()
+                inst.count('temporaries', 3)
+
+                with inst.span('cross'):
+                    Y = Y0 + theta * dt * self.cross_term(Y2 - V, numpy=False)
+                for L in Firsts:
+                    Y += (0.5 - theta) * L.apply(Y2-V)
+
+                for Le, Li in zip(Les, Lis):
+                    Y -= Le.apply(V)
+                    Y = Li.solve(Y)
+                V = Y
+            else:
+                k = n
+        observers.finish(obs, self, k, V)
         self.grid.domain.append(V.copy())
         return V
 
@@ -853,47 +898,51 @@ cdef class FiniteDifferenceEngineADI(FiniteDifferenceEngine):
             V = self.grid.domain[-1].copy()
             self.grid.domain.append(V)
 
-        Firsts = [(o * dt) for o in self.operators.values()]
-
-        Les = [(o * theta * dt)
-               for d, o in sorted(self.operators.iteritems())
-               if type(d) != tuple]
-        Lis = [(o * (theta * -dt)).add(1, inplace=True)
-               for d, o in sorted(self.operators.iteritems())
-               if type(d) != tuple]
-
-        for L in itertools.chain(Les, Lis):
-            L.R = None
-
-        print_step = max(1, int(n / 10))
-        to_percent = 100.0 / n
-        utils.tic("Craig-Sneyd:\t")
-        for k in range(n):
-            if not k % print_step:
-                if np.isnan(V).any():
-                    print "Craig-Sneyd fail @ t = %f (%i steps)" % (dt * k, k)
-                    return V
-                print int(k * to_percent),
-                sys.stdout.flush()
-            if callback is not None:
-                callback(V, ((n - k) * dt))
-
-            Y = V.copy()
-            for L in Firsts:
-                Y += L.apply(V)
-            Y0 = Y.copy()
-
-            for Le, Li in zip(Les, Lis):
-                Y -= Le.apply(V)
-                Y = Li.solve(Y)
-
-            Y = Y0 + (0.5*dt) * self.cross_term(Y - V, numpy=False)
-            for Le, Li in zip(Les, Lis):
-                Y -= Le.apply(V)
-                Y = Li.solve(Y)
-            V = Y
-
-        utils.toc(':  \t')
+        inst = self._instrument()
+        with inst.span('craigsneyd'):
+            with inst.span('setup'):
+                Firsts = [(o * dt) for o in self.operators.values()]
+
+                Les = [(o * theta * dt)
+                       for d, o in sorted(self.operators.iteritems())
+                       if type(d) != tuple]
+                Lis = [(o * (theta * -dt)).add(1, inplace=True)
+                       for d, o in sorted(self.operators.iteritems())
+                       if type(d) != tuple]
+                inst.count('operator_copies', len(Firsts) + 2 * len(Les))
+
+                for L in itertools.chain(Les, Lis):
+                    L.R = None
+            Firsts, Les, Lis = map(inst.timed, (Firsts, Les, Lis))
+
+            obs = self.observers or ()
+            observers.start(obs, self, "Craig-Sneyd", n, dt, V)
+            for k in range(n):
+                inst.step("Craig-Sneyd", k, n)
+                if obs and observers.step(obs, self, k, V):
+                    break
+                if callback is not None:
+                    callback(V, ((n - k) * dt))
+
+                Y = V.copy()
+                for L in Firsts:
+                    Y += L.apply(V)
+                Y0 = Y.copy()
+                inst.count('temporaries', 2)
+
+                for Le, Li in zip(Les, Lis):
+                    Y -= Le.apply(V)
+                    Y = Li.solve(Y)
+
+                with inst.span('cross'):
+                    Y = Y0 + (0.5*dt) * self.cross_term(Y - V, numpy=False)
+                for Le, Li in zip(Les, Lis):
+                    Y -= Le.apply(V)
+                    Y = Li.solve(Y)
+                V = Y
+            else:
+                k = n
+        observers.finish(obs, self, k, V)
         self.grid.domain.append(V.copy())
         return V
 
@@ -955,53 +1004,55 @@ cdef class FiniteDifferenceEngineADI(FiniteDifferenceEngine):
             V = self.grid.domain[-1].copy()
             self.grid.domain.append(V)
 
-        Firsts = [(o * dt) for d, o in self.operators.items()]
-
-        Les = [(o * theta * dt)
-               for d, o in sorted(self.operators.iteritems())
-               if type(d) != tuple]
-        Lis = [(o * (theta * -dt)).add(1, inplace=True)
-               for d, o in sorted(self.operators.iteritems())
-               if type(d) != tuple]
-
-        for L in itertools.chain(Les, Lis):
-            L.R = None
-
-        tags = dict()
-        for L in itertools.chain(Les, Lis, Firsts):
-            if L.is_foldable():
-                L.diagonalize()
-                tags[id(L)] = 1
-
-        print_step = max(1, int(n / 10))
-        to_percent = 100.0 / n
-        utils.tic("Douglas:\t")
-        for k in range(n):
-            if not k % print_step:
-                if np.isnan(V).any():
-                    print "Douglas fail @ t = %f (%i steps)" % (dt * k, k)
-                    return V
-                print int(k * to_percent),
-                sys.stdout.flush()
-            if callback is not None:
-                callback(V, ((n - k) * dt))
-
-            Y = V.copy()
-            for L in Firsts:
-                Y += L.apply(V)
-
-            for Le, Li in zip(Les, Lis):
-                Y -= Le.apply(V)
-                Y = Li.solve(Y)
-            V = Y
-
-        for i in tags:
-            for L in itertools.chain(Les, Lis, Firsts):
-                if id(L) == i:
-                    L.undiagonalize()
+        inst = self._instrument()
+        with inst.span('douglas'):
+            with inst.span('setup'):
+                Firsts = [(o * dt) for d, o in self.operators.items()]
+
+                Les = [(o * theta * dt)
+                       for d, o in sorted(self.operators.iteritems())
+                       if type(d) != tuple]
+                Lis = [(o * (theta * -dt)).add(1, inplace=True)
+                       for d, o in sorted(self.operators.iteritems())
+                       if type(d) != tuple]
+                inst.count('operator_copies', len(Firsts) + 2 * len(Les))
+
+                for L in itertools.chain(Les, Lis):
+                    L.R = None
+
+            with inst.span('fold'):
+                for L in itertools.chain(Les, Lis, Firsts):
+                    if L.is_foldable():
+                        L.diagonalize()
+            Firsts, Les, Lis = map(inst.timed, (Firsts, Les, Lis))
+
+            obs = self.observers or ()
+            observers.start(obs, self, "Douglas", n, dt, V)
+            for k in range(n):
+                inst.step("Douglas", k, n)
+                if obs and observers.step(obs, self, k, V):
                     break
+                if callback is not None:
+                    callback(V, ((n - k) * dt))
+
+                Y = V.copy()
+                inst.count('temporaries')
+                for L in Firsts:
+                    Y += L.apply(V)
+
+                for Le, Li in zip(Les, Lis):
+                    Y -= Le.apply(V)
+                    Y = Li.solve(Y)
+                V = Y
+            else:
+                k = n
+
+            with inst.span('unfold'):
+                for L in itertools.chain(Les, Lis, Firsts):
+                    if L.is_folded():
+                        L.undiagonalize()
 
-        utils.toc(':  \t')
+        observers.finish(obs, self, k, V)
         self.grid.domain.append(V.copy())
         return V
 
@@ -1011,9 +1062,10 @@ cdef class FiniteDifferenceEngineADI(FiniteDifferenceEngine):
             scheme=None):
         if scheme is None:
             scheme = self.solve_hundsdorferverwer
-        V = self.solve_implicit(smoothing_steps*2, dt*0.5, initial=initial)
-        # V = self.solve_douglas(smoothing_steps*2, dt*0.5, theta=1, initial=initial)
-        return scheme(n-smoothing_steps, dt, initial=V, theta=0.60)
+        with self._instrument().span('smooth'):
+            V = self.solve_implicit(smoothing_steps*2, dt*0.5, initial=initial)
+            # V = self.solve_douglas(smoothing_steps*2, dt*0.5, theta=1, initial=initial)
+            return scheme(n-smoothing_steps, dt, initial=V, theta=0.60)
 
 
 def _replicate(n, x):
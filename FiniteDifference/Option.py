@@ -95,13 +95,143 @@ class Option(object):
         return "\n".join(self.features())
 
 
+    def __getstate__(self):
+        # The callback is a closure, rebuild it on the other side.
+        d = dict(self.__dict__)
+        d.pop('monte_carlo_callback', None)
+        return d
+
+
+    def __setstate__(self, d):
+        self.__dict__.update(d)
+        self.monte_carlo_callback = self._default_callback()
+
+
+    def _default_callback(self):
+        return lambda *x: None
+
+
     def monte_carlo(self, dt=0.001, npaths=10000, with_payoff=False,
-                    callback=None):
-        if not callback:
-            callback = self.monte_carlo_callback
+                    callback=None, seed=None, processes=1, batch_size=None,
+                    edges=None, target_error=None, max_paths=None,
+                    randomizations=None, multilevel=False, **options):
+        """
+        Price by simulating @npaths@ paths with monte_carlo_paths().
+
+        With the defaults this uses the global numpy random state in this
+        process. Given a @seed@ or @processes@ > 1 the paths are split over a
+        pool with independent streams derived from the seed (see
+        montecarlo.paths) and the result is reproducible for that seed and
+        number of processes.
+
+        With a @batch_size@ the paths are simulated that many at a time and
+        only running statistics are kept (see montecarlo.stats), so memory
+        does not depend on @npaths@. The payoff can not be returned then, but
+        a histogram over the bin @edges@ can.
+
+        With a @target_error@ @npaths@ is ignored. Batches are added until
+        1.96 * error is at most @target_error@ or @max_paths@ (default
+        montecarlo.MAX_PATHS) paths have been simulated (see
+        montecarlo.until). "n" in the result is the number of paths used.
+
+        With @randomizations@ the paths are quasi random instead: that many
+        independent scramblings of the first @npaths@ Sobol points (see
+        montecarlo.qmc). "expected" is the average of the randomizations and
+        "error" the standard error between them.
+
+        With @multilevel@ and a @target_error@ the price is a multilevel
+        estimate over time steps @dt@, @dt@/2, ... with as many levels and
+        paths per level as needed (see montecarlo.mlmc) and the target
+        includes the discretisation bias. @dt@ is then the coarsest step.
+        For barrier options pass bridge=True (continuous monitoring, see
+        HestonOption.monte_carlo_samples) or the levels decay slowly.
+
+        Other keyword @options@ (e.g. variance reduction) are passed to
+        monte_carlo_samples() and imply the running statistics mode.
+        """
         start = time.time()
-        s = self.monte_carlo_paths(dt, npaths, callback)
+        if multilevel:
+            if not target_error or with_payoff:
+                raise ValueError("Multilevel Monte Carlo needs a target_error"
+                                 " and keeps no payoffs.")
+            import montecarlo
+            ret = montecarlo.mlmc(self, dt, target_error, callback=callback,
+                                  seed=seed, processes=processes,
+                                  batch_size=batch_size or 2**14,
+                                  options=options)
+            ret['duration'] = time.time() - start
+            ret['dt'] = ret['levels'][-1]['dt']
+            ret['n'] = ret['levels'][0]['n']
+            return ret
+        if randomizations:
+            if target_error or with_payoff:
+                raise ValueError("Quasi Monte Carlo runs a fixed number of"
+                                 " paths and keeps no payoffs.")
+            import montecarlo
+            runs = montecarlo.qmc(self, dt, npaths, randomizations,
+                                  callback=callback, seed=seed,
+                                  processes=processes,
+                                  batch_size=batch_size or npaths,
+                                  options=options)
+            return self._monte_carlo_qmc_result(runs, dt,
+                                                time.time() - start, **options)
+        if batch_size or target_error or options:
+            if with_payoff:
+                raise ValueError("with_payoff needs all paths in memory,"
+                                 " use edges= for a histogram instead.")
+            import montecarlo
+            if target_error:
+                error = lambda st: self._monte_carlo_stats_result(
+                    st, dt, 0, **options)['error']
+                stats = montecarlo.until(self, dt, target_error,
+                        max_paths=max_paths or montecarlo.MAX_PATHS,
+                        callback=callback, seed=seed, processes=processes,
+                        batch_size=batch_size or 2**14, edges=edges,
+                        options=options, error=error)
+            else:
+                stats = montecarlo.stats(self, dt, npaths, callback=callback,
+                        seed=seed, processes=processes,
+                        batch_size=batch_size or npaths, edges=edges,
+                        options=options)
+            duration = time.time() - start
+            return self._monte_carlo_stats_result(stats, dt, duration,
+                                                  **options)
+        if seed is None and processes == 1:
+            if not callback:
+                callback = self.monte_carlo_callback
+            s = self.monte_carlo_paths(dt, npaths, callback)
+        else:
+            import montecarlo
+            s = montecarlo.paths(self, dt, npaths, callback=callback,
+                                 seed=seed, processes=processes)
         duration = time.time() - start
+        return self._monte_carlo_result(s, dt, duration, with_payoff)
+
+
+    def discounted_payoff(self, s):
+        """Discounted payoff for the terminal values from monte_carlo_paths()."""
+        payoff = np.maximum(s - self.strike, 0)
+        return np.exp(-self.interest_rate.value * self.tenor) * payoff
+
+
+    def monte_carlo_state(self, npaths):
+        """Initial state for monte_carlo_callback: whether each path counts."""
+        return np.ones(npaths, dtype=bool)
+
+
+    def monte_carlo_samples(self, dt, npaths, callback, random_state=None):
+        """
+        Samples whose mean is the price, one row per path (or group of paths).
+        This is what the running statistics modes of monte_carlo() accumulate.
+        """
+        return self.discounted_payoff(
+            self.monte_carlo_paths(dt, npaths, callback,
+                                   random_state=random_state))
+
+
+    def _monte_carlo_result(self, s, dt, duration, with_payoff=False):
+        """The result dict of monte_carlo() for terminal values @s@."""
+        npaths = len(s)
         payoff = np.maximum(s - self.strike, 0)
         p = np.exp(-self.interest_rate.value * self.tenor) * payoff
         stdp = np.std(p)
@@ -117,6 +247,47 @@ class Option(object):
         return ret
 
 
+    def _monte_carlo_stats_result(self, stats, dt, duration):
+        """The result dict of monte_carlo() for a montecarlo.RunningStats."""
+        ret = { "expected": stats.mean
+               , "error": stats.error
+               , "duration": duration
+               , "n": stats.n
+               , "std": stats.std
+               , "dt": dt
+               }
+        if stats.edges is not None:
+            ret['histogram'] = (stats.counts, stats.edges)
+        return ret
+
+
+    def _monte_carlo_qmc_result(self, runs, dt, duration, **options):
+        """
+        The result dict of monte_carlo() for one RunningStats per
+        randomization: every estimate is the average over randomizations
+        and its error their standard error.
+        """
+        import montecarlo
+        merged = montecarlo.RunningStats()
+        for s in runs:
+            merged.merge(s)
+        ret = self._monte_carlo_stats_result(merged, dt, duration, **options)
+        each = [self._monte_carlo_stats_result(s, dt, 0, **options)
+                for s in runs]
+        def average(values):
+            values = np.asarray(values)
+            return values.mean(), values.std(ddof=1) / np.sqrt(len(values))
+        ret['expected'], ret['error'] = average([r['expected'] for r in each])
+        if 'estimates' in ret:
+            for name in ret['estimates']:
+                ret['estimates'][name] = average(
+                    [r['estimates'][name][0] for r in each])
+        for name in [k[:-len('_error')] for k in ret if k.endswith('_error')]:
+            ret[name], ret[name + '_error'] = average([r[name] for r in each])
+        ret['randomizations'] = len(runs)
+        return ret
+
+
     def __eq__(self, other):
         for attr in self.attrs:
             if not getattr(self, attr) == getattr(other, attr):
@@ -125,7 +296,8 @@ class Option(object):
         return True
 
 
-    def monte_carlo_paths(self, dt=None, npaths=None, callback=lambda *x: None):
+    def monte_carlo_paths(self, dt=None, npaths=None, callback=lambda *x: None,
+                          random_state=None):
         raise NotImplementedError
 
 
@@ -238,41 +410,31 @@ class BarrierOption(Option):
         return s
 
 
+    def _default_callback(self):
+        return self._callback_from_boundary((self.bottom, self.top))
+
+
+    def barriers(self):
+        """(knockin, level) of the bottom and top barriers that are set."""
+        return [b for b in (self.bottom, self.top) if b]
+
+
+    def monte_carlo_state(self, npaths):
+        """Knock-in options only count once a barrier has been hit."""
+        knockin = any(b[0] for b in self.barriers())
+        return np.ones(npaths, dtype=bool) ^ knockin
+
+
     def _callback_from_boundary(self, b):
-        def knockin_top(bound):
-            def f(s, state):
-                state |= s >= bound
-            return f
-        def knockout_top(bound):
-            def f(s, state):
-                state &= s < bound
-            return f
-        def knockin_bot(bound):
-            def f(s, state):
-                state |= s <= bound
-            return f
-        def knockout_bot(bound):
-            def f(s, state):
-                state &= s > bound
-            return f
-        def apply_both(f1, f2):
-            def f(*args, **kwargs):
-                f2(*args, **kwargs)
-                f1(*args, **kwargs)
-            return f
-        f = lambda *x: None
+        """
+        The monte_carlo_callback for the (bottom, top) barriers @b@: a
+        montecarlo.BarrierMonitor, or a no-op without barriers.
+        """
+        import montecarlo
         bot, top = b
-        if bot:
-            if bot[0]: # knockin
-                f = apply_both(f, knockin_bot(bot[1]))
-            else: #knockout
-                f = apply_both(f, knockout_bot(bot[1]))
-        if top:
-            if top[0]: # knockin
-                f = apply_both(f, knockin_top(top[1]))
-            else: #knockout
-                f = apply_both(f, knockout_top(top[1]))
-        return f
+        if not (bot or top):
+            return lambda *x: None
+        return montecarlo.BarrierMonitor(bottom=bot, top=top)
 
 
 
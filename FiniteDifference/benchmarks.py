@@ -0,0 +1,356 @@
+#!/usr/bin/env python
+# coding: utf8
+"""CPU benchmarks of the ADI engine with regression baselines.
+
+A case is a scheme on an nspots x nvols Heston grid with some number of time
+steps. Each case runs in a fresh worker process, so its peak memory is its
+own. The results are plain dicts, saved as JSON (with the machine they ran
+on) or CSV, and compare() checks them against a stored baseline.
+
+    results = benchmarks.suite(benchmarks.cases())
+    benchmarks.save_json(results, 'bench.json')
+    for line in benchmarks.report(benchmarks.compare(results, baseline)):
+        print line
+
+accuracy_suite() is the other mode: it prices a vanilla and an up-and-out
+call with every combination of scheme, theta, grid, steps and smoothing
+steps, and pareto() picks the configurations that no other one beats on
+both runtime and error.
+"""
+
+from __future__ import division
+
+import os
+import sys
+import csv
+import json
+import time
+import warnings
+import platform
+import itertools as it
+import multiprocessing
+
+import numpy as np
+
+from heston import (HestonOption, HestonBarrierOption,
+                    HestonFiniteDifferenceEngine, SOLVERS, solve)
+
+SCHEMES = {
+    'i': lambda F, n, dt, V: F.solve_implicit(n, dt, V),
+    'd': lambda F, n, dt, V: F.solve_douglas(n, dt, V, theta=0.65),
+    'hv': lambda F, n, dt, V: F.solve_hundsdorferverwer(n, dt, V, theta=0.65),
+    'cs': lambda F, n, dt, V: F.solve_craigsneyd(n, dt, V, theta=0.5),
+    'cs2': lambda F, n, dt, V: F.solve_craigsneyd2(n, dt, V, theta=0.5),
+    'smooth': lambda F, n, dt, V: F.solve_smooth(n, dt, V, smoothing_steps=1),
+}
+
+# What identifies a case in a baseline
+KEY = ('scheme', 'nspots', 'nvols', 'steps')
+
+# The columns of the CSV output
+COLUMNS = KEY + ('build_time', 'solve_time', 'time_per_step',
+                 'gridpoint_steps_per_second', 'peak_rss_mb', 'memory_mb',
+                 'price')
+
+
+def default_option():
+    """The option every case prices."""
+    return HestonOption(spot=100, strike=100, interest_rate=0.03,
+                        volatility=0.2, tenor=1.0, mean_reversion=1,
+                        mean_variance=0.12, vol_of_variance=0.3,
+                        correlation=0.4)
+
+
+def cases(schemes=sorted(SCHEMES), sizes=(50, 100, 200), steps=(50, 200)):
+    """Every combination of @schemes@, square grid @sizes@ and @steps@."""
+    return [dict(scheme=s, nspots=n, nvols=n, steps=k)
+            for s, n, k in it.product(schemes, sizes, steps)]
+
+
+def _quiet(f, *args, **kwargs):
+    """f(*args, **kwargs) without its progress output and warnings."""
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            return f(*args, **kwargs)
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+
+def peak_rss_mb():
+    """This process' peak resident set size so far, in MB."""
+    import resource
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on OS X, kilobytes elsewhere
+    return rss / 2**20 if sys.platform == 'darwin' else rss / 2**10
+
+
+def engine(option, nspots, nvols):
+    """The initialized engine every case uses for @option@."""
+    F = HestonFiniteDifferenceEngine(option, nspots=nspots, nvols=nvols,
+                                     spotdensity=10, varexp=4, var_max=12,
+                                     cache=False, verbose=False)
+    F.init()
+    return F
+
+
+def run_case(case, repeat=3, option=None):
+    """
+    Build the engine for @case@ and time the best of @repeat@ solves. The
+    engine's progress output and warnings are discarded.
+    """
+    if option is None:
+        option = default_option()
+    scheme = SCHEMES[case['scheme']]
+    n = case['steps']
+    dt = option.tenor / n
+    before = peak_rss_mb()
+    start = time.time()
+    F = _quiet(engine, option, case['nspots'], case['nvols'])
+    build = time.time() - start
+    solve = np.inf
+    for _ in range(repeat):
+        F.grid.reset()
+        start = time.time()
+        V = _quiet(scheme, F, n, dt, F.grid.domain[0].copy())
+        solve = min(solve, time.time() - start)
+    peak = peak_rss_mb()
+    ret = dict(case)
+    ret.update(build_time=build,
+               solve_time=solve,
+               time_per_step=solve / n,
+               gridpoint_steps_per_second=V.size * n / solve,
+               peak_rss_mb=peak,
+               memory_mb=peak - before,
+               price=float(V[F.idx]))
+    return ret
+
+
+def _run_case(args):
+    return run_case(*args)
+
+
+def suite(cases, repeat=3, option=None, isolate=True):
+    """
+    run_case() for each of @cases@, each in its own worker process if
+    @isolate@ (otherwise the peak memory is that of all cases so far).
+    """
+    args = [(case, repeat, option) for case in cases]
+    if not isolate:
+        return map(_run_case, args)
+    pool = multiprocessing.Pool(1, maxtasksperchild=1)
+    try:
+        return pool.map(_run_case, args, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+
+# The fields of an accuracy case
+ACCURACY_KEY = ('product', 'scheme', 'theta', 'nspots', 'nvols', 'steps',
+                'smoothing')
+
+ACCURACY_COLUMNS = ACCURACY_KEY + ('build_time', 'solve_time', 'time',
+                                   'price', 'reference', 'error')
+
+# The configuration of the up-and-out reference price
+REFERENCE = dict(scheme='hv', theta=0.5 + np.sqrt(3) / 6, nspots=400,
+                 nvols=200, steps=1000, smoothing=2)
+
+
+def products():
+    """{name: option} of the products accuracy cases price."""
+    o = default_option()
+    barrier = HestonBarrierOption(spot=o.spot, strike=o.strike,
+                                  interest_rate=o.interest_rate.value,
+                                  volatility=o.volatility, tenor=o.tenor,
+                                  mean_reversion=o.variance.reversion,
+                                  mean_variance=o.variance.mean,
+                                  vol_of_variance=o.variance.volatility,
+                                  correlation=o.correlation,
+                                  top=(False, 150.0))
+    return {'vanilla': o, 'up-and-out': barrier}
+
+
+def accuracy_cases(products=('vanilla', 'up-and-out'),
+                   schemes=sorted(SOLVERS), thetas=(0.5, 0.65),
+                   sizes=((50, 25), (100, 50), (200, 100)),
+                   steps=(25, 50, 100, 200), smoothing=(0, 1)):
+    """
+    Every combination of @products@, @schemes@, @thetas@, (nspots, nvols)
+    @sizes@, @steps@ and @smoothing@ steps. The implicit scheme has no
+    theta, so it only gets one (None).
+    """
+    ret = []
+    for p, s, (ns, nv), k, m in it.product(products, schemes, sizes, steps,
+                                           smoothing):
+        for theta in ((None,) if s == 'i' else thetas):
+            ret.append(dict(product=p, scheme=s, theta=theta, nspots=ns,
+                            nvols=nv, steps=k, smoothing=m))
+    return ret
+
+
+def reference(option, config=REFERENCE):
+    """
+    The reference price of @option@: the COS price of a vanilla, and a
+    @config@ solve on a fine grid for a barrier, which the COS method does
+    not price. Errors much below that solve's own are not meaningful.
+    """
+    if isinstance(option, HestonBarrierOption):
+        F = _quiet(engine, option, config['nspots'], config['nvols'])
+        return float(_quiet(solve, F, config, F.grid.domain[0].copy())[F.idx])
+    return option.european_price()
+
+
+def run_accuracy_case(case, option, reference):
+    """
+    Time building the engine and solving @case@ for @option@, and compare
+    its price with @reference@. "time" is build and solve together, what a
+    price costs.
+    """
+    start = time.time()
+    F = _quiet(engine, option, case['nspots'], case['nvols'])
+    build = time.time() - start
+    start = time.time()
+    V = _quiet(solve, F, case, F.grid.domain[0].copy())
+    elapsed = time.time() - start
+    price = float(V[F.idx])
+    ret = dict(case)
+    ret.update(build_time=build, solve_time=elapsed, time=build + elapsed,
+               price=price, reference=reference,
+               error=abs(price - reference))
+    return ret
+
+
+def accuracy_suite(cases, references=None):
+    """
+    run_accuracy_case() for each of @cases@, in this process, against
+    @references@ ({product: price}, computed with reference() where
+    missing).
+    """
+    options = products()
+    references = dict(references or {})
+    ret = []
+    for case in cases:
+        p = case['product']
+        if p not in references:
+            references[p] = reference(options[p])
+        ret.append(run_accuracy_case(case, options[p], references[p]))
+    return ret
+
+
+def pareto(results, cost='time', error='error'):
+    """
+    {product: frontier}, where the frontier is the @results@ of that
+    product that no other result beats on both @cost@ and @error@, cheapest
+    first. Errors fall along it, so the first one below a target error is
+    the cheapest configuration that reaches it.
+    """
+    ret = {}
+    for p in sorted(set(r['product'] for r in results)):
+        rs = sorted((r for r in results if r['product'] == p),
+                    key=lambda r: (r[cost], r[error]))
+        front = []
+        for r in rs:
+            if not front or r[error] < front[-1][error]:
+                front.append(r)
+        ret[p] = front
+    return ret
+
+
+def cheapest(frontier, target, error='error'):
+    """The first of the pareto() @frontier@ within @target@ error, or None."""
+    for r in frontier:
+        if r[error] <= target:
+            return r
+    return None
+
+
+def machine():
+    """Where the results come from, saved with them."""
+    return { "host": platform.node()
+           , "platform": platform.platform()
+           , "python": platform.python_version()
+           , "numpy": np.__version__
+           , "cpus": multiprocessing.cpu_count()
+           , "time": time.strftime('%Y-%m-%d %H:%M:%S')
+           }
+
+
+def save_json(results, fn):
+    with open(fn, 'w') as f:
+        json.dump({"machine": machine(), "results": results}, f, indent=1,
+                  sort_keys=True)
+
+
+def load_json(fn):
+    """The results saved by save_json()."""
+    with open(fn) as f:
+        return json.load(f)['results']
+
+
+def save_csv(results, fn, columns=COLUMNS):
+    with open(fn, 'wb') as f:
+        w = csv.DictWriter(f, columns, extrasaction='ignore')
+        w.writeheader()
+        w.writerows(results)
+
+
+def compare(results, baseline, tolerance=0.1, metric='time_per_step',
+            price_tolerance=1e-8, key=KEY):
+    """
+    Each of @results@ with its @baseline@ case (the one with the same @key@
+    fields): a list of dicts with the case, both values of @metric@, their
+    "ratio" and "status". The status is "slower" if the ratio exceeds 1 +
+    @tolerance@, "faster" if it is below 1 - @tolerance@ and "ok" otherwise,
+    "new" without a baseline case. It is "changed" if the price moved by
+    more than @price_tolerance@ (relative), since a faster operator that
+    changes the answer is not an improvement.
+    """
+    fields = key
+    key = lambda r: tuple(r[k] for k in fields)
+    base = dict((key(r), r) for r in baseline)
+    ret = []
+    for r in results:
+        b = base.get(key(r))
+        row = dict((k, r[k]) for k in fields)
+        row['new'] = r[metric]
+        if b is None:
+            row.update(old=None, ratio=None, status='new')
+            ret.append(row)
+            continue
+        ratio = r[metric] / b[metric]
+        row.update(old=b[metric], ratio=ratio)
+        if 'price' in b and (abs(r['price'] - b['price'])
+                             > price_tolerance * abs(b['price'])):
+            row['status'] = 'changed'
+        elif ratio > 1 + tolerance:
+            row['status'] = 'slower'
+        elif ratio < 1 - tolerance:
+            row['status'] = 'faster'
+        else:
+            row['status'] = 'ok'
+        ret.append(row)
+    return ret
+
+
+def regressions(comparison):
+    """The rows of compare() that are slower or changed."""
+    return [r for r in comparison if r['status'] in ('slower', 'changed')]
+
+
+def report(comparison, key=KEY):
+    """Lines of a table of compare()'s rows."""
+    widths = [max([len(k)] + [len(str(r[k])) for r in comparison])
+              for k in key]
+    case = ' '.join('%%%is' % w for w in widths)
+    yield (case + " %12s %12s %7s  %s") % (
+        tuple(key) + ('old', 'new', 'ratio', 'status'))
+    for r in comparison:
+        old = '-' if r['old'] is None else "%.6g" % r['old']
+        ratio = '-' if r['ratio'] is None else "%.3f" % r['ratio']
+        yield (case + " %12s %12.6g %7s  %s") % (
+            tuple(r[k] for k in key) + (old, r['new'], ratio, r['status']))
@@ -9,12 +9,36 @@
 from __future__ import division
 
 import numpy as np
+import numexpr as ne
 
 from Option import Option, BarrierOption
 from Grid import Grid
 import FiniteDifferenceEngine as FDE
 import utils
 import scipy.stats
+from scipy.special import ndtr
+
+
+def bs_call_delta(s, k, r, vol, t):
+    """
+    Black-Scholes call price, delta and vega. The arguments broadcast against
+    each other, so whole grids of spots, strikes, vols and tenors can be
+    priced at once.
+
+    At t == 0 the forward s - k is returned as the price, as before.
+    """
+    s = np.asarray(s, dtype=float)
+    vol = np.maximum(1e-10, vol)
+    sqrt_t = np.sqrt(t)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        d1 = (np.log(s/k) + (r + 0.5*vol**2) * t) / (vol * sqrt_t)
+    d1 = np.where(np.asarray(t) == 0, np.infty, d1)
+    d2 = d1 - vol*sqrt_t
+    delta = ndtr(d1)
+    call = delta*s - ndtr(d2)*k*np.exp(-r * t)
+    vega = s * sqrt_t * np.exp(-0.5*d1**2) / np.sqrt(2*np.pi)
+    return (call, delta, vega)
+
 
 class BlackScholesOption(Option):
 
@@ -39,23 +63,16 @@ class BlackScholesOption(Option):
         return self._call_delta()[1]
 
 
-    def _call_delta(self):
-        N = scipy.stats.distributions.norm.cdf
-        s = self.spot
-        k = self.strike
-        r = self.interest_rate.value
-        t = self.tenor
-        vol = np.maximum(1e-10, np.sqrt(self.variance.value))
+    @property
+    def vega(self):
+        return self._call_delta()[2]
 
-        if self.tenor == 0:
-            d1 = np.infty
-        else:
-            s += np.finfo(np.atleast_1d(s).dtype).tiny
-            d1 = ((np.log(s/float(k)) + (r + 0.5*vol**2) * t)
-                / (vol * np.sqrt(t)))
 
-        d2 = d1 - vol*np.sqrt(t)
-        return (N(d1)*s - N(d2)*k*np.exp(-r * t), N(d1))
+    def _call_delta(self):
+        """(price, delta, vega) of the call."""
+        return bs_call_delta(self.spot, float(self.strike),
+                             self.interest_rate.value,
+                             np.sqrt(self.variance.value), self.tenor)
 
 
 class BlackScholesBarrierOption(BarrierOption, BlackScholesOption):
@@ -80,18 +97,48 @@ class BlackScholesBarrierOption(BarrierOption, BlackScholesOption):
                                volatility=volatility, variance=variance,
                                tenor=tenor)
 
-    def monte_carlo_paths(self, dt, n, callback=lambda *x: None):
-        #TODO: make this work with callback, etc
-        raise NotImplementedError
-        dW = np.randn(t/dt + 1, npaths)
-        dW[0,:] = 0
-        W = np.cumsum(dW, axis=0)
-        del dW
-        rate_process = np.arange(t/dt + 1) * (r - 0.5*sig**2)*dt
-        paths = spot * np.exp(rate_process[:,None] + sig*W*sqrt(dt))
-        del rate_process, W
-        barrier_paths = callback(paths, state)
-        sT = barrier_paths[-1,:]
+    def monte_carlo_paths(self, dt, npaths, callback=lambda *x: None,
+                          random_state=None):
+        """
+        Terminal spots of @npaths@ paths, zero for those that don't count.
+
+        The spot is stepped exactly, about @dt@ at a time, keeping only the
+        current values. Between two steps on the same side of the barrier
+        the path crosses it with the Brownian bridge probability
+            exp(-2 log(h/s_i) log(h/s_i+1) / (sigma**2 dt)),
+        which is sampled, and crossing paths are shown to the @callback@ at
+        the barrier. The barrier is therefore monitored continuously, as in
+        compute_analytical(), whatever the step. With two barriers the
+        @callback@ is called once per barrier, since a path can cross both
+        in one step.
+        """
+        rng = np.random if random_state is None else random_state
+        neval = ne.evaluate
+        r = self.interest_rate.value
+        var = self.variance.value
+        t = self.tenor
+        steps = max(1, int(round(t / dt)))
+        dt = t / steps
+        drift = (r - 0.5*var) * dt
+        vol = np.sqrt(var * dt)
+
+        s = np.empty(npaths)
+        s[:] = self.spot
+        state = self.monte_carlo_state(npaths)
+        levels = [b[1] for b in self.barriers()]
+        for i in range(steps):
+            z = rng.standard_normal(npaths)
+            s_prev = s
+            s = neval("s * exp(drift + vol*z)")
+            crossings = []
+            for h in levels:
+                u = rng.random_sample(npaths)
+                crossed = neval("((s_prev - h)*(s - h) > 0)"
+                                " & (u < exp(-2*log(h/s_prev)*log(h/s)/(var*dt)))")
+                crossings.append(np.where(crossed, h, s))
+            for seen in crossings or [s]:
+                callback(seen, state)
+        return s * state
 
 
     def compute_analytical(self):
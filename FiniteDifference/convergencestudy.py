@@ -0,0 +1,267 @@
+#!/usr/bin/env python
+# coding: utf8
+"""Convergence studies in time and space.
+
+A study prices one point (a request as for service.normalize()) at a
+sequence of levels, each halving the time step (mode 'dt'), doubling the
+spot and variance nodes (mode 'dx') or both, and at a finer reference
+level. Levels sharing a mesh share an engine, built once before the workers
+start and inherited by them, so a level only scales the operators by its
+dt. In space the meshes are nested: each level's is every other node of
+the next finer one's (see engines()). The levels and the reference run
+together on a process pool, biggest first, so the reference is computed
+alongside the coarse levels rather than before them.
+
+    study = convergencestudy.run(dict(strike=100.0, scheme='hv'), mode='dt')
+    print convergencestudy.report(study)
+
+The observed order is fitted to the errors against the reference and,
+Richardson style, to the differences between successive levels, which
+needs no reference at all.
+"""
+
+from __future__ import division
+
+import time
+import multiprocessing
+
+import numpy as np
+
+import service
+from sweep import group_key
+from heston import solve
+from resultstore import ResultStore
+
+MODES = ('dt', 'dx', 'both')
+
+# The engines of the run() a pool worker belongs to, by group_key()
+_worker_engines = None
+
+
+def refinements(point, mode='dt', levels=5, reference=2):
+    """
+    The @levels@ points of a study of @point@, coarsest first, followed by
+    the reference, refined @reference@ times beyond the finest level. In
+    space, the nspots and nvols of a level name its refinement; its nested
+    mesh has a node or so more (see engines()).
+    """
+    if mode not in MODES:
+        raise ValueError("Unknown mode %s, not one of %s" % (mode, MODES))
+    point = service.normalize(point)
+    ret = []
+    for k in range(levels) + [levels - 1 + reference]:
+        p = dict(point)
+        if mode in ('dt', 'both'):
+            p['steps'] = point['steps'] * 2**k
+        if mode in ('dx', 'both'):
+            p['nspots'] = point['nspots'] * 2**k
+            p['nvols'] = point['nvols'] * 2**k
+        ret.append(p)
+    return ret
+
+
+def _build(point, init=True):
+    """(engine, build seconds) for @point@."""
+    start = time.time()
+    F = service.new_engine(point, spot=point['spot'], init=init)
+    return F, time.time() - start
+
+
+def engines(points, mode):
+    """
+    The engines to build before the levels @points@ of a study in @mode@
+    run, as {group_key(): (engine, build seconds)}.
+
+    In mode 'dt' those are the engines several points share. In space every
+    level gets one: the reference's mesh and then, coarser and coarser,
+    every other node of the finer mesh (nested_engine()). Refining the sinh
+    mesh by doubling its nodes would move all of them, and the errors would
+    not decay regularly. Their operators are built by the workers.
+    """
+    ret = {}
+    keys = [group_key(p) for p in points]
+    if mode == 'dt':
+        for p, key in zip(points, keys):
+            if keys.count(key) > 1 and key not in ret:
+                ret[key] = _build(p)
+        return ret
+    levels = dict((p['nspots'], key) for p, key in zip(points, keys))
+    n = points[-1]['nspots']
+    F, seconds = _build(points[-1], init=False)
+    ret[keys[-1]] = (F, seconds)
+    while n > points[0]['nspots']:
+        start = time.time()
+        F = F.nested_engine()
+        n //= 2
+        if n in levels:
+            ret[levels[n]] = (F, time.time() - start)
+    return ret
+
+
+def run_level(point, engines=None):
+    """
+    @point@ with its price, its mesh size and the seconds its solve took, on
+    its engine in @engines@ (as from engines()) or a new one.
+    """
+    if engines is None:
+        engines = {}
+    key = group_key(point)
+    if key not in engines:
+        engines[key] = _build(point)
+    F, build = engines[key]
+    start = time.time()
+    F.init()
+    build += time.time() - start
+    start = time.time()
+    try:
+        V = solve(F, point, F.grid.domain[0].copy())
+    finally:
+        del F.grid.domain[1:]
+    return dict(point, price=float(V[F.idx]), spot_nodes=len(F.spots),
+                var_nodes=len(F.vars), build_seconds=build,
+                seconds=time.time() - start)
+
+
+def _init_worker(engines):
+    global _worker_engines
+    _worker_engines = engines
+
+
+def _run_level(args):
+    i, point = args
+    return i, run_level(point, _worker_engines)
+
+
+def _cost(point):
+    return point['nspots'] * point['nvols'] * point['steps']
+
+
+def fit_order(hs, values):
+    """
+    The slope of log|@values@| over log @hs@, least squares, ignoring zeros:
+    the order p of values ~ C h**p. NaN with fewer than two points.
+    """
+    hs = np.asarray(hs, dtype=float)
+    values = np.abs(np.asarray(values, dtype=float))
+    ok = values > 0
+    if ok.sum() < 2:
+        return np.nan
+    return np.polyfit(np.log(hs[ok]), np.log(values[ok]), 1)[0]
+
+
+def step_size(point, mode):
+    """The refined length of @point@: its dt, or its spot spacing."""
+    if mode == 'dt':
+        return point['tenor'] / point['steps']
+    return point['spot_max'] / point['nspots']
+
+
+def _order(coarse, fine, ratio):
+    """
+    The order p of |@coarse@ / @fine@| = @ratio@**p, NaN if either is zero
+    (like fit_order(), which ignores zeros).
+    """
+    if not (coarse and fine):
+        return np.nan
+    return np.log(abs(coarse / fine)) / np.log(ratio)
+
+
+def orders(rows, mode):
+    """
+    Fill in the observed orders of the consecutive @rows@ of a study: from
+    their errors, and from the differences of their prices.
+    """
+    for a, b in zip(rows, rows[1:]):
+        ratio = step_size(a, mode) / step_size(b, mode)
+        b['order'] = _order(a['error'], b['error'], ratio)
+    for a, b, c in zip(rows, rows[1:], rows[2:]):
+        ratio = step_size(b, mode) / step_size(c, mode)
+        c['richardson_order'] = _order(b['price'] - a['price'],
+                                       c['price'] - b['price'], ratio)
+    return rows
+
+
+def run(point, mode='dt', levels=5, reference=2, exact=None,
+        processes=None, verbose=False):
+    """
+    A study of @point@ in @mode@, as for refinements(), on @processes@
+    workers (one per CPU by default, none if 1). Errors are against @exact@
+    if given, otherwise against the reference level.
+
+    Returns a dict with the rows of the levels (each with its price, error
+    and observed orders), the reference row, the reference price, and the
+    fitted 'order' and 'richardson_order'.
+    """
+    points = refinements(point, mode, levels, reference)
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    start = time.time()
+    # Built here, so that the forked workers inherit them
+    built = engines(points, mode)
+    order = sorted(range(len(points)), key=lambda i: _cost(points[i]),
+                   reverse=True)
+    tasks = [(i, points[i]) for i in order]
+    pool = None
+    try:
+        if processes > 1:
+            pool = multiprocessing.Pool(min(processes, len(tasks)),
+                                        initializer=_init_worker,
+                                        initargs=(built,))
+            results = pool.imap_unordered(_run_level, tasks, chunksize=1)
+        else:
+            results = ((i, run_level(p, built)) for i, p in tasks)
+        rows = [None] * len(points)
+        for n, (i, row) in enumerate(results):
+            rows[i] = row
+            if verbose:
+                print "%i/%i nspots=%i nvols=%i steps=%i price=%.10f (%.2fs)" % (
+                    n + 1, len(tasks), row['nspots'], row['nvols'],
+                    row['steps'], row['price'], row['seconds'])
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    rows, ref = rows[:-1], rows[-1]
+    target = ref['price'] if exact is None else exact
+    for r in rows:
+        r['error'] = r['price'] - target
+    if exact is not None:
+        ref['error'] = ref['price'] - exact
+    orders(rows, mode)
+    hs = [step_size(r, mode) for r in rows]
+    diffs = [b['price'] - a['price'] for a, b in zip(rows, rows[1:])]
+    return dict(mode=mode, rows=rows, reference=ref, target=target,
+                exact=exact is not None,
+                engines=len(set(group_key(p) for p in points)),
+                order=fit_order(hs, [r['error'] for r in rows]),
+                richardson_order=fit_order(hs[1:], diffs),
+                seconds=time.time() - start)
+
+
+def report(study):
+    """The levels of @study@ and its fitted orders as a table."""
+    lines = ["%6s %6s %6s %18s %11s %6s %6s %8s" % (
+        'nspots', 'nvols', 'steps', 'price', 'error', 'order', 'rich.',
+        'seconds')]
+    for r in study['rows'] + [study['reference']]:
+        lines.append("%6i %6i %6i %18.12f %11.3e %6.2f %6.2f %8.3f" % (
+            r['nspots'], r['nvols'], r['steps'], r['price'],
+            r.get('error', np.nan), r.get('order', np.nan),
+            r.get('richardson_order', np.nan), r['seconds']))
+    lines.append("Reference %s: %.12f" % (
+        'exact' if study['exact'] else 'level', study['target']))
+    lines.append("Fitted order in %s: %.2f (errors), %.2f (differences)" % (
+        study['mode'], study['order'], study['richardson_order']))
+    return '\n'.join(lines)
+
+
+def save(study, store):
+    """Append the levels of @study@ to @store@, a ResultStore or directory."""
+    if isinstance(store, basestring):
+        store = ResultStore(store)
+    extra = dict(mode=study['mode'], target=study['target'],
+                 fitted_order=study['order'],
+                 fitted_richardson_order=study['richardson_order'])
+    rows = [dict(r, level=i, **extra) for i, r in enumerate(study['rows'])]
+    rows.append(dict(study['reference'], level=-1, **extra))
+    return store.append(rows)
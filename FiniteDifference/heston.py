@@ -8,6 +8,7 @@ import sys
 import os
 import itertools as it
 import time
+import multiprocessing
 from bisect import bisect_left
 
 import scipy.stats
@@ -20,13 +21,23 @@ from Option import Option, BarrierOption, MeanRevertingProcess
 
 from Grid import Grid
 import utils
+import montecarlo
+from qe import QEStepper
+from resultcache import ResultCache, digest
 
 from visualize import fp
 prec = 3
 
+# Relative bump of the initial volatility for the shadow paths of the vega
+GREEK_BUMP = 0.01
+# Fraction of the simulated paths still alive at which the knocked out ones
+# are dropped
+COMPACT = 0.75
+
 from FiniteDifferenceEngine import FiniteDifferenceEngineADI
 
 from scipy.stats.distributions import norm
+from blackscholes import bs_call_delta
 neval = ne.evaluate
 norminv = norm.ppf
 exp  = np.exp
@@ -39,6 +50,18 @@ BLACKSCHOLES, FUNDAMENTAL, COS = [2**i for i in range(3)]
 HESTON = FUNDAMENTAL | COS
 ALL = BLACKSCHOLES | HESTON
 
+# Bytes of scratch space hs_call_vector may hand to each analytical solve. The
+# variance axis is chunked so that the [vars, spots, N] temporaries fit.
+MEMORY_BUDGET = 2**28
+
+# Surfaces with fewer (spot, variance) points than this are priced in-process
+# by hs_call_vector; a pool costs more to start than it saves on them.
+POOL_THRESHOLD = 2**16
+
+# Where HestonCos and HestonFundamental keep their results when solve() is
+# called with cache=True. Pass a ResultCache instead to use another one.
+CACHE = ResultCache('heston_cache')
+
 class HestonOption(Option):
     def __init__(self
                 , spot=100
@@ -101,118 +124,396 @@ class HestonOption(Option):
 
     def monte_carlo_paths(self, dt=0.01, npaths=100000,
                           callback=lambda *x: None,
-                          verbose=True):
+                          verbose=True, random_state=None, antithetic=False,
+                          random_source=None, first_hit=False):
+        """
+        Terminal spots of @npaths@ QE paths (zero where the @callback@
+        knocked the path out). With @antithetic@ the second half of the paths
+        mirror the random draws of the first half. @random_source@ replaces
+        the pseudo random numbers, e.g. with a sobol.SobolBridge.
+
+        With @first_hit@ the @callback@ must be a montecarlo.BarrierMonitor
+        and the time each path first hit a barrier (inf if never) is
+        returned as well.
+        """
+        hits = None
+        if first_hit:
+            if not isinstance(callback, montecarlo.BarrierMonitor):
+                raise ValueError("Hitting times need a BarrierMonitor.")
+            hits = -np.ones(npaths, dtype=int)
+        St, Vt, state, intV, score = self._simulate(
+            dt, npaths, callback, verbose, random_state, antithetic,
+            random_source=random_source, hits=hits,
+            compact=getattr(callback, 'compact', False))
+        if first_hit:
+            return St * state, np.where(hits < 0, np.inf, (hits + 1) * dt)
+        return St * state
+
+
+    def monte_carlo_samples(self, dt, npaths, callback, random_state=None,
+                            antithetic=False, control_variate=False,
+                            conditional=False, random_source=None,
+                            bridge=False, greeks=False):
+        """
+        Per path samples for the variance reduced estimators, one column per
+        name in sample_columns(). The "payoff" column is the discounted
+        payoff.
+
+        @antithetic@ simulates (@npaths@ + 1) // 2 pairs of mirrored paths
+        and each row is the average of a pair ("single" is the first path of
+        the pair alone). @control_variate@ adds the discounted terminal spot
+        and, for barrier options, the discounted payoff without the barrier
+        as controls with known means. @conditional@ adds the Black-Scholes
+        price conditional on the variance path (Willard), which is only
+        valid without a barrier.
+
+        With @bridge@ the barriers are monitored continuously: instead of
+        the @callback@ checking them at the steps, each path is weighted by
+        its Brownian bridge probability of not crossing them within each
+        step.
+
+        With @greeks@ the same paths also give per path estimates of delta:
+        "delta" pathwise (not for barrier options, whose payoff jumps at the
+        barrier) and "delta_lr" the payoff times the likelihood ratio score
+        of the first spot step. @greeks@='vega' adds "vega", the derivative
+        with respect to the initial volatility, as the central difference of
+        two shadow paths started at the bumped variances with the same
+        random draws. That simulates three times as many paths. Without any
+        of the estimator options there is one column.
+        """
+        if not (antithetic or control_variate or conditional or bridge
+                or greeks):
+            return self.discounted_payoff(
+                self.monte_carlo_paths(dt, npaths, callback, verbose=False,
+                                       random_state=random_state,
+                                       random_source=random_source))
+        barrier = isinstance(self, BarrierOption)
+        if conditional and barrier:
+            raise ValueError("The conditional estimator ignores the barrier.")
+        barriers = knockin = None
+        if bridge:
+            if greeks:
+                raise ValueError("The likelihood ratio needs the barrier"
+                                 " checked at the steps.")
+            barriers, knockin = self._bridge_barriers()
+            callback = lambda *x: None
+        if antithetic:
+            npaths = 2 * ((npaths + 1) // 2)
+        # Knocked out paths only matter to the controls
+        compact = not control_variate and (
+            getattr(callback, 'compact', False) or bridge and not knockin)
+        if greeks:
+            if random_source is None:
+                rng = np.random if random_state is None else random_state
+                random_source = montecarlo.PseudoRandom(rng, antithetic)
+            elif antithetic:
+                raise ValueError("Antithetic paths need pseudo random"
+                                 " numbers.")
+        if greeks == 'vega':
+            vol = self.volatility
+            h = GREEK_BUMP * vol
+            variance = np.repeat([vol**2, (vol + h)**2, (vol - h)**2], npaths)
+            St, Vt, state, intV, score = self._simulate(
+                dt, 3*npaths, callback, False, random_state,
+                integrate=conditional,
+                random_source=montecarlo.Replicated(random_source, 3),
+                barriers=barriers, variance=variance, score=True,
+                compact=compact)
+        elif greeks:
+            St, Vt, state, intV, score = self._simulate(
+                dt, npaths, callback, False, random_state,
+                integrate=conditional, random_source=random_source,
+                barriers=barriers, score=True, compact=compact)
+        else:
+            St, Vt, state, intV, score = self._simulate(
+                dt, npaths, callback, False, random_state, antithetic,
+                integrate=conditional, random_source=random_source,
+                barriers=barriers, compact=compact)
+        if knockin:
+            state = 1 - state
+        r = self.interest_rate.value
+        t = self.tenor
+        df = np.exp(-r * t)
+        payoff = df * np.maximum(St - self.strike, 0)
+        if greeks == 'vega':
+            # The shadow paths, up then down
+            shadow = (payoff * state)[npaths:]
+            St, Vt, state, payoff, score = (x[:npaths] for x in
+                                            (St, Vt, state, payoff, score))
+            if conditional:
+                intV = intV[:npaths]
+        cols = [payoff * state]
+        if not (antithetic or control_variate or conditional or greeks):
+            return cols[0]
+        if antithetic:
+            cols.append(cols[0])
+        if control_variate:
+            cols.append(df * St)
+            if barrier:
+                cols.append(payoff)
+        if conditional:
+            V0 = self.variance.value
+            kpp = self.variance.reversion
+            tht = self.variance.mean
+            epp = self.variance.volatility
+            rho = self.correlation
+            s = self.spot * np.exp(rho/epp * (Vt - V0 - kpp*tht*t + kpp*intV)
+                                   - 0.5*rho**2*intV)
+            vol = np.sqrt((1 - rho**2) * intV / t)
+            cols.append(bs_call_delta(s, self.strike, r, vol, t)[0])
+        if greeks:
+            if not barrier:
+                cols.append(df * (St > self.strike) * St / self.spot)
+            cols.append(cols[0] * score)
+        if greeks == 'vega':
+            cols.append((shadow[:npaths] - shadow[npaths:]) / (2*h))
+        ret = np.column_stack(cols)
+        if antithetic:
+            half = npaths // 2
+            ret = 0.5 * (ret[:half] + ret[half:])
+            ret[:,1] = cols[1][:half]
+        return ret
 
-        random_batch_size = 5
+
+    def sample_columns(self, antithetic=False, control_variate=False,
+                       conditional=False, greeks=False):
+        """Names of the columns of monte_carlo_samples()."""
+        ret = ['payoff']
+        if antithetic:
+            ret.append('single')
+        if control_variate:
+            ret.append('stock')
+            if isinstance(self, BarrierOption):
+                ret.append('european')
+        if conditional:
+            ret.append('conditional')
+        if greeks:
+            if not isinstance(self, BarrierOption):
+                ret.append('delta')
+            ret.append('delta_lr')
+        if greeks == 'vega':
+            ret.append('vega')
+        return ret
+
+
+    def _monte_carlo_stats_result(self, stats, dt, duration, antithetic=False,
+                                  control_variate=False, conditional=False,
+                                  bridge=False, greeks=False):
+        """
+        Besides the usual keys, "estimates" holds (expected, error) of each
+        estimator in the run and "variance_reduction" the ratio of the
+        plain Monte Carlo variance per path to theirs. The top level
+        "expected", "error" and "std" are those of the control variate
+        estimator if requested, else of the conditional one, else of the
+        (antithetic) payoff.
+
+        With @greeks@ there are also "delta" and "delta_lr", and with
+        @greeks@='vega' "vega", and their "_error"s. "delta" is the pathwise
+        estimate, or for barrier options the likelihood ratio one.
+        """
+        if not (antithetic or control_variate or conditional or greeks):
+            return Option._monte_carlo_stats_result(self, stats, dt, duration)
+        names = self.sample_columns(antithetic, control_variate, conditional,
+                                    greeks)
+        col = dict((name, i) for i, name in enumerate(names))
+        rows = stats.n
+        # Paths per row
+        per = 2 if antithetic else 1
+        mean = stats.mean
+        cov = stats.covariance
+        variances = {}
+        estimates = {}
+        def add(name, expected, variance):
+            estimates[name] = (expected, np.sqrt(variance / rows))
+            variances[name] = variance
+        i = col['single'] if antithetic else col['payoff']
+        add('plain', mean[i], cov[i,i])
+        if antithetic:
+            add('antithetic', mean[col['payoff']], cov[0,0])
+        y = col['conditional'] if conditional else col['payoff']
+        if conditional:
+            add('conditional', mean[y], cov[y,y])
+        if control_variate:
+            x = [col['stock']]
+            mu = [self.spot]
+            if 'european' in col:
+                x.append(col['european'])
+                mu.append(self.european_price())
+            # Regression coefficients b = Sxx^-1 Sxy
+            sxx = cov[np.ix_(x, x)]
+            sxy = cov[x, y]
+            b = np.linalg.solve(sxx, sxy)
+            add('control', mean[y] - np.dot(b, mean[x] - mu),
+                cov[y,y] - np.dot(sxy, b))
+        plain = variances['plain']
+        if antithetic:
+            # The rows are already averages of a pair
+            plain = plain / 2
+        best = ('control' if control_variate else
+                'conditional' if conditional else
+                'antithetic' if antithetic else 'plain')
+        expected, error = estimates[best]
+        ret = { "expected": expected
+               , "error": error
+               , "duration": duration
+               , "n": per * rows
+               , "std": np.sqrt(per * variances[best])
+               , "dt": dt
+               , "estimates": estimates
+               , "variance_reduction": dict(
+                   (name, plain / v if v else np.inf)
+                   for name, v in variances.items())
+               }
+        ret['variance_reduction']['plain'] = 1.0
+        if greeks:
+            for name in ('delta_lr', 'vega', 'delta'):
+                if name == 'vega' and name not in col:
+                    continue
+                i = col.get(name, col['delta_lr'])
+                ret[name] = mean[i]
+                ret[name + '_error'] = np.sqrt(cov[i,i] / rows)
+        if stats.edges is not None:
+            ret['histogram'] = (stats.counts, stats.edges)
+        return ret
+
+
+    def _bridge_barriers(self):
+        """The barrier levels, and whether they knock in, for bridge=True."""
+        if not isinstance(self, BarrierOption):
+            raise ValueError("Only barrier options have a barrier to bridge.")
+        barriers = self.barriers()
+        knockin = set(bool(b[0]) for b in barriers)
+        if len(knockin) != 1:
+            raise ValueError("Can't bridge a knock-in and a knock-out barrier.")
+        return [b[1] for b in barriers], knockin.pop()
+
+
+    def european_price(self):
+        """HestonCos price of the vanilla call on the same model."""
+        return HestonCos(
+            self.spot,
+            self.strike,
+            self.interest_rate.value,
+            self.volatility,
+            self.tenor,
+            self.variance.reversion,
+            self.variance.mean,
+            self.variance.volatility,
+            self.correlation).solve().item()
+
+
+    def qe_stepper(self, dt):
+        """A qe.QEStepper for this option's model and step @dt@."""
+        return QEStepper(self.interest_rate.value, self.variance.reversion,
+                         self.variance.mean, self.variance.volatility,
+                         self.correlation, dt)
+
+
+    def _simulate(self, dt, npaths, callback, verbose, random_state,
+                  antithetic=False, integrate=False, random_source=None,
+                  barriers=None, variance=None, score=False, hits=None,
+                  compact=False):
+        """
+        Andersen's QE scheme. Returns the terminal spots, variances, the
+        callback's state, if @integrate@ the trapezoidal integral of the
+        variance along each path and if @score@ the likelihood ratio weight
+        for delta, d/dS0 of the log density of the first step. @variance@
+        replaces the initial variance with one per path.
+
+        Given @barriers@ the state is instead each path's probability of not
+        having crossed any of these levels, from the Brownian bridge between
+        consecutive steps with the variance at the start of the step.
+
+        The normals and uniforms of each step come from @random_source@,
+        by default a montecarlo.PseudoRandom on @random_state@.
+
+        @hits@, ints of -1 for each path, get the step at which a
+        montecarlo.BarrierMonitor @callback@ first changed the path's state.
+        With @compact@, which is only right if a path with state 0 can never
+        count again, such paths are no longer simulated once at most
+        COMPACT of the simulated ones are left. The results are still for
+        all paths, the dropped ones as they were when dropped.
+        """
         neval = ne.evaluate
-        norminv = norm.ppf
-        exp  = np.exp
-        log  = np.log
-        sqrt = np.sqrt
         S0 = self.spot
-        r = self.interest_rate.value
-        V0 = self.variance.value
+        V0 = self.variance.value if variance is None else variance
         t = self.tenor
-        kpp = self.variance.reversion
-        tht = self.variance.mean
-        epp = self.variance.volatility
-        rho_sv = self.correlation
 
-        #parameter values used for discretization, =0.5 uses central discretization
-        gmm1 = 0.5;
-        gmm2 = 0.5;
-        #constant for the switching rule used in the QE scheme
-        shi_crt = 1.5;
+        if random_source is None:
+            # A RandomState or the global one
+            rng = np.random if random_state is None else random_state
+            random_source = montecarlo.PseudoRandom(rng, antithetic)
+        elif antithetic:
+            raise ValueError("Antithetic paths need pseudo random numbers.")
 
         nrOfSteps = int(t/dt)
+        stepper = self.qe_stepper(dt)
+        gmm1, gmm2 = stepper.gmm1, stepper.gmm2
 
-        Vt = np.empty((npaths,))
         St = np.empty((npaths,))
-        Vt[:] = V0
+        Vt = np.empty((npaths,))
         St[:] = S0
+        Vt[:] = V0
 
         # Whether or not this path will count
-        state = np.ones(npaths, dtype=bool)
-
-        # U_all = np.random.random((nrOfSteps, npaths))
-        # Z1_all = norminv(U_all)
-        # Z2_all = np.random.standard_normal((nrOfSteps, npaths))
+        if barriers:
+            state = np.ones(npaths)
+        else:
+            state = self.monte_carlo_state(npaths)
+        intV = np.zeros(npaths) if integrate else None
+        weight = None
+        C3 = stepper.constants['C3']
 
         notify = nrOfSteps // 10
         notify += notify == 0
-        for i in range(nrOfSteps):
+        # All paths' results once some are no longer simulated
+        full = None
+        paths = stepper.run(S0, V0, nrOfSteps, npaths, random_source)
+        for i, (St, Vt, S, V) in enumerate(paths):
             if verbose:
                 if not i % notify:
                     print int(100*i / nrOfSteps),
                     sys.stdout.flush()
-            V = Vt
-
-            #Andersen's paper, equation (17)
-            m = neval("tht + (V-tht)*exp(-kpp*dt)")
-            #Andersen's paper, equation (18)
-            s2 = neval("V*epp**2*exp(-kpp*dt)*(1-exp(-kpp*dt))/kpp + tht*epp**2*(1-exp(-kpp*dt))**2/(2*kpp)")
-            # s2 = V * (epp**2*exp(-kpp*dt)*(1-exp(-kpp*dt))/kpp) + (tht*epp**2*(1-exp(-kpp*dt))**2/(2*kpp))
-            #Andersen's paper, equation (19)
-            shi = neval("s2/(m**2)")
-            #Andersen's paper, p19, where C0 - K0, C1 - K1, C2 - K2, C3 - sqrt(K3/gmm1)
-            C0 = (-rho_sv*tht*kpp/epp) * dt;
-            C1 = gmm1*dt*(kpp*rho_sv/epp-0.5) - rho_sv/epp;
-            C2 = gmm2*dt*(kpp*rho_sv/epp-0.5) + rho_sv/epp;
-            C3 = sqrt((1-rho_sv**2)*dt);
-
-            #Andersen's paper, p20, A - AVtdt
-            AVtdt = C2 + 0.5*C3**2*gmm2;
-            # assert not np.isnan(AVtdt).any()
-            #Andersen's QE algorithm 3.2.4, p16 - 17
-            if not i % random_batch_size:
-                U = np.random.random((random_batch_size, npaths,))
-                Z = np.random.standard_normal((random_batch_size*2, npaths))
-            Z0 = Z[i % random_batch_size]
-            Z1 = Z[i % random_batch_size + random_batch_size]
-            u = U[i % random_batch_size]
-
-            boolvec = shi <= shi_crt
-            #for sufficiently large value s of Vt
-            #condition to be satisfied for QE martingale correction: AVtdt < (1/(2*a))
-            c4 = 2/shi
-            b2 = np.maximum(c4-1+sqrt(c4*(c4-1)),0)
-            # assert not np.isnan(b2).any()
-            a = m/(1+b2)
-            # assert not np.isnan(a).any()
-            Vdt = neval("(a*(sqrt(b2)+Z1)**2) * boolvec")
-            # assert not np.isnan(Vdt).any()
-            #Martingale drift correction, p22, K0_star -- C00
-            C00 = neval("(-AVtdt*b2*a/(1-2*AVtdt*a) + 0.5*log(1-2*AVtdt*a) - (C1+0.5*C3**2*gmm1)*V)*boolvec")
-            # assert not np.isnan(C00).any()
-
-            #for low values of Vt
-            #condition to be satisfied for QE martingale correction: AVtdt < beta
-            p = (shi-1)/(shi+1);
-            # assert not np.isnan(p).any()
-            bet = (1-p)/m;
-            # assert not np.isnan(bet).any()
-            tmpVdt = neval("log((1-p)/(1-u))/bet * (u > p)")
-            # assert not np.isnan(tmpVdt).any()
-            #Martingale drift correction, p22, K0_star -- C00
-            tmpC00 = neval("-log(p + bet*(1-p)/(bet-AVtdt)) - (C1+0.5*C3**2*gmm1)*V")
-            # assert not np.isnan(tmpC00).any()
-
-            Vdt[-boolvec] = tmpVdt[-boolvec]
-            C00[-boolvec] = tmpC00[-boolvec]
-            # assert not np.isnan(Vdt).any()
-            # assert not np.isnan(C00).any()
-
-            #simulated Heston stock prices
-            #Andersen's paper, p19, equation (33), with drift corrected, K0 replaced by C00
-            St = neval("St * exp(r*dt + C00 + C1*V + C2*Vdt + C3*sqrt(gmm1*V+gmm2*Vdt)*Z0)")
-            callback(St, state)
-            # assert not np.isnan(St[i,:]).any()
-
-            #update Heston stochastic variance
-            Vt = Vdt
-            # assert not np.isnan(Vt[i+1,:]).any()
-
-        return St * state
+            if score and not i:
+                # Given the next variance, log(St) is normal with standard
+                # deviation C3*sqrt(gmm1*V + gmm2*Vt)
+                Z0 = stepper.draws[0]
+                weight = neval("Z0 / (S0 * C3 * sqrt(gmm1*V + gmm2*Vt))")
+            if hits is None:
+                callback(St, state)
+            else:
+                callback(St, state, hits, i)
+            for h in barriers or ():
+                # V can be -0.0 from the QE step
+                state *= neval("where((S - h)*(St - h) > 0, where(V > 0,"
+                               " 1 - exp(-2*log(S/h)*log(St/h)/(V*dt)), 1), 0)")
+            if integrate:
+                intV += neval("(gmm1*V + gmm2*Vt) * dt")
+            if (compact and i + 1 < nrOfSteps
+                    and np.count_nonzero(state) <= COMPACT * len(state)):
+                current = (St, Vt, state, intV, hits)
+                if full is None:
+                    full = [x if x is None else x.copy() for x in current]
+                    if hits is not None:
+                        full[-1] = hits
+                else:
+                    for f, x in zip(full, current):
+                        if x is not None:
+                            f[stepper.rows] = x
+                keep = state != 0
+                stepper.compact(keep)
+                state = state[keep]
+                if integrate:
+                    intV = intV[keep]
+                if hits is not None:
+                    hits = hits[keep]
+
+        if full is not None:
+            for f, x in zip(full, (St, Vt, state, intV, hits)):
+                if x is not None:
+                    f[stepper.rows] = x
+            St, Vt, state, intV, hits = full
+        return St, Vt, state, intV, weight
 
 
 
@@ -292,9 +593,17 @@ class HestonFiniteDifferenceEngine(FiniteDifferenceEngineADI):
             boundaries=None,
             cache=True,
             verbose=True,
-            force_bandwidth=None
+            force_bandwidth=None,
+            instrument=None,
+            observers=None
             ):
-        """@option@ is a HestonOption"""
+        """
+        @option@ is a HestonOption. @instrument@ is an instrument.Instrument
+        timing the grid, the operators and the solves. @observers@ is a list
+        of observers.Observer watching the time steps.
+        """
+        self.instrument = instrument
+        self.observers = observers
         self.cache = cache
         assert isinstance(option, Option)
         self.option = option
@@ -377,29 +686,31 @@ class HestonFiniteDifferenceEngine(FiniteDifferenceEngineADI):
                     boundaries[(0,0)] = boundaries[(0,)]
 
 
-        if grid:
-            self.spots = grid.mesh[0]
-            self.vars = grid.mesh[1]
-        else:
-            if vars is None:
-                # vars = np.linspace(0, var_max, nvols)
-                vars = utils.exponential_space(0.00, option.variance.value, var_max,
-                                            varexp, nvols,
-                                            force_exact=force_exact)
-            self.vars = vars
-            if spots is None:
-                # spots = np.linspace(0,spot_max,nspots)
-                if isinstance(option, BarrierOption) and option.top and not option.top[0]:
-                        p = 3
-                        # spots = np.linspace(0, spot_max**p, nspots)**(1.0/p)
-                        spots = utils.exponential_space(0.00, self.option.strike, spot_max,
-                                                    1.0/p, nspots,
-                                                    force_exact=force_exact)
-                        print "Barrier spots"
-                else:
-                    spots = utils.sinh_space(option.strike-spot_min, spot_max-spot_min, spotdensity, nspots, force_exact=force_exact) + spot_min
-            self.spots = spots
-            grid = Grid([self.spots, self.vars], initializer=lambda *x: np.maximum(x[0]-option.strike,0))
+        with self._instrument().span('grid'):
+            if grid:
+                self.spots = grid.mesh[0]
+                self.vars = grid.mesh[1]
+            else:
+                if vars is None:
+                    # vars = np.linspace(0, var_max, nvols)
+                    vars = utils.exponential_space(0.00, option.variance.value, var_max,
+                                                varexp, nvols,
+                                                force_exact=force_exact)
+                self.vars = vars
+                if spots is None:
+                    # spots = np.linspace(0,spot_max,nspots)
+                    if isinstance(option, BarrierOption) and option.top and not option.top[0]:
+                            p = 3
+                            # spots = np.linspace(0, spot_max**p, nspots)**(1.0/p)
+                            spots = utils.exponential_space(0.00, self.option.strike, spot_max,
+                                                        1.0/p, nspots,
+                                                        force_exact=force_exact)
+                            if verbose:
+                                print "Barrier spots"
+                    else:
+                        spots = utils.sinh_space(option.strike-spot_min, spot_max-spot_min, spotdensity, nspots, force_exact=force_exact) + spot_min
+                self.spots = spots
+                grid = Grid([self.spots, self.vars], initializer=lambda *x: np.maximum(x[0]-option.strike,0))
 
 
         newstrike = self.spots[np.argmin(np.abs(self.spots - option.strike))]
@@ -451,8 +762,11 @@ class HestonFiniteDifferenceEngine(FiniteDifferenceEngineADI):
         self.coefficients = coefficients
         self.boundaries = boundaries
         self.schemes = schemes
+        self.force_exact = force_exact
         self.force_bandwidth = force_bandwidth
         self._initialized = False
+        self._grid_analytical = None
+        self._grid_analytical_key = None
 
         # FiniteDifferenceEngineADI.__init__(self, G, coefficients=self.coefficients,
                 # boundaries=self.boundaries, schemes=self.schemes, force_bandwidth=(-2,2))
@@ -474,6 +788,13 @@ class HestonFiniteDifferenceEngine(FiniteDifferenceEngineADI):
         H = self.option
         if isinstance(H, BarrierOption):
             raise NotImplementedError("No analytical solution for Heston barrier options.")
+        # The surface is expensive, so only recompute it when the mesh or the
+        # option parameters have changed since the last access.
+        key = (tuple(self.spots), tuple(self.vars), H.strike,
+               H.interest_rate.value, H.tenor, H.variance.reversion,
+               H.variance.mean, H.variance.volatility, H.correlation)
+        if self._grid_analytical is not None and key == self._grid_analytical_key:
+            return self._grid_analytical
         hs = hs_call_vector(self.spots, H.strike,
             H.interest_rate.value, np.sqrt(self.vars), H.tenor,
             H.variance.reversion, H.variance.mean, H.variance.volatility,
@@ -484,11 +805,204 @@ class HestonFiniteDifferenceEngine(FiniteDifferenceEngineADI):
             print "Warning: Analytical solution looks like trash."
         else:
             self.BADANALYTICAL = False
+        # Callers share the memoized surface, so it must not be modified.
+        hs.flags.writeable = False
+        self._grid_analytical = hs
+        self._grid_analytical_key = key
         return hs
 
 
+    def nested_engine(self):
+        """
+        An engine on every other node of this one's mesh, counted from the
+        spot and the variance, so that the meshes are nested around them.
+        Its schemes switch at the nodes corresponding to this one's.
+        """
+        ids, idv = self.idx
+        kept = (nested_index(len(self.spots), ids),
+                nested_index(len(self.vars), idv))
+        schemes = {}
+        for dim, parts in self.schemes.items():
+            schemes[dim] = [dict(part) for part in parts]
+            if len(set(dim)) != 1:
+                continue
+            for part in schemes[dim]:
+                if 'from' in part:
+                    # The first kept node at or after the switch
+                    part['from'] = int(np.searchsorted(kept[dim[0]],
+                                                       part['from']))
+        return HestonFiniteDifferenceEngine(self.option,
+                spots=self.spots[kept[0]], vars=self.vars[kept[1]],
+                force_exact=self.force_exact, schemes=schemes,
+                coefficients=self.coefficients,
+                boundaries=dict(self.boundaries), cache=self.cache,
+                verbose=False, force_bandwidth=self.force_bandwidth,
+                instrument=self.instrument)
+
+
+    def price_extrapolated(self, steps, scheme='hv', theta=0.5, smoothing=1,
+                           mode='time', order=None, parallel=False):
+        """
+        The price at the spot by Richardson extrapolation of a fine solve
+        (this mesh, @steps@ time steps of @scheme@, the first @smoothing@ as
+        implicit half steps) and a coarse one: half the steps on the same
+        operators (@mode@ 'time'), the nested_engine() mesh ('space') or
+        both. The coarse solve costs a half, a quarter or an eighth of the
+        fine one, and runs in a forked process alongside it if @parallel@.
+
+        The error of the fine price is taken to be C h**@order@, by default
+        the scheme's order in time (SCHEME_ORDERS) or 2 in space. In mode
+        'both' the two must agree, so a first order scheme needs an explicit
+        @order@.
+
+        Returns a dict of the extrapolated 'price', the 'fine' and 'coarse'
+        prices, the 'order' and 'fine_error', the estimated error of the
+        fine price. The extrapolated price is usually much closer than
+        that. The fine solve is left in grid.domain as with the solve_*
+        methods.
+        """
+        if mode not in ('time', 'space', 'both'):
+            raise ValueError("Unknown mode %s" % (mode,))
+        if order is None:
+            order = 2
+            if mode != 'space':
+                order = SCHEME_ORDERS[scheme]
+            if mode == 'both' and order != 2:
+                raise ValueError("Scheme %s is of order %i in time but 2 in"
+                                 " space, give the order to extrapolate in"
+                                 " mode both" % (scheme, order))
+        fine = dict(scheme=scheme, theta=theta, steps=steps,
+                    smoothing=smoothing)
+        coarse = dict(fine)
+        if mode != 'space':
+            if steps % 2 or steps // 2 <= smoothing:
+                raise ValueError("Need an even number of steps, more than"
+                                 " twice the %i smoothing steps" % smoothing)
+            coarse['steps'] = steps // 2
+        C = self.nested_engine() if mode != 'time' else self
+        def coarse_price():
+            try:
+                return float(solve(C, coarse, C.grid.domain[0].copy())[C.idx])
+            finally:
+                del C.grid.domain[1:]
+        if parallel:
+            result = _fork(coarse_price)
+            try:
+                V = solve(self, fine, self.grid.domain[0].copy())
+            finally:
+                pc = result()
+        else:
+            pc = coarse_price()
+            V = solve(self, fine, self.grid.domain[0].copy())
+        pf = float(V[self.idx])
+        r = 2.0**order
+        return dict(price=(r * pf - pc) / (r - 1),
+                    fine_error=abs(pf - pc) / (r - 1),
+                    fine=pf, coarse=pc, order=order)
+
+
+# The solver methods of the scheme names solve() takes
+SOLVERS = {
+    'i': 'solve_implicit',
+    'd': 'solve_douglas',
+    'hv': 'solve_hundsdorferverwer',
+    'cs': 'solve_craigsneyd',
+    'cs2': 'solve_craigsneyd2',
+}
+
+# The leading order in dt of each scheme's error, for price_extrapolated()
+SCHEME_ORDERS = {'i': 1, 'd': 1, 'hv': 2, 'cs': 2, 'cs2': 2}
+
+
+def solve(F, case, initial):
+    """
+    Solve @case@'s steps on engine @F@ from @initial@, the first
+    "smoothing" of them as two implicit half steps each, like
+    solve_smooth() but with the case's theta.
+    """
+    n = case['steps']
+    dt = F.option.tenor / n
+    m = case['smoothing']
+    V = initial
+    if m:
+        V = F.solve_implicit(2*m, dt / 2, initial=V)
+    f = getattr(F, SOLVERS[case['scheme']])
+    if case['scheme'] == 'i':
+        return f(n - m, dt, initial=V)
+    return f(n - m, dt, initial=V, theta=case['theta'])
+
+
+def _fork(f):
+    """
+    Start f() in a forked process, which sees everything f does without
+    pickling it. Returns a function that waits for and returns its result.
+    """
+    recv, send = multiprocessing.Pipe(False)
+    def target():
+        try:
+            send.send((True, f()))
+        except Exception as e:
+            send.send((False, e))
+    p = multiprocessing.Process(target=target)
+    p.start()
+    # Only the child writes, so a dead child means EOF here
+    send.close()
+    def result():
+        try:
+            ok, value = recv.recv()
+        finally:
+            recv.close()
+            p.join()
+        if not ok:
+            raise value
+        return value
+    return result
+
+
+def nested_index(n, i):
+    """
+    The indices of every other one of @n@ points, counting both ways from
+    the @i@th, and both ends.
+    """
+    ret = np.concatenate([np.arange(i, -1, -2)[::-1], np.arange(i+2, n, 2)])
+    if ret[0] != 0:
+        ret = np.concatenate([[0], ret])
+    if ret[-1] != n - 1:
+        ret = np.concatenate([ret, [n - 1]])
+    return ret
+
+
+def nested(points, i):
+    """
+    Every other one of the sorted @points@, counting both ways from the
+    @i@th, and both ends.
+    """
+    return np.asarray(points)[nested_index(len(points), i)]
+
+
 class HestonCos(object):
-    def __init__(self, S, K, r, vol, T, kappa, theta, sigma, rho, N=2**8):
+    """
+    Fang and Oosterlee's COS method.
+
+    By default the expansion uses @N@ cosine terms on [a, b] = c1 +- L*sqrt(c2)
+    with L = 12.
+
+    If @tol@ (an absolute price tolerance) is given, [a, b] is widened until
+    the estimated tail mass outside it is below tol, and terms are added in
+    blocks until a whole block contributes less than tol, so the number of
+    terms adapts to the maturity and parameters. Individual terms below tol
+    are dropped. This mode prices the put and uses put-call parity. @N@ is
+    then ignored and @L@, if given, is fixed.
+    """
+
+    # Upper bounds on the number of terms and on L, and the block size, in
+    # adaptive mode.
+    max_terms = 2**12
+    max_L = 24
+    block = 32
+
+    def __init__(self, S, K, r, vol, T, kappa, theta, sigma, rho, N=2**8,
+                 tol=None, L=None):
         r,T,kappa,theta,sigma,rho = map(float, [r,T,kappa, theta, sigma,rho])
         if hasattr(S, '__iter__') and hasattr(K, '__iter__'):
             raise TypeError("Can only have np.array(K) or np.array(S), not both.")
@@ -517,6 +1031,10 @@ class HestonCos(object):
         self.sigma = sigma
         self.rho   = rho
         self.N = N
+        self.tol = tol
+        self.L = L
+        # Number of terms actually summed by the last COS()
+        self.nterms = None
 
     def __str__(self):
         return '\n'.join([
@@ -533,18 +1051,111 @@ class HestonCos(object):
         ,"theta: %s" % self.theta
         ,"sigma: %s" % self.sigma
         ,"rho  : %s" % self.rho
-        ,"N    : %s" % self.N])
-
+        ,"N    : %s" % self.N
+        ,"tol  : %s" % self.tol
+        ,"L    : %s" % self.L])
+
+
+    @classmethod
+    def bytes_per_point(cls, N=2**8, tol=None, L=None):
+        """
+        Scratch memory used by COS() for each (spot, variance) pair.
+
+        In adaptive mode the number of terms is not known up front, so the
+        estimate is for max_terms.
+        """
+        if tol is not None:
+            N = cls.max_terms
+        # XI, PSI, U and the exponential are all [var, S, N] complex
+        return 6 * 16 * N
+
+
+    def cache_key(self):
+        return digest(type(self).__name__, self.S, self.K, self.r, self.vol,
+                      self.T, self.kappa, self.theta, self.sigma, self.rho,
+                      self.N, self.tol, self.L)
+
+
+    def terms(self, width, K, r, var, T, kappa, theta, sigma, rho):
+        """
+        The cosine indices k worth summing and CF at k*pi/(b-a), each
+        [var, 1, n].
+
+        For the put each term's contribution to the price is bounded by
+            K exp(-rT) |cf_k| |U_k|,  |U_k| <= 2/(b-a) (2 + (b-a))
+        and kept if that is above tol for any variance. Blocks are added
+        until one is entirely below tol or max_terms is reached.
+        """
+        bound = np.max(K) * np.exp(-r*T) * 2 / width * (2 + width)
+        ks = []
+        cfs = []
+        for start in range(0, self.max_terms, self.block):
+            k = np.arange(start, start+self.block)[np.newaxis,np.newaxis,:]
+            cf = self.CF(k*np.pi/width, r, var, T, kappa, theta, sigma, rho)
+            keep = (abs(cf) * bound >= self.tol).any(axis=0).ravel()
+            if start == 0:
+                # psi() relies on k[0] == 0
+                keep[0] = True
+            ks.append(k[:,:,keep])
+            cfs.append(cf[:,:,keep])
+            if not keep.any():
+                break
+        return np.dstack(ks), np.dstack(cfs)
+
+
+    def c4(self, r, var, T, kappa, theta, sigma, rho, scale):
+        """
+        Fourth cumulant of the log return, from a central difference of
+        log(CF) with step 1/(4*@scale@).
+        """
+        h = 0.25 / scale
+        j = np.arange(-2, 3)[np.newaxis,np.newaxis,:]
+        lp = np.log(self.CF(j*h, r, var, T, kappa, theta, sigma, rho)).real
+        return np.dot(lp, [1, -4, 6, -4, 1])[:,:,np.newaxis] / h**4
+
+
+    def support(self, c1, c2, K, r, var, T, kappa, theta, sigma, rho):
+        """
+        Half width of the truncation range, and the terms for it.
+
+        The range is L*sqrt(c2 + sqrt(c4)) around c1. L starts small and is
+        widened, per variance, until the density recovered from the series
+        at both ends times that scale (a tail mass estimate) times K is
+        below tol.
+        """
+        scale = np.sqrt(abs(c2))
+        scale = np.sqrt(abs(c2) + np.sqrt(abs(
+            self.c4(r, var, T, kappa, theta, sigma, rho, scale))))
+        if self.L is not None:
+            L = self.L + np.zeros_like(scale)
+        else:
+            L = np.ceil(np.sqrt(-np.log(self.tol))) + np.zeros_like(scale)
+        while True:
+            width = 2*L*scale
+            k, cf = self.terms(width, K, r, var, T, kappa, theta, sigma, rho)
+            if self.L is not None:
+                break
+            cf[:,:,0] *= 0.5
+            f = (cf * np.exp(-1j*k*np.pi*(c1 - L*scale)/width)).real
+            fa = 2/width * f.sum(axis=-1)[:,:,np.newaxis]
+            fb = 2/width * (f * (-1)**k).sum(axis=-1)[:,:,np.newaxis]
+            cf[:,:,0] *= 2
+            tail = np.max(K) * scale * (abs(fa) + abs(fb))
+            grow = (tail > self.tol) & (L < self.max_L)
+            if not grow.any():
+                break
+            L[grow] += 1
+        return L*scale, k, cf
 
 
     def solve(self, cache=True):
-        cache_dir = 'heston_cache'
-        fname = os.path.join(cache_dir, "x"+str(hash(self.param_str()))+".npy")
+        if cache is True:
+            cache = CACHE
         if cache:
-            # print "Seeking:", fname
-            if os.path.isfile(fname):
-                # print "Loading:", fname
-                return np.load(fname)
+            key = self.cache_key()
+            ret = cache.get(key)
+            if ret is not None:
+                return ret
 
         ret = np.zeros_like(self.S)
         # ok = np.exp(np.log(self.S)) * 5*np.sqrt(self.vol) > self.K
@@ -575,9 +1186,7 @@ class HestonCos(object):
         # mask = diffs / self.S < -0.1
         # ret = np.cumsum(np.where(mask, 0, diffs), axis=1)
         if cache:
-            if not os.path.isdir(cache_dir):
-                os.mkdir(cache_dir)
-            np.save(fname, ret)
+            ret = cache.put(key, ret)
         return ret
 
 
@@ -637,7 +1246,7 @@ class HestonCos(object):
         # Axes: [var, S, cosines]
         global U, a, b, U_tiled, CF_tiled, cf
         N = self.N
-        L = 12
+        L = 12 if self.L is None else self.L
         x = np.log(S/K)[np.newaxis,:,np.newaxis]
         var = var[:,np.newaxis,np.newaxis]
         var_theta = var - theta
@@ -659,12 +1268,19 @@ class HestonCos(object):
         # print "p5", p5
 
         c1 = r*T + (-var_theta)*(1 - np.exp(-kappa*T))/(2*kappa) - 0.5*theta*T
-        Lc2 = L*np.sqrt(abs(c2))
+        # The interval width, and so CF, does not depend on S
+        if self.tol is None:
+            Lc2 = L*np.sqrt(abs(c2))
+            k = np.arange(N)[np.newaxis,np.newaxis,:]
+            cf = self.CF(k*np.pi/(2*Lc2), r, var, T, kappa, theta, sigma, rho)
+        else:
+            Lc2, k, cf = self.support(c1, c2, K, r, var, T, kappa, theta,
+                                      sigma, rho)
+        self.nterms = k.size
         del c2
         a = x + c1-Lc2
         b = x + c1+Lc2
         del Lc2, c1
-        k = np.arange(N)[np.newaxis,np.newaxis,:]
 
         # print "a", a
         # print "b", b
@@ -673,14 +1289,22 @@ class HestonCos(object):
 
         NPOINTS = max(len(S), len(K))
 
-        XI = self.xi(k,a,b,0,b)
-        # print "xi:", XI
-        PSI = self.psi(k,a,b,0,b)
-        # print "psi:", PSI
-        U = ne.evaluate("2./(b-a)*(XI - PSI)")
+        if self.tol is None:
+            XI = self.xi(k,a,b,0,b)
+            # print "xi:", XI
+            PSI = self.psi(k,a,b,0,b)
+            # print "psi:", PSI
+            U = ne.evaluate("2./(b-a)*(XI - PSI)")
+        else:
+            # Price the put, its payoff is bounded so cutting the density
+            # off at [a, b] costs at most K times the tail mass.
+            d = np.minimum(b, 0)
+            c = np.minimum(a, d)
+            XI = self.xi(k,a,b,c,d)
+            PSI = self.psi(k,a,b,c,d)
+            U = ne.evaluate("2./(b-a)*(PSI - XI)")
         del XI, PSI
 
-        cf = self.CF(k*np.pi/(b-a), r, var, T, kappa, theta, sigma, rho)
         cf[:,:,0] *= 0.5
         # print "cf:", cf
         pi = np.pi
@@ -689,13 +1313,30 @@ class HestonCos(object):
 
         # print "ret:", ret
         ret = K * np.exp(-r*T) * ret.real.sum(axis=-1)
+        if self.tol is not None:
+            # Put-call parity
+            ret += S - K*np.exp(-r*T)
         ret[np.isnan(ret)] = 0
         return np.maximum(0, ret).T
 
 
 class HestonFundamental(object):
-
-    def __init__(self, s, k, r, v, t, kappa, theta, sigma, rho):
+    """
+    Heston's original semi-analytical solution, integrated numerically with
+    composite Gauss-Legendre quadrature in phi.
+
+    The integrand is evaluated for every spot, variance and phi at once. phi
+    runs out to where the characteristic function has decayed below @tol@, in
+    panels short enough to resolve the oscillation in log(S/K).
+    """
+
+    # Gauss-Legendre points per panel
+    order = 8
+    # Number of phi points evaluated at a time, bounds the [spots, phi] and
+    # [vars, phi] temporaries.
+    phi_batch = 2**12
+
+    def __init__(self, s, k, r, v, t, kappa, theta, sigma, rho, tol=1e-8):
         self.spot = s
         self.logspot = np.log(s)
         self.strike = k
@@ -707,62 +1348,80 @@ class HestonFundamental(object):
         self.mean_reversion = kappa
         self.mean_variance = theta
         self.lam = 0
-        self.b = None
-        self.u = None
-        self.dmemo = None
-        self.gmemo = None
-
-
-    def d(self, phi):
-        if not self.dmemo:
-            left  = pow((self.rho * self.sig * phi * I - self.b),2)
-            right = pow(self.sig,2) * (2 * self.u * phi * I - pow(phi,2))
-            self.dmemo = np.sqrt(left-right)
-        return self.dmemo
-
-    def g(self, phi):
-        if not self.gmemo:
-            self.gmemo = (self.b - (self.rho * self.sig * phi * I) + self.d(phi)) \
-                 / (self.b - (self.rho * self.sig * phi * I) - self.d(phi))
-        return self.gmemo
-
-
-    def C(self, phi):
-        return (self.r * phi * I * self.tenor
-             + (self.mean_reversion * self.mean_variance / pow(self.sig,2))
-             * ((self.b - self.rho * self.sig * phi * I + self.d(phi)) * self.tenor
-             - 2.0 * np.log((1.0 - self.g(phi) * np.exp(self.d(phi) * self.tenor))
-                     / (1.0 - self.g(phi)))))
-
-
-    def D(self, phi):
-        return ((self.b - self.rho * self.sig * phi * I + self.d(phi)) / pow(self.sig,2)
-               * ((1.0 - np.exp(self.d(phi) * self.tenor))
-                / (1.0 - self.g(phi) * np.exp(self.d(phi) * self.tenor))))
-
-
-    def f(self, phi):
-        return np.exp(self.C(phi) + self.D(phi)*self.var + I * phi * self.logspot)
-
-
-    def integrand(self, phi):
-        self.dmemo = self.gmemo = None
-        return (np.exp(-I * phi * np.log(self.strike)) * self.f(phi) / (I * phi)).real
-
-    def ugly_integrate(self, phi, minR, maxR, neval):
-        stepR = float(maxR-minR) / neval
-        sum = 0
-        for i in xrange(neval):
-            x = minR + stepR * i;
-            tmp = self.integrand(x)
-            sum += tmp
-        ret = sum
-        return ret * stepR
-
-    def P(self):
-        # res.append(scipy.integrate.quad(self.integrand, 5e-2, inf)[0] * 1./np.pi + 0.5)
-        res = self.ugly_integrate(self.integrand, 5e-2, 100, 1000)
-        return res * 1./np.pi + 0.5
+        self.tol = tol
+
+
+    def CD(self, phi, u, b):
+        """
+        C(phi) and D(phi) of the characteristic function for the
+        probability with parameters @u@ and @b@. d(phi) and g(phi) are shared
+        between the two.
+
+        This is the "little Heston trap" form, which is algebraically the
+        same as Heston's but doesn't overflow exp(d*t) for large phi.
+        """
+        rsp = self.rho * self.sig * phi * I
+        d = np.sqrt((rsp - b)**2 - self.sig**2 * (2 * u * phi * I - phi**2))
+        bm = b - rsp - d
+        g = bm / (b - rsp + d)
+        edt = np.exp(-d * self.tenor)
+        C = (self.r * phi * I * self.tenor
+             + (self.mean_reversion * self.mean_variance / self.sig**2)
+             * (bm * self.tenor - 2.0 * np.log((1.0 - g * edt) / (1.0 - g))))
+        D = bm / self.sig**2 * ((1.0 - edt) / (1.0 - g * edt))
+        return C, D
+
+
+    def parameters(self):
+        """(u, b) for P1 and P2."""
+        return ((0.5, self.mean_reversion + self.lam - self.rho * self.sig),
+                (-0.5, self.mean_reversion + self.lam))
+
+
+    def phi_max(self):
+        """Where the integrand for the slowest decaying variance drops below tol."""
+        grid = np.logspace(-2, 6, 400)
+        var = np.min(self.var)
+        top = grid[0]
+        for u, b in self.parameters():
+            C, D = self.CD(grid, u, b)
+            above = np.nonzero(np.abs(np.exp(C + D*var)) / grid > self.tol)[0]
+            if len(above):
+                top = max(top, grid[min(above[-1]+1, len(grid)-1)])
+        return top
+
+
+    def quadrature(self):
+        """Nodes and weights covering (0, phi_max)."""
+        x = np.atleast_1d(self.logspot) - np.log(self.strike)
+        h = min(1.0, np.pi / max(1.0, np.max(np.abs(x[np.isfinite(x)]))))
+        panels = int(np.ceil(self.phi_max() / h))
+        nodes, weights = np.polynomial.legendre.leggauss(self.order)
+        phi = ((np.arange(panels)[:,np.newaxis]
+                + 0.5 * (nodes[np.newaxis,:] + 1)) * h).ravel()
+        w = np.tile(weights * 0.5 * h, panels)
+        return phi, w
+
+
+    def probabilities(self):
+        """P1 and P2 as [spots, vars] arrays."""
+        x = np.atleast_1d(self.logspot) - np.log(self.strike)
+        var = np.atleast_1d(self.var)
+        phi, w = self.quadrature()
+        ret = []
+        for u, b in self.parameters():
+            integral = np.zeros((len(x), len(var)))
+            for i in range(0, len(phi), self.phi_batch):
+                p = phi[i:i+self.phi_batch]
+                C, D = self.CD(p, u, b)
+                # The integrand factors into a variance part and a spot part,
+                # so the sum over phi is a matrix product.
+                fv = np.exp(C[np.newaxis,:] + D[np.newaxis,:]*var[:,np.newaxis])
+                fv *= w[i:i+self.phi_batch] / (I * p)
+                fs = np.exp(I * x[:,np.newaxis] * p[np.newaxis,:])
+                integral += fs.dot(fv.T).real
+            ret.append(0.5 + integral / np.pi)
+        return ret
 
     def __str__(self):
         return '\n'.join([
@@ -782,52 +1441,94 @@ class HestonFundamental(object):
         ])
 
 
+    @staticmethod
+    def bytes_per_point(tol=None):
+        """Scratch memory used by solve() for each (spot, variance) pair."""
+        # P1, P2 and the running integral. The phi temporaries are bounded by
+        # phi_batch separately.
+        return 3 * 8
+
+
+    def cache_key(self):
+        return digest(type(self).__name__, self.spot, self.strike, self.r,
+                      self.var, self.tenor, self.mean_reversion,
+                      self.mean_variance, self.sig, self.rho, self.lam,
+                      self.tol, self.order)
+
+
     def solve(self, cache=True):
-        cache_dir = 'heston_cache'
-        fname = os.path.join(cache_dir, "FUNDAMENTAL_"+str(hash(self.param_str()))+".npy")
+        if cache is True:
+            cache = CACHE
         if cache:
-            # print "Seeking:", fname
-            if os.path.isfile(fname):
-                # print "Loading:", fname
-                return np.load(fname)
-        cols = []
-        vars = np.atleast_1d(self.var)
-        for v in vars:
-            self.var = v
-            self.u = 0.5
-            self.b = self.mean_reversion + self.lam - self.rho * self.sig
-            P1 = self.P()
-
-            self.u = -0.5
-            self.b = self.mean_reversion + self.lam
-            P2 = self.P()
-
-            discount = np.exp(-self.r * self.tenor)
-
-            cols.append(np.maximum(0, self.spot * P1 - self.strike * P2 * discount))
-        self.var = vars
-        ret = np.array(cols).T
+            key = self.cache_key()
+            ret = cache.get(key)
+            if ret is not None:
+                return ret
+        P1, P2 = self.probabilities()
+        discount = np.exp(-self.r * self.tenor)
+        spot = np.atleast_1d(self.spot)[:,np.newaxis]
+        ret = np.maximum(0, spot * P1 - self.strike * P2 * discount)
         if cache:
-            if not os.path.isdir(cache_dir):
-                os.mkdir(cache_dir)
-            np.save(fname, ret)
+            ret = cache.put(key, ret)
         return ret
 
 
-def hs_call_vector(s, k, r, vols, t, kappa, theta, sigma, rho, HFUNC=HestonCos, cache=True):
-    # if s[0] == 0:
-        # ret0 = HFUNC(s[1:], k, r, vols, t, kappa, theta, sigma, rho).solve(cache=cache)
-        # ret0 = np.vstack((np.zeros((1, len(vols))), ret))
-    # else:
-        # ret0 = HFUNC(s, k, r, vols, t, kappa, theta, sigma, rho).solve(cache=cache)
+def _init_hs_worker():
+    # Each worker gets a share of the cores already, don't oversubscribe.
+    ne.set_num_threads(1)
+
+
+def _hs_chunk(args):
+    HFUNC, s, k, r, vols, t, kappa, theta, sigma, rho, cache, kwargs = args
+    return HFUNC(s, k, r, vols, t, kappa, theta, sigma, rho,
+                 **kwargs).solve(cache=cache)
+
+
+def hs_call_vector(s, k, r, vols, t, kappa, theta, sigma, rho, HFUNC=HestonCos,
+                   cache=True, memory_budget=None, processes=None, **kwargs):
+    """
+    Price a [spots, vols] surface, splitting the variance axis into chunks so
+    that the scratch space of each solve stays below @memory_budget@ bytes
+    (default MEMORY_BUDGET).
+
+    Chunks are solved on a pool of @processes@ workers. By default surfaces
+    smaller than POOL_THRESHOLD points stay in this process and larger ones
+    use one worker per core. Extra keyword arguments (e.g. tol) are passed on
+    to HFUNC.
+    """
+    if memory_budget is None:
+        memory_budget = MEMORY_BUDGET
     ret = np.empty((len(s), len(vols)))
     if s[0] == 0:
         ret[0,:] = 0.0
-        for i in range(0, len(vols), 128):
-            ret[1:, i:i+128] = HFUNC(s[1:], k, r, vols[i:i+128], t, kappa, theta, sigma, rho).solve(cache=cache)
+        first = 1
     else:
-        for i in range(0, len(vols), 128):
-            ret[:, i:i+128] = HFUNC(s, k, r, vols[i:i+128], t, kappa, theta, sigma, rho).solve(cache=cache)
+        first = 0
+    spots = s[first:]
+    point_size = HFUNC.bytes_per_point(**kwargs) * max(1, len(spots))
+    step = max(1, int(memory_budget // point_size))
+    chunks = [slice(i, i+step) for i in range(0, len(vols), step)]
+    args = [(HFUNC, spots, k, r, vols[c], t, kappa, theta, sigma, rho, cache,
+             kwargs) for c in chunks]
+
+    if processes is None:
+        if len(s) * len(vols) < POOL_THRESHOLD:
+            processes = 1
+        else:
+            processes = multiprocessing.cpu_count()
+    processes = min(processes, len(chunks))
+    if processes > 1:
+        pool = multiprocessing.Pool(processes, initializer=_init_hs_worker)
+        try:
+            results = pool.map(_hs_chunk, args)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = map(_hs_chunk, args)
+
+    for c, res in zip(chunks, results):
+        ret[first:, c] = res
     return ret
 
 def hs_stream(s, k, r, v, dt, kappa, theta, sigma, rho, HFUNC=HestonCos):
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# coding: utf8
+"""Vectorized Black-Scholes implied volatility."""
+
+from __future__ import division
+
+import numpy as np
+import numexpr as ne
+from scipy.special import ndtr
+
+MAX_TOTAL_VOL = 40.0
+# Rounding error of bs_call_delta() prices relative to delta*s
+NOISE = 16 * np.finfo(float).eps
+
+
+def initial_guess(price, s, k, r, t):
+    """
+    Corrado and Miller's rational approximation to the implied vol. Where it
+    has no real solution we use the small vol asymptote of the out of the
+    money option (the call or, by parity, the put)
+        log(price/min(s, k exp(-rt))) ~ -d**2/2
+    or at the money Brenner and Subrahmanyam's approximation.
+    """
+    x = k * np.exp(-r*t)
+    half = price - 0.5*(s - x)
+    disc = half**2 - (s - x)**2 / np.pi
+    sqrt_t = np.sqrt(t)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cm = (np.sqrt(2*np.pi) / (s + x)
+              * (half + np.sqrt(np.maximum(disc, 0))) / sqrt_t)
+        bs = np.sqrt(2*np.pi) * price / (s * sqrt_t)
+        # Out of the money call or (by parity) put
+        m = np.log(s/x)
+        q = np.sqrt(-2*np.log((price - np.maximum(s - x, 0)) / np.minimum(s, x)))
+        otm = (np.sqrt(q**2 + 2*np.abs(m)) - q) / sqrt_t
+    return np.where((disc >= 0) & (cm > 0), cm, np.where(m != 0, otm, bs))
+
+
+def implied_volatility(price, s, k, r, t, tol=1e-12, maxiter=40):
+    """
+    The Black-Scholes volatility of each call @price@. All arguments are
+    broadcast against each other. Prices outside the no arbitrage bounds
+    max(0, s - k exp(-rt)) < price < s give nan, and so do the points that
+    have not converged after @maxiter@ iterations. For puts, convert the
+    price with put-call parity first.
+
+    Starts from initial_guess() and takes third order Householder steps
+    using the vega. Every point keeps a bracket on the root and bisects if a
+    step leaves it. Points drop out of the iteration once a step changes
+    their vol by less than @tol@ relative.
+    """
+    price, s, k, r, t = np.broadcast_arrays(
+        *[np.asarray(a, dtype=float) for a in (price, s, k, r, t)])
+    shape = price.shape
+    price, s, k, r, t = [a.ravel() for a in (price, s, k, r, t)]
+
+    ret = np.empty(price.size)
+    ret.fill(np.nan)
+    lower = np.maximum(0, s - k*np.exp(-r*t))
+    valid = (price > lower) & (price < s) & (t > 0)
+    idx = np.flatnonzero(valid)
+    price, s, k, r, t = [a[idx] for a in (price, s, k, r, t)]
+
+    # Iterate on the out of the money option, the call or by parity the put,
+    # whose value is not swamped by the intrinsic value.
+    kd = k*np.exp(-r*t)
+    intrinsic = np.maximum(s - kd, 0)
+    otm = price - intrinsic
+
+    vol = initial_guess(price, s, k, r, t)
+    vol = np.where(np.isfinite(vol) & (vol > 0), vol, 0.2)
+    # What the iterations need of s, k, r and t
+    x = np.log(s/kd)
+    sqrt_t = np.sqrt(t)
+    # The price is convex in vol below the inflection point star and
+    # concave above it.
+    star = np.sqrt(2*np.abs(x) / t)
+    # Beyond a total vol of MAX_TOTAL_VOL the call is worth s to machine
+    # precision.
+    lo = np.zeros_like(vol)
+    hi = MAX_TOTAL_VOL / sqrt_t
+    vol = np.minimum(vol, 0.5*hi)
+    noise = NOISE * s
+
+    # numexpr evaluates each expression in one pass over the points, which
+    # matters more than anything else here, and silently gives inf or nan
+    # where vega underflows.
+    e = ne.evaluate
+    for i in range(maxiter):
+        if not idx.size:
+            break
+        d1 = e("x / (vol*sqrt_t) + 0.5*vol*sqrt_t")
+        d2 = e("d1 - vol*sqrt_t")
+        delta = ndtr(d1)
+        nd2 = ndtr(d2)
+        value = e("s*delta - kd*nd2 - intrinsic")
+        f = e("value - otm")
+        vega = e("s*sqrt_t*exp(-0.5*d1**2) * %r" % (1 / np.sqrt(2*np.pi)))
+        # Price is increasing in vol
+        hi = e("where(f > 0, vol, hi)")
+        lo = e("where(f < 0, vol, lo)")
+        # Householder: vomma/vega and d(vomma)/dvol / vega. Far from the root
+        # the higher order terms only slow us down. In the convex part,
+        # which is all of it far out of the money, Newton on log(price) is
+        # much better behaved.
+        h = e("f / vega")
+        hv2 = e("h*d1*d2 / vol")
+        close = e("abs(hv2) < 0.5")
+        convex = e("vol < star")
+        step = e("where(convex, (log(value) - log(otm))*value/vega,"
+                 " where(close, h*(1 - 0.5*hv2)"
+                 " / (1 - hv2 + h**2*((d1*d2)**2 - d1**2 - d2**2 - d1*d2)"
+                 " / (6*vol**2)), h))")
+        # Newton overshoots from above in the concave part, restart those
+        # from the inflection point (Manaster and Koehler).
+        wrong = e("~convex & ~close & (f > 0)")
+        new = e("where(wrong, star, vol - step)")
+        inside = e("(new > lo) & (new < hi)")
+        # Below noise the price can not resolve the vol any further
+        exact = e("abs(f) <= noise*delta")
+        done = e("exact | (inside & ~wrong & (abs(step) <= tol*vol))")
+        vol = e("where(exact, vol, where(inside, new, 0.5*(lo + hi)))")
+        if done.any():
+            ret[idx[done]] = vol[done]
+            keep = ~done
+            (idx, otm, intrinsic, s, kd, x, sqrt_t, star, noise, vol, lo,
+             hi) = [a[keep] for a in (idx, otm, intrinsic, s, kd, x, sqrt_t,
+                                      star, noise, vol, lo, hi)]
+    # The rest did not converge and stay nan
+    return ret.reshape(shape)
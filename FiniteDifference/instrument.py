@@ -0,0 +1,229 @@
+#!/usr/bin/env python
+# coding: utf8
+"""Timing spans and counters for the engine's hot paths.
+
+An Instrument accumulates the seconds and calls of nested, named spans and
+the totals of named counters. Spans nest per thread, so one instrument can
+be shared by threads and used reentrantly; a span's path is its name under
+those of the spans it runs in, e.g. "douglas/solve".
+
+    F.instrument = instrument.Instrument()
+    F.solve_douglas(n, dt)
+    F.instrumentation['spans']['douglas/solve']['seconds']
+
+Nothing is printed unless the instrument has a Reporter. The engines default
+to NULL, which does nothing and hands operators back unwrapped, so the
+solvers' loops run as if uninstrumented.
+"""
+
+from __future__ import division
+
+import sys
+import time
+import threading
+
+
+class Reporter(object):
+    """
+    Prints the time of each span at most @depth@ deep to @stream@ (stdout by
+    default). Progress through the time steps is observers.Progress.
+    """
+    def __init__(self, stream=None, depth=1):
+        self.stream = stream
+        self.depth = depth
+
+
+    def write(self, s):
+        stream = self.stream if self.stream is not None else sys.stdout
+        stream.write(s)
+        stream.flush()
+
+
+    def span(self, path, seconds):
+        if path.count('/') < self.depth:
+            self.write("%s: %fs\n" % (path, seconds))
+
+
+class _Span(object):
+
+    __slots__ = ('instrument', 'name', 'start')
+
+    def __init__(self, instrument, name):
+        self.instrument = instrument
+        self.name = name
+
+
+    def __enter__(self):
+        self.instrument._stack().append(self.name)
+        self.start = time.time()
+        return self
+
+
+    def __exit__(self, *exc):
+        seconds = time.time() - self.start
+        stack = self.instrument._stack()
+        path = '/'.join(stack)
+        stack.pop()
+        self.instrument.add(path, seconds)
+        return False
+
+
+class Timed(object):
+    """
+    @operator@ with its apply() and solve() timed as "apply" and "solve"
+    spans of @instrument@, each counted as a temporary array. Everything
+    else, including setting attributes, goes to the operator.
+    """
+    def __init__(self, operator, instrument):
+        self.__dict__['operator'] = operator
+        self.__dict__['instrument'] = instrument
+
+
+    def __getattr__(self, name):
+        return getattr(self.operator, name)
+
+
+    def __setattr__(self, name, value):
+        setattr(self.operator, name, value)
+
+
+    def apply(self, V, overwrite=False):
+        with self.instrument.span('apply'):
+            if not overwrite:
+                self.instrument.count('temporaries')
+            return self.operator.apply(V, overwrite)
+
+
+    def solve(self, V, overwrite=False):
+        with self.instrument.span('solve'):
+            if not overwrite:
+                self.instrument.count('temporaries')
+            return self.operator.solve(V, overwrite)
+
+
+class Instrument(object):
+    """
+    Accumulates spans and counters, reporting to @reporter@ if it is given.
+    """
+
+    enabled = True
+
+    def __init__(self, reporter=None):
+        self.reporter = reporter
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.reset()
+
+
+    def reset(self):
+        """Forget all spans and counters."""
+        with self._lock:
+            self.spans = {}
+            self.counters = {}
+
+
+    def _stack(self):
+        try:
+            return self._local.stack
+        except AttributeError:
+            self._local.stack = []
+            return self._local.stack
+
+
+    def span(self, name):
+        """A context manager timing what runs in it as span @name@."""
+        return _Span(self, name)
+
+
+    def add(self, path, seconds):
+        """Add a call of @seconds@ to the span at @path@."""
+        with self._lock:
+            s = self.spans.get(path)
+            if s is None:
+                s = self.spans[path] = {'seconds': 0.0, 'calls': 0}
+            s['seconds'] += seconds
+            s['calls'] += 1
+        if self.reporter is not None:
+            self.reporter.span(path, seconds)
+
+
+    def count(self, name, n=1):
+        """Add @n@ to counter @name@."""
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+
+    def step(self, label, k, n):
+        """Step @k@ of @n@ of the solver @label@ is starting."""
+        self.count('steps')
+
+
+    def timed(self, operators):
+        """@operators@ as Timed operators."""
+        return [Timed(o, self) for o in operators]
+
+
+    def results(self):
+        """A copy of the spans and counters, as {"spans": ..., "counters": ...}."""
+        with self._lock:
+            return {'spans': dict((k, dict(v)) for k, v in self.spans.items()),
+                    'counters': dict(self.counters)}
+
+
+class _NullSpan(object):
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_SPAN = _NullSpan()
+
+
+class NullInstrument(object):
+    """An Instrument that records nothing, at next to no cost."""
+
+    enabled = False
+    reporter = None
+
+    def span(self, name):
+        return _NULL_SPAN
+
+
+    def add(self, path, seconds):
+        pass
+
+
+    def count(self, name, n=1):
+        pass
+
+
+    def step(self, label, k, n):
+        pass
+
+
+    def timed(self, operators):
+        return operators
+
+
+    def results(self):
+        return {'spans': {}, 'counters': {}}
+
+
+NULL = NullInstrument()
+
+
+def report(results):
+    """Lines of a table of Instrument.results(), spans by path then counters."""
+    spans = results['spans']
+    width = max([4] + [len(p) for p in spans] + [len(c) for c in results['counters']])
+    yield "%-*s %12s %9s" % (width, 'span', 'seconds', 'calls')
+    for path in sorted(spans):
+        yield "%-*s %12.6f %9i" % (width, path, spans[path]['seconds'],
+                                   spans[path]['calls'])
+    for name, n in sorted(results['counters'].items()):
+        yield "%-*s %12s %9i" % (width, name, '', n)
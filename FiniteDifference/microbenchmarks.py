@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+# coding: utf8
+"""Micro-benchmarks of the BandedOperator primitives.
+
+Times apply, solve, fold_vector, diagonalize, undiagonalize, add_operator,
+vectorized_scale, copy and splice_with on block operators like the engine's:
+some number of blocks of some length, tridiagonal or pentadiagonal, the
+latter folded (diagonalized) or not. Everything is reported in ns per grid
+point, so cases of different sizes compare directly and the primitive that
+dominates a scheme stands out.
+
+    results = microbenchmarks.sweep()
+    for line in microbenchmarks.report(results):
+        print line
+
+The results work with benchmarks.save_json(), save_csv(columns=COLUMNS),
+compare(key=KEY, metric='ns_per_point') and report(key=KEY).
+"""
+
+from __future__ import division
+
+import time
+import itertools as it
+
+import numpy as np
+
+import BandedOperator as BO
+import utils
+
+PRIMITIVES = ('apply', 'solve', 'fold_vector', 'diagonalize',
+              'undiagonalize', 'add_operator', 'vectorized_scale', 'copy',
+              'splice_with')
+
+# What identifies a case in a baseline
+KEY = ('primitive', 'blocks', 'block_len', 'bandwidth', 'folded')
+
+COLUMNS = KEY + ('points', 'ns_per_point', 'seconds', 'calls')
+
+
+def operator(blocks, block_len, bandwidth='tri', folded=False):
+    """
+    The implicit step operator 1 - dt L of a second derivative L on a
+    nonuniform mesh of @block_len@ points, as the schemes solve it, repeated
+    for @blocks@ blocks. "penta" operators have one sided second order first
+    derivatives in the boundary rows, like the engine's free boundaries, so
+    only those use the outer diagonals and they can be folded. @folded@
+    pentadiagonal operators are diagonalized.
+    """
+    vec = utils.sinh_space(1.0, 10.0, 2.0, block_len)
+    if bandwidth == 'tri':
+        B = BO.for_vector(vec, scheme='center', derivative=2, order=2)
+    elif bandwidth == 'penta':
+        B = BO.for_vector(vec, scheme='center', derivative=2, order=2,
+                          force_bandwidth=(-2, 2))
+        d = B.D.data
+        row = dict((o, i) for i, o in enumerate(B.D.offsets))
+        h0 = vec[1] - vec[0]
+        h1 = vec[-1] - vec[-2]
+        for o, c in zip((0, 1, 2), (-3, 4, -1)):
+            d[row[o], o] = c / (2*h0)
+        for o, c in zip((0, -1, -2), (3, -4, 1)):
+            d[row[o], block_len - 1 + o] = c / (2*h1)
+    else:
+        raise ValueError("Bandwidth is 'tri' or 'penta', not %r" % bandwidth)
+    B = (B * -0.01).add(1, inplace=True)
+    B.R = np.random.RandomState(0).random_sample(block_len)
+    B = utils.block_repeat(B, blocks) if blocks > 1 else B
+    if folded:
+        if bandwidth != 'penta':
+            raise ValueError("Only pentadiagonal operators fold.")
+        B.diagonalize()
+    return B
+
+
+def time_calls(f, setup=None, min_time=0.02, max_calls=10000):
+    """
+    Seconds per call of f(setup()) (or f()), the best of runs of calls
+    until @min_time@ has passed, at least one. The setup is not timed.
+    Returns (seconds, calls).
+    """
+    best = np.inf
+    calls = 0
+    spent = 0
+    while calls == 0 or (spent < min_time and calls < max_calls):
+        arg = setup() if setup else None
+        start = time.time()
+        if setup:
+            f(arg)
+        else:
+            f()
+        t = time.time() - start
+        best = min(best, t)
+        spent += t
+        calls += 1
+    return best, calls
+
+
+def primitives(B, bandwidth):
+    """
+    {name: (f, setup)} for time_calls() on operator @B@. Primitives that
+    change the operator get a fresh copy from their setup. Folded operators
+    only get applied, solved, copied and unfolded, as in the engine.
+    """
+    n = B.shape[0]
+    V = np.random.RandomState(1).random_sample(n)
+    ret = {
+        'apply': (lambda: B.apply(V), None),
+        'solve': (lambda: B.solve(V), None),
+        'copy': (lambda: B.copy(), None),
+    }
+    if B.is_folded():
+        ret['fold_vector'] = (lambda: B.fold_vector(V.copy()), None)
+        ret['undiagonalize'] = (lambda C: C.undiagonalize(), B.copy)
+        return ret
+    scale = np.ones(n)
+    other = B.copy()
+    ret['add_operator'] = (lambda: B.add_operator(other), None)
+    ret['vectorized_scale'] = (lambda C: C.vectorized_scale(scale), B.copy)
+    ret['splice_with'] = (lambda: B.splice_with(other, n // 2), None)
+    if bandwidth == 'penta':
+        ret['diagonalize'] = (lambda C: C.diagonalize(), B.copy)
+    return ret
+
+
+def run_case(blocks, block_len, bandwidth, folded, names=PRIMITIVES,
+             min_time=0.02):
+    """Results of each primitive in @names@ that applies to this operator."""
+    B = operator(blocks, block_len, bandwidth, folded)
+    points = B.shape[0]
+    ret = []
+    for name, (f, setup) in sorted(primitives(B, bandwidth).items()):
+        if name not in names:
+            continue
+        seconds, calls = time_calls(f, setup, min_time)
+        ret.append(dict(primitive=name, blocks=blocks, block_len=block_len,
+                        bandwidth=bandwidth, folded=folded, points=points,
+                        ns_per_point=seconds / points * 1e9,
+                        seconds=seconds, calls=calls))
+    return ret
+
+
+def sweep(blocks=(1, 10, 100), block_lens=(100, 1000),
+          bandwidths=('tri', 'penta'), names=PRIMITIVES, min_time=0.02):
+    """
+    run_case() over every combination of @blocks@, @block_lens@ and
+    @bandwidths@, the pentadiagonal ones both unfolded and folded.
+    """
+    ret = []
+    for b, n, bw in it.product(blocks, block_lens, bandwidths):
+        for folded in ((False, True) if bw == 'penta' else (False,)):
+            ret.extend(run_case(b, n, bw, folded, names, min_time))
+    return ret
+
+
+def report(results):
+    """Lines of a table of sweep()'s results."""
+    yield "%-16s %6s %9s %5s %6s %9s %10s" % (
+        'primitive', 'blocks', 'block_len', 'band', 'folded', 'points',
+        'ns/point')
+    for r in results:
+        yield "%-16s %6i %9i %5s %6s %9i %10.2f" % (
+            r['primitive'], r['blocks'], r['block_len'], r['bandwidth'],
+            r['folded'], r['points'], r['ns_per_point'])
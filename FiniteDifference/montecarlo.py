@@ -0,0 +1,599 @@
+#!/usr/bin/env python
+# coding: utf8
+"""Parallel, reproducible Monte Carlo driver.
+
+Paths are split into chunks, each simulated with its own RandomState whose
+seed is derived from the run's seed and the chunk number. The result only
+depends on the seed and the number of chunks, not on which process ran
+which chunk, so a run is bit-reproducible.
+
+In streaming mode each chunk is simulated in fixed size batches folded into
+RunningStats, so memory does not grow with the number of paths. until()
+keeps adding rounds of batches until a target standard error is reached.
+qmc() runs independent randomizations of scrambled Sobol points instead.
+mlmc() is a multilevel estimator over coupled time step levels.
+"""
+
+from __future__ import division
+
+import hashlib
+import itertools as it
+import multiprocessing
+
+import numpy as np
+import numexpr as ne
+from scipy.special import ndtr
+
+import sobol
+
+# Default cap on the number of paths until() will simulate
+MAX_PATHS = 10**9
+
+
+def spawn(seed, n):
+    """
+    @n@ independent seeds derived from @seed@, each an array of uint32 words
+    suitable for np.random.RandomState.
+
+    The child seeds are hashes of (seed, i), in the spirit of numpy's
+    SeedSequence.spawn.
+    """
+    ret = []
+    for i in range(n):
+        h = hashlib.sha256('%r:%i' % (seed, i)).digest()
+        ret.append(np.frombuffer(h, dtype=np.uint32).copy())
+    return ret
+
+
+def split(npaths, chunks):
+    """Sizes of @chunks@ nearly equal parts of @npaths@."""
+    base, extra = divmod(npaths, chunks)
+    return [base + (i < extra) for i in range(chunks)]
+
+
+def batches(npaths, batch_size):
+    """Sizes of consecutive batches of at most @batch_size@ covering @npaths@."""
+    return [min(batch_size, npaths - i) for i in range(0, npaths, batch_size)]
+
+
+class RunningStats(object):
+    """
+    Streaming count, mean and variance along the first axis.
+
+        stats = RunningStats()
+        for batch in batches:
+            stats.push(batch)
+        stats.mean, stats.std, stats.error
+
+    Batches are combined with Chan et al.'s pairwise update of Welford's
+    algorithm, which does not lose precision the way sum and sum of squares
+    do. Two partial results can be merged the same way. For [n, k] batches
+    the co-moments between the k columns are kept too (see covariance). If
+    bin @edges@ are given a histogram of the values (of the first column) is
+    kept as well (values outside the edges are not counted).
+    """
+
+    def __init__(self, edges=None):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.cm = 0.0
+        self.edges = edges
+        self.counts = None if edges is None else np.zeros(len(edges) - 1, dtype=int)
+
+
+    def push(self, x):
+        """Fold the batch @x@ into the statistics."""
+        x = np.asarray(x, dtype=float)
+        n = x.shape[0]
+        if not n:
+            return self
+        mean = x.mean(axis=0)
+        dx = x - mean
+        m2 = (dx**2).sum(axis=0)
+        cm = np.dot(dx.T, dx) if x.ndim == 2 else m2
+        self._combine(n, mean, m2, cm)
+        if self.edges is not None:
+            # Of the first column for [n, k] batches
+            self.counts += np.histogram(x.reshape(n, -1)[:,0], self.edges)[0]
+        return self
+
+
+    def merge(self, other):
+        """Fold in the statistics of another RunningStats."""
+        if other.n:
+            self._combine(other.n, other.mean, other.m2, other.cm)
+        if self.edges is not None:
+            self.counts += other.counts
+        return self
+
+
+    def _combine(self, n, mean, m2, cm):
+        total = self.n + n
+        delta = mean - self.mean
+        weight = self.n * n / total
+        self.mean = self.mean + delta * (n / total)
+        self.m2 = self.m2 + m2 + delta**2 * weight
+        self.cm = self.cm + cm + np.multiply.outer(delta, delta) * weight
+        self.n = total
+
+
+    @property
+    def variance(self):
+        """Population variance, as np.var."""
+        return self.m2 / self.n
+
+
+    @property
+    def covariance(self):
+        """Population covariance matrix of the columns."""
+        return self.cm / self.n
+
+
+    @property
+    def std(self):
+        return np.sqrt(self.variance)
+
+
+    @property
+    def error(self):
+        """Standard error of the mean."""
+        return self.std / np.sqrt(self.n)
+
+
+class PseudoRandom(object):
+    """
+    The QE step's default random source: per step a normal for the spot
+    (Z0), a normal and a uniform for the variance (Z1, u), drawn from
+    @random_state@ as many steps at a time as fit in @memory_budget@ bytes.
+    With @antithetic@ the second half of the paths use -Z and 1 - u of the
+    first half.
+
+    The stream depends on the block size, so for a reproducible run keep
+    the budget (and the batch size) fixed.
+    """
+
+    def __init__(self, random_state, antithetic=False, memory_budget=2**24):
+        self.random_state = random_state
+        self.antithetic = antithetic
+        self.memory_budget = memory_budget
+
+
+    def block(self, nsteps, npaths):
+        """Steps drawn at once: 3 doubles per path and step, the mirror too."""
+        return max(1, min(nsteps, self.memory_budget // (24 * npaths)))
+
+
+    def draws(self, nsteps, npaths):
+        """Yields (Z0, Z1, u) for each of the @nsteps@ steps."""
+        rng = self.random_state
+        block = self.block(nsteps, npaths)
+        if self.antithetic:
+            assert not npaths % 2, "Antithetic paths come in pairs."
+            npaths //= 2
+        for i in range(nsteps):
+            if not i % block:
+                U = rng.random_sample((block, npaths))
+                Z = rng.standard_normal((block*2, npaths))
+                if self.antithetic:
+                    U = np.hstack((U, 1 - U))
+                    Z = np.hstack((Z, -Z))
+            yield Z[i % block], Z[i % block + block], U[i % block]
+
+
+class CoupledNormals(object):
+    """
+    Random source coupling the QE paths of two multilevel levels. The fine
+    level draws a normal for the spot and one for the variance each step
+    (with u = ndtr(Z1), as in sobol.SobolBridge). The @coarse@ level, run on
+    a RandomState in the same initial state, sums consecutive pairs of them,
+    Z = (Za + Zb) / sqrt(2), so both levels follow the same Brownian path.
+    """
+
+    def __init__(self, random_state, coarse=False):
+        self.random_state = random_state
+        self.coarse = coarse
+
+
+    def draws(self, nsteps, npaths):
+        """Yields (Z0, Z1, u) for each of the @nsteps@ steps."""
+        rng = self.random_state
+        for i in range(nsteps):
+            z = rng.standard_normal((2, npaths))
+            if self.coarse:
+                z = (z + rng.standard_normal((2, npaths))) / np.sqrt(2)
+            yield z[0], z[1], ndtr(z[1])
+
+
+class Replicated(object):
+    """
+    Random source feeding @copies@ consecutive blocks of paths the same
+    draws of @source@, for common random number shadow paths (e.g. with a
+    bumped parameter) simulated in the same pass as the paths themselves.
+    """
+
+    def __init__(self, source, copies):
+        self.source = source
+        self.copies = copies
+
+
+    def draws(self, nsteps, npaths):
+        """Yields (Z0, Z1, u) for each of the @nsteps@ steps."""
+        assert not npaths % self.copies, "Each copy has the same paths."
+        for draws in self.source.draws(nsteps, npaths // self.copies):
+            yield tuple(np.tile(x, self.copies) for x in draws)
+
+
+class BarrierMonitor(object):
+    """
+    Monte Carlo callback for a barrier option with (knockin, level)
+    barriers @bottom@ and @top@ (or None): updates the state of every path
+    against both barriers in one numexpr pass over the spots, instead of a
+    pass per barrier.
+
+        monitor = BarrierMonitor(bottom=(False, 80.0), top=(True, 120.0))
+        monitor(s, state)
+        monitor(s, state, hits, step)   # also records first knocks
+
+    @hits@ (ints, negative for not yet) gets @step@ where a path's state
+    changes for the first time. With only knock-out barriers a path never
+    comes back, so "compact" tells the simulation it may drop knocked out
+    paths.
+    """
+
+    def __init__(self, bottom=None, top=None):
+        self.bottom = bottom
+        self.top = top
+        self.levels = {}
+        knockins = []
+        alive = []
+        for name, b, hit, ok in (('bot', bottom, '<=', '>'),
+                                 ('top', top, '>=', '<')):
+            if not b:
+                continue
+            knockin, self.levels[name] = b
+            if knockin:
+                knockins.append("(s %s %s)" % (hit, name))
+            else:
+                alive.append("(s %s %s)" % (ok, name))
+        expr = "state"
+        if knockins:
+            expr = "(state | %s)" % " | ".join(knockins)
+        self.expr = " & ".join([expr] + alive)
+        self.knockin = bool(knockins)
+        self.compact = bool(alive) and not knockins
+
+
+    def __call__(self, s, state, hits=None, step=None):
+        d = dict(self.levels, s=s, state=state)
+        if hits is None:
+            ne.evaluate(self.expr, local_dict=d, out=state)
+            return
+        new = ne.evaluate(self.expr, local_dict=d)
+        d.update(new=new, hits=hits, step=np.array(step, dtype=hits.dtype))
+        ne.evaluate("where((hits < 0) & (new != state), step, hits)",
+                    local_dict=d, out=hits)
+        state[:] = new
+
+
+def _init_worker():
+    # Each worker gets a share of the cores already, don't oversubscribe.
+    ne.set_num_threads(1)
+
+
+def _stats_chunk(args):
+    option, dt, npaths, callback, key, batch_size, edges, options = args
+    if not callback:
+        callback = option.monte_carlo_callback
+    random_state = np.random.RandomState(key)
+    stats = RunningStats(edges)
+    for n in batches(npaths, batch_size):
+        stats.push(option.monte_carlo_samples(dt, n, callback,
+                                              random_state=random_state,
+                                              **options))
+    return stats
+
+
+def _qmc_chunk(args):
+    option, dt, npaths, callback, key, batch_size, options = args
+    if not callback:
+        callback = option.monte_carlo_callback
+    source = sobol.SobolBridge(np.random.RandomState(key))
+    stats = RunningStats()
+    for n in batches(npaths, batch_size):
+        stats.push(option.monte_carlo_samples(dt, n, callback,
+                                              random_source=source,
+                                              **options))
+    return stats
+
+
+def _paths_chunk(args):
+    option, dt, npaths, callback, key = args
+    if not callback:
+        callback = option.monte_carlo_callback
+    return option.monte_carlo_paths(dt, npaths, callback,
+                                    random_state=np.random.RandomState(key))
+
+
+def paths(option, dt, npaths, callback=None, seed=None, processes=None,
+          chunks=None):
+    """
+    Terminal values of @npaths@ paths from option.monte_carlo_paths(),
+    simulated in @chunks@ (default: @processes@) parts on a pool of
+    @processes@ workers (default: one per core) and concatenated in chunk
+    order.
+
+    Without a @seed@ one is drawn from the global numpy state. @callback@
+    must be picklable, None uses the option's own monte_carlo_callback.
+    """
+    if seed is None:
+        seed = np.random.randint(2**31 - 1)
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    if chunks is None:
+        chunks = processes
+    chunks = max(1, min(chunks, npaths))
+    args = [(option, dt, n, callback, key)
+            for n, key in zip(split(npaths, chunks), spawn(seed, chunks))]
+
+    return np.concatenate(_run(_paths_chunk, args, processes))
+
+
+def stats(option, dt, npaths, callback=None, seed=None, processes=None,
+          chunks=None, batch_size=2**16, edges=None, options={}):
+    """
+    RunningStats of option.monte_carlo_samples() (by default the discounted
+    payoffs) of @npaths@ paths, simulated like paths() but @batch_size@ paths
+    at a time. @options@ are passed on to monte_carlo_samples(). Chunks are
+    merged in order, so the result is reproducible for a given seed and
+    number of chunks.
+    """
+    if seed is None:
+        seed = np.random.randint(2**31 - 1)
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    if chunks is None:
+        chunks = processes
+    chunks = max(1, min(chunks, npaths))
+    args = [(option, dt, n, callback, key, batch_size, edges, options)
+            for n, key in zip(split(npaths, chunks), spawn(seed, chunks))]
+    ret = RunningStats(edges)
+    for s in _run(_stats_chunk, args, processes):
+        ret.merge(s)
+    return ret
+
+
+def until(option, dt, target_error, max_paths=MAX_PATHS, callback=None,
+          seed=None, processes=None, chunks=None, batch_size=2**16,
+          edges=None, options={}, error=None):
+    """
+    RunningStats like stats(), but simulated in rounds of @chunks@ batches
+    of @batch_size@ paths until the half width of the 95% confidence
+    interval, 1.96 * error, is at most @target_error@ or @max_paths@ paths
+    have been used. @error@(stats) gives the standard error of the estimate
+    (default stats.error) and is evaluated in this process.
+
+    Round i of chunk j draws from a stream derived from (seed, i) and j, so
+    the result is reproducible for a given seed and number of chunks.
+    """
+    if seed is None:
+        seed = np.random.randint(2**31 - 1)
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    if chunks is None:
+        chunks = processes
+    if error is None:
+        error = lambda stats: stats.error
+    processes = min(processes, chunks)
+    pool = None
+    if processes > 1:
+        pool = multiprocessing.Pool(processes, initializer=_init_worker)
+    ret = RunningStats(edges)
+    done = 0
+    try:
+        for i in it.count():
+            n = min(chunks * batch_size, max_paths - done)
+            if n <= 0:
+                break
+            args = [(option, dt, m, callback, key, batch_size, edges, options)
+                    for m, key in zip(split(n, chunks), spawn((seed, i), chunks))
+                    if m]
+            for s in (pool.map if pool else map)(_stats_chunk, args):
+                ret.merge(s)
+            done += n
+            if 1.96 * error(ret) <= target_error:
+                break
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+    return ret
+
+
+def qmc(option, dt, npaths, randomizations=16, callback=None, seed=None,
+        processes=None, batch_size=2**16, options={}):
+    """
+    A RunningStats of option.monte_carlo_samples() for each of
+    @randomizations@ independent scramblings of the first @npaths@ points
+    (best a power of two) of a Sobol sequence, see sobol.SobolBridge. The
+    randomizations are run on a pool like the chunks of stats().
+
+    Each randomization is an unbiased estimate; the error of their average
+    is the standard error over randomizations, not the one of the pooled
+    points.
+    """
+    if seed is None:
+        seed = np.random.randint(2**31 - 1)
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    args = [(option, dt, npaths, callback, key, batch_size, options)
+            for key in spawn(seed, randomizations)]
+    return _run(_qmc_chunk, args, processes)
+
+
+def step_size(t, steps):
+    """A dt for which the simulations (int(t/dt) steps) take @steps@ steps."""
+    dt = t / steps
+    while int(t / dt) < steps:
+        dt = np.nextafter(dt, 0)
+    return dt
+
+
+def _level_chunk(args):
+    option, steps, coupled, npaths, callback, key, batch_size, options = args
+    if not callback:
+        callback = option.monte_carlo_callback
+    t = option.tenor
+    random_state = np.random.RandomState(key)
+    stats = RunningStats()
+    for n in batches(npaths, batch_size):
+        start = random_state.get_state()
+        y = option.monte_carlo_samples(step_size(t, steps), n, callback,
+                                       random_source=CoupledNormals(random_state),
+                                       **options)
+        if coupled:
+            replay = np.random.RandomState()
+            replay.set_state(start)
+            y = y - option.monte_carlo_samples(
+                step_size(t, steps // 2), n, callback,
+                random_source=CoupledNormals(replay, coarse=True), **options)
+        stats.push(y)
+    return stats
+
+
+def _rate(values):
+    """Decay rate a of |@values@| ~ 2**(-a*level), from a least squares fit."""
+    values = np.abs(values)
+    if len(values) < 2 or not values.all():
+        return 1.0
+    return -np.polyfit(np.arange(len(values)), np.log2(values), 1)[0]
+
+
+def mlmc(option, dt, target_error, max_levels=10, initial_paths=2**10,
+         callback=None, seed=None, processes=None, chunks=None,
+         batch_size=2**14, options={}):
+    """
+    Multilevel Monte Carlo (Giles) over time steps @dt@, @dt@/2, @dt@/4, ...
+
+    Level 0 is the plain estimate at @dt@, level l > 0 the mean difference
+    of the payoffs of paths at step dt/2**l and of the same paths (see
+    CoupledNormals) at twice that step. Paths per level are chosen to
+    minimise the cost, in simulated steps, for a standard error of
+    @target_error@/(1.96 sqrt(2)), and levels are added (up to @max_levels@
+    beyond 0) until the bias estimated from the decay of the level means is
+    below @target_error@/sqrt(2). The 95% interval then has half width
+    @target_error@ including discretisation bias.
+
+    Round i of level l draws from streams derived from (seed, l, i), split
+    over @chunks@ like stats(). @options@ go to option.monte_carlo_samples()
+    and must leave one sample per path; bridge=True makes barrier payoffs
+    continuous in the path, which the levels need to decay quickly. Returns a dict with "expected", "error",
+    "bias", "cost", "converged" and "levels", a list of dicts with "steps",
+    "dt", "n", "mean", "variance" and "cost" per path.
+    """
+    if seed is None:
+        seed = np.random.randint(2**31 - 1)
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    if chunks is None:
+        chunks = processes
+    t = option.tenor
+    base = max(1, int(round(t / dt)))
+    standard_error = target_error / (1.96 * np.sqrt(2))
+    max_bias = target_error / np.sqrt(2)
+
+    steps = [base, 2*base, 4*base]
+    # Fine and coarse steps per path
+    costs = [base, 3*base, 6*base]
+    stats = [RunningStats() for s in steps]
+    rounds = [0 for s in steps]
+    extra = [initial_paths for s in steps]
+    converged = False
+
+    processes = min(processes, chunks)
+    pool = None
+    if processes > 1:
+        pool = multiprocessing.Pool(processes, initializer=_init_worker)
+    try:
+        while True:
+            for l, n in enumerate(extra):
+                if n <= 0:
+                    continue
+                args = [(option, steps[l], l > 0, m, callback, key, batch_size,
+                         options)
+                        for m, key in zip(split(n, chunks),
+                                          spawn((seed, l, rounds[l]), chunks))
+                        if m]
+                for s in (pool.map if pool else map)(_level_chunk, args):
+                    stats[l].merge(s)
+                rounds[l] += 1
+            variances = [s.variance for s in stats]
+            means = [s.mean for s in stats]
+            # Don't trust a fine level variance above the trend of the
+            # coarser ones.
+            beta = max(0.5, _rate(variances[1:]))
+            alpha = max(0.5, _rate(means[1:]))
+            for l in range(2, len(stats)):
+                variances[l] = max(variances[l], variances[l-1] / 2**beta)
+            extra = _allocate(variances, costs, [s.n for s in stats],
+                              standard_error)
+            if any(e > 0.01 * s.n for e, s in zip(extra, stats)):
+                continue
+            bias = (max(abs(means[-1]), abs(means[-2]) / 2**alpha)
+                    / (2**alpha - 1))
+            if bias <= max_bias:
+                converged = True
+                break
+            if len(stats) > max_levels:
+                break
+            steps.append(2 * steps[-1])
+            costs.append(2 * costs[-1])
+            stats.append(RunningStats())
+            rounds.append(0)
+            variances.append(variances[-1] / 2**beta)
+            extra = _allocate(variances, costs, [s.n for s in stats],
+                              standard_error)
+            extra[-1] = max(extra[-1], initial_paths)
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+
+    levels = [{ "steps": st
+              , "dt": step_size(t, st)
+              , "n": s.n
+              , "mean": s.mean
+              , "variance": s.variance
+              , "cost": c
+              } for st, s, c in zip(steps, stats, costs)]
+    return { "expected": sum(s.mean for s in stats)
+           , "error": np.sqrt(sum(s.variance / s.n for s in stats))
+           , "bias": bias
+           , "cost": sum(s.n * c for s, c in zip(stats, costs))
+           , "converged": converged
+           , "levels": levels
+           }
+
+
+def _allocate(variances, costs, done, standard_error):
+    """
+    Extra paths per level for the cheapest allocation with standard error
+    @standard_error@: n_l ~ sqrt(V_l / C_l) sum_k sqrt(V_k C_k).
+    """
+    total = sum(np.sqrt(v * c) for v, c in zip(variances, costs))
+    return [max(0, int(np.ceil(np.sqrt(v / c) * total / standard_error**2)) - n)
+            for v, c, n in zip(variances, costs, done)]
+
+
+def _run(f, args, processes):
+    """map(f, args), on a pool if there is more than one process to use."""
+    processes = min(processes, len(args))
+    if processes > 1:
+        pool = multiprocessing.Pool(processes, initializer=_init_worker)
+        try:
+            return pool.map(f, args)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        return map(f, args)
@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+# coding: utf8
+"""Observers of the engine's time stepping.
+
+An observer's on_start() runs before the first step of a solve, on_step()
+before every @every@'th step (never if @every@ is 0 or None) and
+on_finish() after the last one taken. on_step() returning True stops the
+solve early, with the domain as it is.
+
+    F.observers = [observers.NaNGuard(), observers.Progress()]
+    F.solve_douglas(n, dt)
+
+The engines have no observers by default, so their loops check nothing
+and print nothing.
+"""
+
+from __future__ import division
+
+import sys
+import time
+import warnings
+
+import numpy as np
+
+
+class Observer(object):
+    """The interface, doing nothing."""
+
+    every = 1
+
+    def on_start(self, engine, label, n, dt, V):
+        """Solver @label@ is about to take @n@ steps of @dt@ from @V@."""
+        pass
+
+
+    def on_step(self, engine, k, V):
+        """@V@ is the domain before step @k@. Return True to stop."""
+        pass
+
+
+    def on_finish(self, engine, k, V):
+        """@V@ is the result of the solve, after @k@ steps."""
+        pass
+
+
+def start(obs, engine, label, n, dt, V):
+    for o in obs:
+        o.on_start(engine, label, n, dt, V)
+
+
+def step(obs, engine, k, V):
+    """Notify those of @obs@ due at step @k@, True if any of them stops."""
+    stop = False
+    for o in obs:
+        if o.every and not k % o.every:
+            stop = o.on_step(engine, k, V) or stop
+    return stop
+
+
+def finish(obs, engine, k, V):
+    for o in obs:
+        o.on_finish(engine, k, V)
+
+
+class NaNGuard(Observer):
+    """
+    Stops the solve (or raises FloatingPointError if @action@ is "raise")
+    when the domain is no longer finite, checked every @every@ steps.
+
+    @check@ is "sample" to look at @samples@ points spread over the domain
+    (a NaN spreads over the grid within a few steps), "checksum" to sum the
+    domain, which any NaN or infinity spoils, or "full" for
+    np.isfinite(V).all(). The step it failed at is left in @failed@.
+    """
+
+    def __init__(self, every=10, check='sample', samples=64, action='stop'):
+        if check not in ('sample', 'checksum', 'full'):
+            raise ValueError("check is 'sample', 'checksum' or 'full', not %r"
+                             % (check,))
+        if action not in ('stop', 'raise'):
+            raise ValueError("action is 'stop' or 'raise', not %r" % (action,))
+        self.every = every
+        self.check = check
+        self.samples = samples
+        self.action = action
+        self.failed = None
+
+
+    def on_start(self, engine, label, n, dt, V):
+        self.label = label
+        self.n = n
+        self.dt = dt
+        self.failed = None
+        self.idx = np.linspace(0, V.size - 1, min(self.samples, V.size)).astype(int)
+
+
+    def finite(self, V):
+        if self.check == 'sample':
+            return np.isfinite(V.ravel()[self.idx]).all()
+        elif self.check == 'checksum':
+            return np.isfinite(V.sum())
+        return np.isfinite(V).all()
+
+
+    def on_step(self, engine, k, V):
+        if self.finite(V):
+            return False
+        self.failed = k
+        msg = "%s fail @ t = %f (%i steps)" % (self.label, self.dt * k, k)
+        if self.action == 'raise':
+            raise FloatingPointError(msg)
+        warnings.warn(msg, RuntimeWarning)
+        return True
+
+
+class Progress(Observer):
+    """
+    Prints the percentage of steps done every @every@ steps (a tenth of
+    the solve by default) to @stream@ (stdout by default).
+    """
+
+    def __init__(self, every=None, stream=None):
+        self.interval = every
+        self.every = every
+        self.stream = stream
+
+
+    def write(self, s):
+        stream = self.stream if self.stream is not None else sys.stdout
+        stream.write(s)
+        stream.flush()
+
+
+    def on_start(self, engine, label, n, dt, V):
+        self.n = n
+        self.every = self.interval or max(1, int(n / 10))
+        self.write("%s:\t" % label)
+
+
+    def on_step(self, engine, k, V):
+        self.write("%i " % int(k * 100.0 / self.n))
+
+
+    def on_finish(self, engine, k, V):
+        self.write("\n")
+
+
+class Snapshots(Observer):
+    """
+    Keeps a copy of the domain every @every@ steps and at the end, as
+    (steps taken, time to expiry, V) in @snapshots@, across solves.
+    """
+
+    def __init__(self, every=1):
+        self.every = every
+        self.snapshots = []
+
+
+    def on_start(self, engine, label, n, dt, V):
+        self.n = n
+        self.dt = dt
+
+
+    def on_step(self, engine, k, V):
+        self.snapshots.append((k, (self.n - k) * self.dt, V.copy()))
+
+
+    def on_finish(self, engine, k, V):
+        self.snapshots.append((k, (self.n - k) * self.dt, V.copy()))
+
+
+class Timer(Observer):
+    """
+    Times each solve, appending {"label", "steps", "seconds",
+    "seconds_per_step"} to @runs@.
+    """
+
+    every = 0
+
+    def __init__(self):
+        self.runs = []
+
+
+    def on_start(self, engine, label, n, dt, V):
+        self.label = label
+        self.start = time.time()
+
+
+    def on_finish(self, engine, k, V):
+        seconds = time.time() - self.start
+        self.runs.append({'label': self.label, 'steps': k,
+                          'seconds': seconds,
+                          'seconds_per_step': seconds / k if k else 0.0})
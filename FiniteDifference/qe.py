@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# coding: utf8
+"""Andersen's quadratic exponential (QE) discretisation of the Heston model.
+
+Used by HestonOption's Monte Carlo and by thetamc.py. Everything that only
+depends on the model and the step size is computed once; each step is then
+four numexpr passes into preallocated buffers, with the choice between the
+quadratic and exponential branches made elementwise inside the kernels.
+"""
+
+from __future__ import division
+
+import numpy as np
+import numexpr as ne
+
+# Ratio of variance to squared mean of the next variance below which the
+# quadratic branch is used
+SHI_CRT = 1.5
+
+# Variance ratio shi = s2/m**2 from Andersen's (17) - (19)
+_SHI = "(V*s2A + s2B) / (mA + ekdt*V)**2"
+# b**2 of the quadratic branch, zero where it is not used
+_B2 = "where(shi <= crt, 2/shi - 1 + sqrt(2/shi*(2/shi - 1)), 0)"
+# The next variance, quadratic or exponential branch
+_VDT = ("where(shi <= crt,"
+        " (mA + ekdt*V) / (1 + b2) * (sqrt(b2) + Z1)**2,"
+        " where(u > (shi - 1)/(shi + 1),"
+        "  log(2/(shi + 1) / (1 - u)) * (mA + ekdt*V) * (shi + 1)/2, 0))")
+# The spot, with Andersen's martingale corrected drift K0*. Of the two
+# branches' drift corrections
+#   -A b2 a/(1 - 2 A a) + log(1 - 2 A a)/2    and    -log(p + bet (1-p)/(bet-A))
+# with a = m/(1 + b2), p = (shi-1)/(shi+1) and bet = (1-p)/m, the logs share
+# one evaluation.
+_SPOT = ("S * exp(rdt + C1*V + C2*Vdt + C3*sqrt(gmm1*V + gmm2*Vdt)*Z0 - K1*V"
+         " + where(shi <= crt, -A*b2*(mA + ekdt*V)"
+         "  / (1 + b2 - 2*A*(mA + ekdt*V)), 0)"
+         " - 0.5*log(where(shi <= crt,"
+         "  (1 + b2) / (1 + b2 - 2*A*(mA + ekdt*V)),"
+         "  ((shi - 1)/(shi + 1) + 2/(shi + 1) / (mA + ekdt*V) * 2/(shi + 1)"
+         "   / (2/(shi + 1) / (mA + ekdt*V) - A))**2)))")
+
+class QEStepper(object):
+    """
+    QE steps of size @dt@ for the Heston model with interest rate @r@, mean
+    reversion @kappa@ to @theta@, vol of variance @sigma@ and correlation
+    @rho@.
+
+        stepper = QEStepper(r, kappa, theta, sigma, rho, dt)
+        for s, v, s_prev, v_prev in stepper.run(s0, v0, nsteps, npaths, source):
+            ...
+
+    The random source is a montecarlo.PseudoRandom or anything with the
+    same draws() method.
+    """
+    # Weights of the start and end variance in the integrated variance,
+    # central discretisation
+    gmm1 = 0.5
+    gmm2 = 0.5
+
+    def __init__(self, r, kappa, theta, sigma, rho, dt):
+        self.dt = dt
+        gmm1, gmm2 = self.gmm1, self.gmm2
+        ekdt = np.exp(-kappa*dt)
+        c = {}
+        c['ekdt'] = ekdt
+        # Mean and variance of the next variance, (17) and (18)
+        c['mA'] = theta * (1 - ekdt)
+        c['s2A'] = sigma**2 * ekdt * (1 - ekdt) / kappa
+        c['s2B'] = theta * sigma**2 * (1 - ekdt)**2 / (2*kappa)
+        # Andersen p19, C1 - K1, C2 - K2, C3 - sqrt(K3/gmm1)
+        C1 = gmm1*dt*(kappa*rho/sigma - 0.5) - rho/sigma
+        C2 = gmm2*dt*(kappa*rho/sigma - 0.5) + rho/sigma
+        C3 = np.sqrt((1 - rho**2)*dt)
+        c['C1'], c['C2'], c['C3'] = C1, C2, C3
+        # p20, A
+        c['A'] = C2 + 0.5*C3**2*gmm2
+        c['K1'] = C1 + 0.5*C3**2*gmm1
+        c['rdt'] = r*dt
+        c['gmm1'], c['gmm2'] = gmm1, gmm2
+        c['crt'] = SHI_CRT
+        self.constants = c
+
+
+    def step(self, S, V, Z0, Z1, u, S_out, V_out):
+        """
+        One step from spots @S@ and variances @V@ into @S_out@ and @V_out@
+        with the spot normals @Z0@ and variance normals @Z1@ / uniforms @u@.
+        """
+        n = len(S)
+        if getattr(self, '_n', None) != n:
+            self._shi = np.empty(n)
+            self._b2 = np.empty(n)
+            self._n = n
+        d = dict(self.constants, S=S, V=V, Z0=Z0, Z1=Z1, u=u,
+                 shi=self._shi, b2=self._b2, Vdt=V_out)
+        ne.evaluate(_SHI, local_dict=d, out=self._shi)
+        ne.evaluate(_B2, local_dict=d, out=self._b2)
+        ne.evaluate(_VDT, local_dict=d, out=V_out)
+        ne.evaluate(_SPOT, local_dict=d, out=S_out)
+
+
+    def compact(self, keep):
+        """
+        Drop the paths where the boolean @keep@ is False from the next step
+        of run() on.
+        """
+        rows = np.arange(len(keep)) if self.rows is None else self.rows
+        self.rows = rows[keep]
+        self._keep = keep
+
+
+    def run(self, S0, V0, nsteps, npaths, random_source):
+        """
+        Yields (S, V, S_prev, V_prev) after each of @nsteps@ steps of
+        @npaths@ paths started at @S0@, @V0@ (scalars or one per path). The
+        arrays are buffers reused by the following steps, copy them to keep
+        them. The step's (Z0, Z1, u) are in self.draws meanwhile.
+
+        After compact() the following steps only simulate the kept paths,
+        self.rows are their numbers.
+        """
+        S = np.empty(npaths)
+        V = np.empty(npaths)
+        S[:] = S0
+        V[:] = V0
+        S_next = np.empty(npaths)
+        V_next = np.empty(npaths)
+        self.rows = None
+        self._keep = None
+        for Z0, Z1, u in random_source.draws(nsteps, npaths):
+            if self._keep is not None:
+                S, V = S[self._keep], V[self._keep]
+                S_next = np.empty_like(S)
+                V_next = np.empty_like(V)
+                self._keep = None
+            if self.rows is not None:
+                # The draws do not depend on the compaction
+                Z0, Z1, u = Z0[self.rows], Z1[self.rows], u[self.rows]
+            self.draws = Z0, Z1, u
+            self.step(S, V, Z0, Z1, u, S_next, V_next)
+            S, S_next = S_next, S
+            V, V_next = V_next, V
+            yield S, V, S_next, V_next
@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+# coding: utf8
+"""On-disk cache for expensive array results (analytical reference surfaces).
+
+Entries are addressed by a digest of the exact inputs, written atomically so
+that parallel workers can share a directory, evicted least recently used
+first once the directory grows past a size limit, and fronted by a small
+in-process tier. Hits from disk are memory mapped read-only.
+"""
+
+from __future__ import division
+
+import os
+import errno
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+def digest(*parts):
+    """
+    A stable hex digest of @parts@.
+
+    Floats are hashed by their exact bit pattern and arrays by dtype, shape
+    and raw contents, so the key does not depend on print precision or on
+    the interpreter's hash seed.
+    """
+    h = hashlib.sha1()
+    for p in parts:
+        if isinstance(p, basestring):
+            h.update('s%i:' % len(p))
+            h.update(p)
+        elif p is None:
+            h.update('n:')
+        elif np.isscalar(p):
+            h.update('f:')
+            h.update(np.float64(p).tostring())
+        else:
+            a = np.ascontiguousarray(p)
+            h.update('a%s%s:' % (a.dtype.str, a.shape))
+            h.update(a.tostring())
+    return h.hexdigest()
+
+
+class ResultCache(object):
+    """
+    Content addressed array cache.
+
+        cache = ResultCache('heston_cache')
+        key = digest('HestonCos', S, K, r, ...)
+        ret = cache.get(key)
+        if ret is None:
+            ret = cache.put(key, expensive())
+    """
+
+    def __init__(self, directory='heston_cache', max_bytes=2**30,
+                 memory_bytes=2**27):
+        """
+        @max_bytes@ bounds the total size of the .npy files in @directory@,
+        @memory_bytes@ the arrays held in the in-process tier. Either can be 0
+        to disable that tier.
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.memory_bytes = memory_bytes
+        self._memory = OrderedDict()
+        self._memory_used = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+
+    def __getstate__(self):
+        # Worker processes get the same directory but their own memory tier
+        d = dict(self.__dict__)
+        d['_memory'] = OrderedDict()
+        d['_memory_used'] = 0
+        del d['_lock']
+        return d
+
+
+    def __setstate__(self, d):
+        self.__dict__.update(d)
+        self._lock = threading.Lock()
+
+
+    def path(self, key):
+        return os.path.join(self.directory, key + ".npy")
+
+
+    def get(self, key):
+        """The cached array for @key@ or None."""
+        with self._lock:
+            if key in self._memory:
+                ret = self._memory.pop(key)
+                self._memory[key] = ret
+                self.hits += 1
+                return ret
+        ret = None
+        if self.max_bytes:
+            fname = self.path(key)
+            try:
+                ret = np.load(fname, mmap_mode='r')
+                # Mark as recently used for eviction
+                os.utime(fname, None)
+            except (IOError, OSError, ValueError):
+                ret = None
+        with self._lock:
+            if ret is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if ret is not None:
+            self._remember(key, ret)
+        return ret
+
+
+    def put(self, key, arr):
+        """
+        Store @arr@ under @key@ and return a read-only copy of it, the same
+        thing a later get() returns.
+        """
+        frozen = np.array(arr)
+        frozen.flags.writeable = False
+        self._remember(key, frozen)
+        if self.max_bytes:
+            self._write(key, frozen)
+            self.evict()
+        return frozen
+
+
+    def _remember(self, key, arr):
+        if arr.nbytes > self.memory_bytes:
+            return
+        with self._lock:
+            if key in self._memory:
+                self._memory_used -= self._memory.pop(key).nbytes
+            self._memory[key] = arr
+            self._memory_used += arr.nbytes
+            while self._memory_used > self.memory_bytes:
+                _, old = self._memory.popitem(last=False)
+                self._memory_used -= old.nbytes
+
+
+    def _write(self, key, arr):
+        try:
+            os.makedirs(self.directory)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        # Write to a private file and rename it into place so that readers
+        # never see a partial entry. Concurrent writers of the same key
+        # produce identical contents, so the last rename winning is fine.
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix='.' + key,
+                                   suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.save(f, arr)
+            os.rename(tmp, self.path(key))
+        except:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
+
+
+    def entries(self):
+        """(mtime, size, path) of every entry on disk, oldest first."""
+        ret = []
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return ret
+        for name in names:
+            if not name.endswith('.npy'):
+                continue
+            fname = os.path.join(self.directory, name)
+            try:
+                st = os.stat(fname)
+            except OSError:
+                # Evicted by somebody else
+                continue
+            ret.append((st.st_mtime, st.st_size, fname))
+        ret.sort()
+        return ret
+
+
+    def evict(self):
+        """Remove least recently used entries until we are under max_bytes."""
+        entries = self.entries()
+        total = sum(e[1] for e in entries)
+        for mtime, size, fname in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(fname)
+            except OSError:
+                pass
+            total -= size
+
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._memory_used = 0
+        for mtime, size, fname in self.entries():
+            try:
+                os.remove(fname)
+            except OSError:
+                pass
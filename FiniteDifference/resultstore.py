@@ -0,0 +1,563 @@
+#!/usr/bin/env python
+# coding: utf8
+"""Columnar on-disk store for sweep and convergence results.
+
+A store is a directory of shards, one per append(). A shard holds an index,
+a structured .npy of the scalar columns (the parameters of a run, its
+price, its timings), and for each column holding an array per run (a
+convergence sequence, a price surface) the concatenated values with their
+offsets and shapes. Shards are written to a private directory and renamed
+into place, so readers never see a partial one and several processes can
+append to the same store. Files are loaded memory mapped, and the indexes of
+all shards form the table that select() queries.
+
+    store = ResultStore('data_convergence/store')
+    store.append(rows)
+    hv = store.select(scheme='hv', moneyness=1.06, rtol=1e-3)
+    prices = store.table(hv)['price']
+    surface = store.array('surface', hv[0])
+
+None is stored as NaN in float columns and as '' in string columns. Integer
+and boolean columns keep their type: a None there is stored as 0 or False
+and marked in a mask of the column's missing values (see missing()). All
+of them come back as None from rows(). compact() merges the shards into
+one, which makes loading a store of many small appends a single file open.
+"""
+
+from __future__ import division
+
+import os
+import re
+import ast
+import errno
+import shutil
+import bisect
+import tempfile
+import numbers
+from collections import OrderedDict
+
+import numpy as np
+
+SHARD = re.compile(r'^shard-(\d+)$')
+
+# The files of a column holding an array per row
+_PARTS = ('data', 'offsets', 'shape')
+
+# Suffix of the index field masking the missing values of a column. Column
+# names cannot contain '.', so it cannot clash with one.
+_MASK = '.missing'
+
+
+def option_columns(option):
+    """The model parameters of @option@ as a row of scalar columns."""
+    rate = option.interest_rate
+    ret = dict(product=option.Type,
+               spot=option.spot,
+               strike=option.strike,
+               moneyness=option.spot / option.strike,
+               interest_rate=getattr(rate, 'value', rate),
+               variance=option.variance.value,
+               mean_variance=option.variance.mean,
+               mean_reversion=option.variance.reversion,
+               vol_of_variance=option.variance.volatility,
+               correlation=getattr(option, 'correlation', None),
+               tenor=option.tenor,
+               top=None)
+    top = getattr(option, 'top', None)
+    if top is not None:
+        ret['top'] = top[1]
+    return ret
+
+
+def _is_array(v):
+    return isinstance(v, (np.ndarray, list, tuple)) and np.ndim(v) > 0
+
+
+def _scalar_column(name, values):
+    """
+    The values of one column as an array and the mask of its Nones, which
+    is None for float and string columns or if there are no Nones. None if
+    the values are all None.
+    """
+    present = [v for v in values if v is not None]
+    if not present:
+        return None
+    missing = None
+    if len(present) < len(values):
+        missing = np.array([v is None for v in values])
+    if all(isinstance(v, (bool, np.bool_)) for v in present):
+        return (np.array([False if v is None else v for v in values],
+                         dtype=bool), missing)
+    if all(isinstance(v, numbers.Integral) for v in present):
+        return (np.array([0 if v is None else v for v in values],
+                         dtype=np.int64), missing)
+    if all(isinstance(v, numbers.Real) for v in present):
+        return (np.array([np.nan if v is None else v for v in values],
+                         dtype=np.float64), None)
+    if all(isinstance(v, basestring) for v in present):
+        return (np.array(['' if v is None else
+                          v.encode('utf8') if isinstance(v, unicode) else v
+                          for v in values]), None)
+    raise ValueError("Column %s: cannot store %r" % (name, present[0]))
+
+
+def _array_column(name, values):
+    """(data, offsets, shape) of a column holding an array per row."""
+    arrays = [None if v is None else np.asarray(v) for v in values]
+    present = [a for a in arrays if a is not None]
+    ndim = max(a.ndim for a in present)
+    dtype = np.result_type(*present)
+    if dtype.kind not in 'biuf':
+        raise ValueError("Column %s: cannot store arrays of %s" % (name, dtype))
+    # -1 pads the shape of lower dimensional arrays and marks a None
+    shape = -np.ones((len(arrays), ndim), dtype=np.int64)
+    offsets = np.zeros(len(arrays) + 1, dtype=np.int64)
+    for i, a in enumerate(arrays):
+        if a is not None:
+            shape[i, :a.ndim] = a.shape
+            offsets[i + 1] = a.size
+    offsets = np.cumsum(offsets)
+    data = np.concatenate([a.astype(dtype).ravel() for a in present])
+    return data, offsets, shape
+
+
+def _load(fname):
+    try:
+        return np.load(fname, mmap_mode='r')
+    except ValueError:
+        # An empty array cannot be memory mapped
+        return np.load(fname)
+
+
+def _blank(dtype, n):
+    """@n@ missing values of a column of @dtype@."""
+    if dtype.kind == 'S':
+        return np.zeros(n, dtype='S1')
+    if dtype.kind == 'f':
+        return np.nan * np.ones(n)
+    return np.zeros(n, dtype=dtype)
+
+
+def _concat(parts):
+    """
+    The columns and the masks of missing values of @parts@, (columns,
+    masks, rows) triples, one after the other, filling in the columns a
+    part lacks.
+    """
+    parts = [p for p in parts if p[2]]
+    dtypes = {}
+    for columns, masks, n in parts:
+        for name, col in columns.items():
+            dtypes.setdefault(name, col.dtype)
+    ret = {}
+    ret_masks = {}
+    for name, dtype in dtypes.items():
+        cols = []
+        missing = []
+        for columns, masks, n in parts:
+            if name in columns:
+                cols.append(columns[name])
+                missing.append(masks[name] if name in masks
+                               else np.zeros(n, dtype=bool))
+            else:
+                cols.append(_blank(dtype, n))
+                missing.append(np.ones(n, dtype=bool))
+        col = ret[name] = np.concatenate(cols)
+        missing = np.concatenate(missing)
+        if not missing.any():
+            continue
+        # Parts of different types may have been promoted to float or
+        # string, which hold missing values themselves.
+        if col.dtype.kind == 'f':
+            col[missing] = np.nan
+        elif col.dtype.kind == 'S':
+            col[missing] = ''
+        else:
+            ret_masks[name] = missing
+    return ret, ret_masks
+
+
+class _Shard(object):
+    """
+    One shard: its index of scalar columns, memory mapped, and the arrays,
+    mapped when first asked for.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.index = _load(os.path.join(path, 'index.npy'))
+        self.n = len(self.index)
+        self._names = None
+        self._arrays = {}
+
+
+    @property
+    def columns(self):
+        return dict((name, self.index[name]) for name in self.index.dtype.names
+                    if not name.endswith(_MASK))
+
+
+    @property
+    def masks(self):
+        """The masks of missing values, by column."""
+        return dict((name[:-len(_MASK)], self.index[name])
+                    for name in self.index.dtype.names if name.endswith(_MASK))
+
+
+    def array_names(self):
+        if self._names is None:
+            self._names = set(fn.split('.')[0] for fn in os.listdir(self.path)
+                              if fn.count('.') == 2)
+        return self._names
+
+
+    def parts(self, name):
+        """The data, offsets and shape of array column @name@, or None."""
+        if name not in self.array_names():
+            return None
+        a = self._arrays.get(name)
+        if a is None:
+            fn = os.path.join(self.path, name + '.%s.npy')
+            a = self._arrays[name] = dict(data=_load(fn % 'data'),
+                                          offsets=np.load(fn % 'offsets'),
+                                          shape=np.load(fn % 'shape'))
+        return a
+
+
+    def array(self, name, i):
+        a = self.parts(name)
+        if a is None:
+            return None
+        shape = [s for s in a['shape'][i] if s >= 0]
+        if not shape:
+            return None
+        return a['data'][a['offsets'][i]:a['offsets'][i + 1]].reshape(shape)
+
+
+    def close(self):
+        """Unmap the arrays."""
+        self._arrays = {}
+
+
+class ResultStore(object):
+    """
+    Append-only columnar store of result rows in @directory@.
+
+    A row is a dict of scalars (numbers, strings, booleans or None) and
+    arrays. Rows need not share their columns; one missing from a row is
+    None there.
+    """
+
+    # Shards with their arrays mapped at a time, each holding files open
+    max_open = 64
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._shards = []
+        self._starts = [0]
+        self._table = {}
+        self._masks = {}
+        self._open = OrderedDict()
+
+
+    def shard_names(self):
+        """The shards on disk, oldest first."""
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return []
+        # Zero padded, so they sort by name
+        return sorted(n for n in names if SHARD.match(n))
+
+
+    def append(self, rows):
+        """Write @rows@ (a list of dicts) as a new shard and return its path."""
+        rows = list(rows)
+        if not rows:
+            return None
+        names = set()
+        for r in rows:
+            names.update(r)
+        for name in names:
+            if not name or '.' in name or os.sep in name:
+                raise ValueError("Bad column name %r" % (name,))
+        columns = {}
+        masks = {}
+        arrays = {}
+        for name in names:
+            values = [r.get(name) for r in rows]
+            # Field names, which are file names too, are plain strings
+            if any(_is_array(v) for v in values):
+                arrays[str(name)] = _array_column(name, values)
+            else:
+                col = _scalar_column(name, values)
+                if col is not None:
+                    columns[str(name)], missing = col
+                    if missing is not None:
+                        masks[str(name)] = missing
+        if not columns:
+            raise ValueError("Rows need a scalar column that is not None.")
+        return self._write(columns, masks, arrays)
+
+
+    def _write(self, columns, masks, arrays):
+        try:
+            os.makedirs(self.directory)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        names = sorted(columns)
+        fields = [(name, columns[name].dtype) for name in names]
+        fields.extend((name + _MASK, bool) for name in sorted(masks))
+        index = np.empty(len(columns[names[0]]), dtype=fields)
+        for name in names:
+            index[name] = columns[name]
+        for name in masks:
+            index[name + _MASK] = masks[name]
+        tmp = tempfile.mkdtemp(dir=self.directory, prefix='.shard')
+        try:
+            np.save(os.path.join(tmp, 'index.npy'), index)
+            for name, parts in arrays.items():
+                for part, a in zip(_PARTS, parts):
+                    np.save(os.path.join(tmp, '%s.%s.npy' % (name, part)), a)
+            # Take the next free number; a concurrent writer may beat us to it
+            while True:
+                names = self.shard_names()
+                n = int(SHARD.match(names[-1]).group(1)) + 1 if names else 0
+                path = os.path.join(self.directory, 'shard-%06i' % n)
+                try:
+                    os.rename(tmp, path)
+                    return path
+                except OSError as e:
+                    if e.errno not in (errno.EEXIST, errno.ENOTEMPTY):
+                        raise
+        except:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+
+
+    def refresh(self):
+        """Pick up shards appended since the last read."""
+        names = self.shard_names()
+        known = [os.path.basename(s.path) for s in self._shards]
+        if known == names:
+            return
+        if names[:len(known)] != known:
+            # Compacted under us
+            self._shards = []
+            self._starts = [0]
+            self._table = {}
+            self._masks = {}
+            self._open.clear()
+        new = [_Shard(os.path.join(self.directory, n))
+               for n in names[len(self._shards):]]
+        self._shards.extend(new)
+        for sh in new:
+            self._starts.append(self._starts[-1] + sh.n)
+        if len(self._shards) == 1:
+            # Use the mapped index as it is
+            self._table = self._shards[0].columns
+            self._masks = self._shards[0].masks
+            return
+        parts = [(self._table, self._masks, self._starts[-len(new) - 1])]
+        parts.extend((sh.columns, sh.masks, sh.n) for sh in new)
+        self._table, self._masks = _concat(parts)
+        for sh in self._shards:
+            # Copied into the table, so let go of the mapped file
+            sh.index = None
+
+
+    def __len__(self):
+        self.refresh()
+        return self._starts[-1]
+
+
+    @property
+    def columns(self):
+        """
+        The scalar columns, each an array over all rows. Missing values are
+        NaN in float columns, '' in string columns and 0 or False in the
+        others, where missing() tells them apart.
+        """
+        self.refresh()
+        return self._table
+
+
+    def missing(self, name, index=None):
+        """Where column @name@ is None, at rows @index@ (all by default)."""
+        self.refresh()
+        if name not in self._table:
+            raise KeyError("No column %s" % (name,))
+        ret = self._match(name, None, 0)
+        if index is None:
+            return ret
+        return ret[index]
+
+
+    @property
+    def array_columns(self):
+        self.refresh()
+        ret = set()
+        for s in self._shards:
+            ret.update(s.array_names())
+        return sorted(ret)
+
+
+    def select(self, rtol=1e-9, **where):
+        """
+        The indices of the rows matching @where@, column=value pairs. A
+        value can be a list of values to match any of, or a function of the
+        column array returning a mask. Floats match within @rtol@, None
+        matches missing values.
+        """
+        self.refresh()
+        mask = np.ones(len(self), dtype=bool)
+        for name, value in where.items():
+            if name not in self._table:
+                if value is None:
+                    # Never set, so None everywhere
+                    continue
+                raise KeyError("No column %s" % (name,))
+            col = self._table[name]
+            if callable(value):
+                m = np.asarray(value(col), dtype=bool)
+            elif isinstance(value, (list, tuple, set)):
+                m = np.zeros(len(col), dtype=bool)
+                for v in value:
+                    m |= self._match(name, v, rtol)
+            else:
+                m = self._match(name, value, rtol)
+            mask &= m
+        return np.flatnonzero(mask)
+
+
+    def _match(self, name, value, rtol):
+        col = self._table[name]
+        if col.dtype.kind == 'S':
+            if value is None:
+                value = ''
+            elif isinstance(value, unicode):
+                value = value.encode('utf8')
+            return col == value
+        if col.dtype.kind == 'f':
+            if value is None:
+                return np.isnan(col)
+            return np.isclose(col, value, rtol=rtol, atol=0)
+        missing = self._masks.get(name)
+        if value is None:
+            if missing is None:
+                return np.zeros(len(col), dtype=bool)
+            return np.array(missing, dtype=bool)
+        if missing is None:
+            return col == value
+        return (col == value) & ~missing
+
+
+    def table(self, index=None, columns=None):
+        """@columns@ (all by default) at rows @index@ (all by default)."""
+        self.refresh()
+        if columns is None:
+            columns = self._table.keys()
+        if index is None:
+            return dict((c, self._table[c]) for c in columns)
+        return dict((c, self._table[c][index]) for c in columns)
+
+
+    def array(self, name, i):
+        """The array in column @name@ of row @i@, None if it has none."""
+        if not 0 <= i < self._starts[-1]:
+            self.refresh()
+            if not 0 <= i < self._starts[-1]:
+                raise IndexError("Row %s out of range" % (i,))
+        k = bisect.bisect_right(self._starts, i) - 1
+        shard = self._shards[k]
+        self._open.pop(k, None)
+        self._open[k] = shard
+        while len(self._open) > self.max_open:
+            self._open.popitem(last=False)[1].close()
+        return shard.array(name, i - self._starts[k])
+
+
+    def rows(self, index=None, arrays=False):
+        """
+        Rows @index@ (all by default) as dicts, with their arrays if
+        @arrays@.
+        """
+        self.refresh()
+        if index is None:
+            index = range(len(self))
+        names = self.array_columns if arrays else ()
+        ret = []
+        for i in index:
+            row = {}
+            for name, col in self._table.items():
+                missing = self._masks.get(name)
+                if missing is not None and missing[i]:
+                    v = None
+                else:
+                    v = col[i].item()
+                    if v == '' or (isinstance(v, float) and np.isnan(v)):
+                        v = None
+                row[name] = v
+            for name in names:
+                row[name] = self.array(name, i)
+            ret.append(row)
+        return ret
+
+
+    def compact(self):
+        """
+        Merge all shards into one. Not safe against concurrent appends or
+        reads from other processes.
+        """
+        self.refresh()
+        if len(self._shards) < 2:
+            return
+        arrays = {}
+        for name in self.array_columns:
+            arrays[name] = _merge_arrays([s.parts(name) for s in self._shards],
+                                         [s.n for s in self._shards])
+        columns = dict((n, np.array(c)) for n, c in self._table.items())
+        masks = dict((n, np.array(m)) for n, m in self._masks.items())
+        old = [s.path for s in self._shards]
+        self._write(columns, masks, arrays)
+        for path in old:
+            shutil.rmtree(path)
+        self.refresh()
+
+
+def _merge_arrays(parts, sizes):
+    """(data, offsets, shape) of the array column @parts@ of shards."""
+    ndim = max(p['shape'].shape[1] for p in parts if p is not None)
+    data = []
+    offsets = [np.zeros(1, dtype=np.int64)]
+    shapes = []
+    for p, n in zip(parts, sizes):
+        shape = -np.ones((n, ndim), dtype=np.int64)
+        if p is None:
+            offsets.append(offsets[-1][-1] * np.ones(n, dtype=np.int64))
+        else:
+            data.append(p['data'])
+            offsets.append(offsets[-1][-1] + p['offsets'][1:])
+            shape[:, :p['shape'].shape[1]] = p['shape']
+        shapes.append(shape)
+    return np.concatenate(data), np.concatenate(offsets), np.concatenate(shapes)
+
+
+def convergence_rows(fn):
+    """
+    Rows for the old convergence result file @fn@, a dict literal
+    {(model, mode, strike): [(step, error), ...]} in a file named like
+    vanilla_strike-100.0_hv_dt.py.
+    """
+    with open(fn) as f:
+        results = ast.literal_eval(f.read())
+    parts = os.path.basename(fn)[:-len('.py')].split('_')
+    ret = []
+    for (model, mode, strike), errors in sorted(results.items()):
+        sequence, error = zip(*errors)
+        ret.append(dict(source=os.path.basename(fn), product=parts[0],
+                        model=model, mode=mode, strike=strike,
+                        scheme=parts[2], sequence=np.array(sequence),
+                        errors=np.array(error)))
+    return ret
@@ -0,0 +1,380 @@
+#!/usr/bin/env python
+# coding: utf8
+"""A long lived local pricing service with warm engines.
+
+The expensive parts of a price (the mesh, the operators) depend on the
+model and grid but not on the spot, so the service keeps built engines,
+keyed by model and grid, and the surfaces they solved, keyed by that and
+the scheme. Every engine's mesh is centred on the strike, and a price at
+any spot is a spline through its surface along the spot axis at the
+initial variance (which is on the mesh), so requests that differ only in
+spot share one solve. Concurrent requests for a surface that is being
+solved wait for that solve instead of starting their own.
+
+Requests and responses are JSON objects, one per line, over a Unix socket
+or localhost TCP. A line holding a list is a batch, answered with a list.
+
+    server = service.serve('/tmp/pricing.sock')
+    server.serve_forever()
+
+    with service.Client('/tmp/pricing.sock') as c:
+        c.price(spot=100, strike=99, variance=0.04, steps=200)
+
+Request fields and their defaults are in DEFAULTS; unknown fields are an
+error. A failed request gets {"error": message} and does not affect the
+others in its batch.
+"""
+
+from __future__ import division
+
+import os
+import json
+import socket
+import threading
+import SocketServer
+from collections import OrderedDict
+
+import numpy as np
+from scipy.interpolate import InterpolatedUnivariateSpline
+
+from heston import (HestonOption, HestonBarrierOption,
+                    HestonFiniteDifferenceEngine, SOLVERS, solve)
+
+DEFAULTS = {
+    'id': None,
+    'spot': 100.0,
+    # The model
+    'strike': 99.0,
+    'interest_rate': 0.06,
+    'variance': 0.04,
+    'tenor': 1.0,
+    'mean_reversion': 1.0,
+    'mean_variance': None,      # The variance if None
+    'vol_of_variance': 0.4,
+    'correlation': 0.0,
+    'top': None,                # An up-and-out barrier
+    # The grid
+    'nspots': 100,
+    'nvols': 100,
+    'spotdensity': 7.0,
+    'varexp': 4.0,
+    'var_max': 10.0,
+    'spot_max': 1500.0,
+    # The scheme
+    'scheme': 'hv',
+    'theta': 0.5,
+    'steps': 100,
+    'smoothing': 0,
+}
+
+MODEL = ('strike', 'interest_rate', 'variance', 'tenor', 'mean_reversion',
+         'mean_variance', 'vol_of_variance', 'correlation', 'top')
+GRID = ('nspots', 'nvols', 'spotdensity', 'varexp', 'var_max', 'spot_max')
+SCHEME = ('scheme', 'theta', 'steps', 'smoothing')
+
+_INTS = ('nspots', 'nvols', 'steps', 'smoothing')
+
+
+class ServiceError(Exception):
+    """A request the service answered with an error."""
+    pass
+
+
+def normalize(request):
+    """@request@ with the defaults filled in and the numbers as numbers."""
+    unknown = set(request) - set(DEFAULTS)
+    if unknown:
+        raise ValueError("Unknown fields: %s" % ', '.join(sorted(unknown)))
+    ret = dict(DEFAULTS)
+    ret.update(request)
+    if ret['mean_variance'] is None:
+        ret['mean_variance'] = ret['variance']
+    if ret['scheme'] not in SOLVERS:
+        raise ValueError("Unknown scheme: %s" % (ret['scheme'],))
+    for k in MODEL + GRID + SCHEME + ('spot',):
+        if k in _INTS:
+            ret[k] = int(ret[k])
+        elif ret[k] is not None and k != 'scheme':
+            ret[k] = float(ret[k])
+    if ret['scheme'] == 'i':
+        ret['theta'] = None
+    return ret
+
+
+def engine_key(request):
+    return tuple(request[k] for k in MODEL + GRID)
+
+
+def surface_key(request):
+    return engine_key(request) + tuple(request[k] for k in SCHEME)
+
+
+def new_engine(request, spot=None, init=True):
+    """
+    An engine for @request@'s model and grid, with @spot@ (the strike by
+    default) on the mesh, and its operators built unless @init@ is False.
+    """
+    if spot is None:
+        spot = request['strike']
+    if request['top'] is not None and not spot < request['top']:
+        raise ValueError("Spot %s is not below the barrier %s"
+                         % (spot, request['top']))
+    kwargs = dict(spot=spot, strike=request['strike'],
+                  interest_rate=request['interest_rate'],
+                  variance=request['variance'], tenor=request['tenor'],
+                  mean_reversion=request['mean_reversion'],
+                  mean_variance=request['mean_variance'],
+                  vol_of_variance=request['vol_of_variance'],
+                  correlation=request['correlation'])
+    if request['top'] is None:
+        option = HestonOption(**kwargs)
+    else:
+        option = HestonBarrierOption(top=(False, request['top']), **kwargs)
+    F = HestonFiniteDifferenceEngine(option, nspots=request['nspots'],
+                                     nvols=request['nvols'],
+                                     spotdensity=request['spotdensity'],
+                                     varexp=request['varexp'],
+                                     var_max=request['var_max'],
+                                     spot_max=request['spot_max'],
+                                     cache=False, verbose=False)
+    if init:
+        F.init()
+    return F
+
+
+class _Pending(object):
+    """A surface being solved, for the requests waiting on it."""
+    def __init__(self):
+        self.done = threading.Event()
+        self.surface = None
+        self.error = None
+
+
+class PricingService(object):
+    """
+    Prices requests with warm engines, keeping at most @max_engines@
+    engines and @max_surfaces@ solved surfaces, least recently used out
+    first. Thread safe.
+    """
+
+    def __init__(self, max_engines=8, max_surfaces=64):
+        self.max_engines = max_engines
+        self.max_surfaces = max_surfaces
+        self.lock = threading.Lock()
+        self.engines = OrderedDict()
+        self.surfaces = OrderedDict()
+        self.pending = {}
+        self.stats = dict(requests=0, errors=0, engines=0, solves=0,
+                          surface_hits=0, coalesced=0)
+
+
+    def _count(self, name, n=1):
+        with self.lock:
+            self.stats[name] += n
+
+
+    def _engine(self, request):
+        """(engine, lock) for @request@, building the engine if needed."""
+        key = engine_key(request)
+        with self.lock:
+            entry = self.engines.pop(key, None)
+            if entry is None:
+                entry = [None, threading.Lock()]
+            self.engines[key] = entry
+            while len(self.engines) > self.max_engines:
+                self.engines.popitem(last=False)
+        with entry[1]:
+            if entry[0] is None:
+                entry[0] = new_engine(request)
+                self._count('engines')
+        return entry
+
+
+    def _solve(self, request):
+        """The spline of the price over spot at the initial variance."""
+        entry = self._engine(request)
+        with entry[1]:
+            F = entry[0]
+            V = solve(F, request, F.grid.domain[0].copy())
+            del F.grid.domain[1:]
+            spots = F.grid.mesh[0]
+            prices = V[:, F.idx[1]].copy()
+        self._count('solves')
+        return InterpolatedUnivariateSpline(spots, prices, k=3)
+
+
+    def surface(self, request):
+        """
+        The solved surface of (normalized) @request@, from the cache, from
+        a concurrent solve of it or from a new one.
+        """
+        key = surface_key(request)
+        with self.lock:
+            s = self.surfaces.pop(key, None)
+            if s is not None:
+                self.surfaces[key] = s
+                self.stats['surface_hits'] += 1
+                return s
+            p = self.pending.get(key)
+            owner = p is None
+            if owner:
+                p = self.pending[key] = _Pending()
+            else:
+                self.stats['coalesced'] += 1
+        if not owner:
+            p.done.wait()
+            if p.error is not None:
+                raise p.error
+            return p.surface
+        try:
+            p.surface = self._solve(request)
+        except Exception as e:
+            p.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.pending[key]
+                if p.error is None:
+                    self.surfaces[key] = p.surface
+                    while len(self.surfaces) > self.max_surfaces:
+                        self.surfaces.popitem(last=False)
+            p.done.set()
+        return p.surface
+
+
+    def price(self, request):
+        """The response to one @request@ dict, raising on errors."""
+        self._count('requests')
+        r = normalize(request)
+        s = self.surface(r)
+        lo, hi = s.get_knots()[[0, -1]]
+        if not lo <= r['spot'] <= hi:
+            raise ValueError("Spot %s is outside the grid [%s, %s]"
+                             % (r['spot'], lo, hi))
+        return {'id': r['id'], 'spot': r['spot'], 'price': float(s(r['spot']))}
+
+
+    def price_many(self, requests):
+        """Responses to @requests@, an error response for each that fails."""
+        ret = []
+        for request in requests:
+            try:
+                if not isinstance(request, dict):
+                    raise ValueError("A request is an object, not %r" % (request,))
+                ret.append(self.price(request))
+            except Exception as e:
+                self._count('errors')
+                rid = request.get('id') if isinstance(request, dict) else None
+                ret.append({'id': rid, 'error': "%s: %s" % (type(e).__name__, e)})
+        return ret
+
+
+    def handle(self, message):
+        """The response to a decoded protocol @message@."""
+        if isinstance(message, list):
+            return self.price_many(message)
+        if isinstance(message, dict) and message.get('command') == 'stats':
+            with self.lock:
+                ret = dict(self.stats)
+                ret.update(cached_engines=len(self.engines),
+                           cached_surfaces=len(self.surfaces))
+            return ret
+        return self.price_many([message])[0]
+
+
+class _Handler(SocketServer.StreamRequestHandler):
+
+    def handle(self):
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                break
+            if not line.strip():
+                continue
+            try:
+                response = self.server.service.handle(json.loads(line))
+            except ValueError as e:
+                response = {'error': "Bad JSON: %s" % e}
+            self.wfile.write(json.dumps(response) + '\n')
+            self.wfile.flush()
+
+
+class TCPServer(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class UnixServer(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    daemon_threads = True
+
+
+def serve(address, service=None):
+    """
+    A server of @service@ (a new PricingService by default) bound to
+    @address@, a Unix socket path or a (host, port) pair. Call its
+    serve_forever().
+    """
+    if isinstance(address, basestring):
+        if os.path.exists(address):
+            os.unlink(address)
+        server = UnixServer(address, _Handler)
+    else:
+        server = TCPServer(tuple(address), _Handler)
+    server.service = service if service is not None else PricingService()
+    return server
+
+
+class Client(object):
+    """A connection to the service at @address@ (as for serve())."""
+
+    def __init__(self, address, timeout=None):
+        if isinstance(address, basestring):
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        else:
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            address = tuple(address)
+        self.sock.settimeout(timeout)
+        self.sock.connect(address)
+        self.rfile = self.sock.makefile('rb')
+        self.wfile = self.sock.makefile('wb')
+
+
+    def call(self, message):
+        self.wfile.write(json.dumps(message) + '\n')
+        self.wfile.flush()
+        line = self.rfile.readline()
+        if not line:
+            raise ServiceError("The service closed the connection.")
+        return json.loads(line)
+
+
+    def price(self, **request):
+        """The price for @request@, raising ServiceError if it failed."""
+        r = self.call(request)
+        if 'error' in r:
+            raise ServiceError(r['error'])
+        return r['price']
+
+
+    def price_many(self, requests):
+        """Response dicts for the list of @requests@, in one round trip."""
+        return self.call(list(requests))
+
+
+    def stats(self):
+        return self.call({'command': 'stats'})
+
+
+    def close(self):
+        self.rfile.close()
+        self.wfile.close()
+        self.sock.close()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
@@ -0,0 +1,221 @@
+#!/usr/bin/env python
+# coding: utf8
+"""Scrambled Sobol points and a Brownian bridge random source for the QE step.
+
+Randomized quasi Monte Carlo: each randomization is a Sobol sequence with
+Matoušek's random linear scramble and a random digital shift, so its points
+are uniform on the unit cube but still a low discrepancy net. Independent
+randomizations give independent unbiased estimates whose spread is the
+error estimate.
+
+The effective dimension of a path is kept low by a Brownian bridge: the
+leading Sobol coordinates decide the end point and then successive midpoints
+of each driving Brownian motion, the fine detail comes last. Coordinates
+beyond the direction number table are padded with pseudo random numbers.
+"""
+
+from __future__ import division
+
+from collections import deque
+
+import numpy as np
+from scipy.special import ndtr, ndtri
+
+BITS = 32
+
+# Joe and Kuo's direction numbers (new-joe-kuo-6.21201) for dimensions 2 and
+# up: degree s, coefficients a of the primitive polynomial and the initial
+# odd m_1 .. m_s. Dimension 1 is the van der Corput sequence.
+DIRECTIONS = [
+    (1, 0, (1,)),
+    (2, 1, (1, 3)),
+    (3, 1, (1, 3, 1)),
+    (3, 2, (1, 1, 1)),
+    (4, 1, (1, 1, 3, 3)),
+    (4, 4, (1, 3, 5, 13)),
+    (5, 2, (1, 1, 5, 5, 17)),
+    (5, 4, (1, 1, 5, 5, 5)),
+    (5, 7, (1, 1, 7, 11, 19)),
+    (5, 11, (1, 1, 5, 1, 1)),
+    (5, 13, (1, 1, 1, 3, 11)),
+    (5, 14, (1, 3, 5, 5, 31)),
+    (6, 1, (1, 3, 3, 9, 7, 49)),
+    (6, 13, (1, 1, 1, 15, 21, 21)),
+    (6, 16, (1, 3, 1, 13, 27, 49)),
+    (6, 19, (1, 1, 1, 15, 7, 5)),
+    (6, 22, (1, 3, 1, 15, 13, 25)),
+    (6, 25, (1, 1, 5, 5, 19, 61)),
+    (7, 1, (1, 3, 7, 11, 23, 15, 103)),
+    (7, 4, (1, 3, 7, 13, 13, 15, 69)),
+    (7, 7, (1, 1, 3, 13, 7, 35, 63)),
+    (7, 8, (1, 3, 5, 9, 1, 25, 53)),
+    (7, 14, (1, 3, 1, 13, 9, 35, 107)),
+    (7, 19, (1, 3, 1, 5, 27, 61, 31)),
+    (7, 21, (1, 1, 5, 11, 19, 41, 61)),
+    (7, 28, (1, 3, 5, 3, 3, 13, 69)),
+    (7, 31, (1, 1, 7, 13, 1, 19, 1)),
+    (7, 32, (1, 3, 7, 5, 13, 19, 59)),
+    (7, 37, (1, 1, 3, 9, 25, 29, 41)),
+    (7, 41, (1, 3, 5, 13, 23, 1, 55)),
+    (7, 42, (1, 3, 7, 3, 13, 59, 17)),
+]
+
+MAX_DIM = len(DIRECTIONS) + 1
+
+
+def direction_numbers(dim):
+    """[@dim@, BITS] uint32 direction numbers v_k = m_k / 2**k."""
+    if not 0 < dim <= MAX_DIM:
+        raise ValueError("Sobol dimension must be in 1..%i" % MAX_DIM)
+    ret = np.empty((dim, BITS), dtype=np.uint64)
+    ret[0] = 1 << np.arange(BITS - 1, -1, -1, dtype=np.uint64)
+    for d, (s, a, m) in enumerate(DIRECTIONS[:dim-1], 1):
+        v = [mk << (BITS - k) for k, mk in enumerate(m, 1)]
+        for k in range(s, BITS):
+            x = v[k-s] ^ (v[k-s] >> s)
+            for j in range(1, s):
+                if (a >> (s - 1 - j)) & 1:
+                    x ^= v[k-j]
+            v.append(x)
+        ret[d] = v
+    return ret.astype(np.uint32)
+
+
+def _parity(x):
+    """Parity of the bits of each uint32 in @x@."""
+    x = x ^ (x >> 16)
+    x ^= x >> 8
+    x ^= x >> 4
+    x ^= x >> 2
+    x ^= x >> 1
+    return x & 1
+
+
+def linear_scramble(v, random_state):
+    """
+    Matoušek's linear scramble of the direction numbers @v@: output bit i
+    (from the most significant) of every coordinate is its bit i plus a
+    random combination of the more significant bits, with an independent
+    lower triangular matrix per dimension. The map is linear over GF(2), so
+    scrambling the direction numbers scrambles every point.
+    """
+    dim = v.shape[0]
+    bit = (1 << np.arange(BITS - 1, -1, -1, dtype=np.uint64)).astype(np.uint32)
+    # rows[d, i] has the bits j < i of row i of the matrix and bit i itself
+    lower = random_state.randint(0, 2, (dim, BITS, BITS)).astype(np.uint32)
+    lower *= np.tril(np.ones((BITS, BITS), dtype=np.uint32), -1)
+    rows = (lower * bit).sum(axis=2).astype(np.uint32) | bit
+    ret = np.zeros_like(v)
+    for i in range(BITS):
+        ret |= _parity(v & rows[:,i,np.newaxis]) * bit[i]
+    return ret
+
+
+class Sobol(object):
+    """
+    Consecutive points of a @dim@ dimensional Sobol sequence in Gray code
+    order, scrambled if a @random_state@ is given.
+
+        s = Sobol(6, np.random.RandomState(1))
+        u = s.draw(1024)     # [1024, 6] in (0, 1)
+        u = s.draw(1024)     # the next 1024
+    """
+
+    def __init__(self, dim, random_state=None):
+        self.dim = dim
+        self.v = direction_numbers(dim)
+        self.x = np.zeros(dim, dtype=np.uint32)
+        if random_state is not None:
+            self.v = linear_scramble(self.v, random_state)
+            self.x = random_state.randint(0, 2**BITS, dim).astype(np.uint32)
+        self.index = 0
+
+
+    def draw(self, n):
+        """The next @n@ points, [@n@, dim] and strictly inside (0, 1)."""
+        k = np.arange(self.index, self.index + n, dtype=np.uint64)
+        # Point k+1 differs from point k by the direction number of the
+        # lowest zero bit of k.
+        low = ~k & (k + 1)
+        c = np.log2(low).astype(int)
+        steps = np.vstack((self.x, self.v[:,c[:-1]].T))
+        x = np.bitwise_xor.accumulate(steps, axis=0)
+        self.x = x[-1] ^ self.v[:,c[-1]]
+        self.index += n
+        return (x + 0.5) / 2.0**BITS
+
+
+def bridge(n):
+    """
+    Brownian bridge construction order for W(1) .. W(@n@): a list of
+    (point, left, right), where right is None for the end point. Each point
+    is the midpoint of two already known ones, breadth first, W(0) = 0.
+    """
+    ret = [(n, 0, None)]
+    queue = deque([(0, n)])
+    while queue:
+        left, right = queue.popleft()
+        if right - left < 2:
+            continue
+        mid = (left + right) // 2
+        ret.append((mid, left, right))
+        queue.append((left, mid))
+        queue.append((mid, right))
+    return ret
+
+
+def bridge_increments(z, plan=None):
+    """
+    Standard normal increments of a Brownian motion on a unit grid built
+    from the [n, npaths] normals @z@ in bridge() order.
+    """
+    n = z.shape[0]
+    if plan is None:
+        plan = bridge(n)
+    w = np.zeros((n + 1,) + z.shape[1:])
+    for zi, (point, left, right) in zip(z, plan):
+        if right is None:
+            w[point] = np.sqrt(point) * zi
+        else:
+            a, b = point - left, right - point
+            w[point] = ((b*w[left] + a*w[right]) / (a + b)
+                        + np.sqrt(a*b / (a + b)) * zi)
+    return np.diff(w, axis=0)
+
+
+class SobolBridge(object):
+    """
+    Random source for the QE step from one randomization of scrambled Sobol
+    points. The spot and variance drivers each get a Brownian bridge and
+    take alternate Sobol coordinates, so both get their coarse structure
+    from the leading ones. The uniform of the QE variance step is the
+    normal cdf of the variance driver: the scheme only ever uses one of the
+    two per step.
+
+    Consecutive draws() continue the same sequence, so a randomization can
+    be simulated in batches.
+    """
+
+    def __init__(self, random_state):
+        self.random_state = random_state
+        self.sobol = None
+        self.nsteps = None
+
+
+    def draws(self, nsteps, npaths):
+        """Yields (Z0, Z1, u) for each of the @nsteps@ steps."""
+        if self.sobol is None:
+            self.sobol = Sobol(min(2*nsteps, MAX_DIM), self.random_state)
+            self.nsteps = nsteps
+            self.plan = bridge(nsteps)
+        elif nsteps != self.nsteps:
+            raise ValueError("Continuing a sequence with a different number"
+                             " of steps.")
+        dim = self.sobol.dim
+        z = np.empty((2*nsteps, npaths))
+        z[:dim] = ndtri(self.sobol.draw(npaths).T)
+        z[dim:] = self.random_state.standard_normal((2*nsteps - dim, npaths))
+        spot = bridge_increments(z[0::2], self.plan)
+        var = bridge_increments(z[1::2], self.plan)
+        for i in range(nsteps):
+            yield spot[i], var[i], ndtr(var[i])
@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+# coding: utf8
+"""In-process parameter sweeps.
+
+A point is a request as for service.normalize(): a model, a grid, a scheme
+and a spot. Points that differ only in their scheme (its steps, say) share
+an engine, so they are grouped and each group is priced by one worker,
+which builds the mesh and operators once. Groups run on a process pool,
+each finished group is appended to a checkpoint file, and a rerun with the
+same checkpoint skips the points already in it.
+
+    rows = sweep.run(sweep.product(strike=[95, 100], steps=[50, 100]),
+                     checkpoint='sweep.jsonl')
+    sweep.save_table(rows, 'sweep.csv')
+"""
+
+from __future__ import division
+
+import os
+import json
+import time
+import itertools as it
+import multiprocessing
+from collections import OrderedDict
+
+import service
+from heston import solve
+from benchmarks import save_csv
+from resultstore import ResultStore
+
+# The columns of the results table
+COLUMNS = ('spot', 'strike', 'interest_rate', 'variance', 'mean_variance',
+           'vol_of_variance', 'correlation', 'mean_reversion', 'tenor', 'top',
+           'nspots', 'nvols', 'scheme', 'theta', 'steps', 'smoothing',
+           'idx_spot', 'idx_var', 'price', 'analytical', 'build_seconds',
+           'seconds', 'error')
+
+
+def product(**axes):
+    """
+    Points for every combination of the values of @axes@, each a list of
+    values of a request field. Fields not given take the service defaults.
+    """
+    names = sorted(axes)
+    return [service.normalize(dict(zip(names, values)))
+            for values in it.product(*(axes[n] for n in names))]
+
+
+def point_key(point):
+    """What identifies a point in a checkpoint."""
+    return service.surface_key(point) + (point['spot'],)
+
+
+def group_key(point):
+    """Points with the same key share an engine."""
+    return service.engine_key(point) + (point['spot'],)
+
+
+def group(points):
+    """The @points@ as lists sharing an engine, in order of first appearance."""
+    ret = OrderedDict()
+    for p in points:
+        ret.setdefault(group_key(p), []).append(p)
+    return ret.values()
+
+
+def cost(points):
+    """The relative work of a group, to schedule the big ones first."""
+    return sum(p['nspots'] * p['nvols'] * p['steps'] for p in points)
+
+
+def run_group(points):
+    """
+    Result rows for @points@, which share an engine: the point with its
+    price, the analytical price of a vanilla, the grid index and times. A
+    point that fails gets its error instead of a price.
+    """
+    first = points[0]
+    start = time.time()
+    try:
+        F = service.new_engine(first, spot=first['spot'])
+    except Exception as e:
+        return [dict(p, price=None, error="%s: %s" % (type(e).__name__, e))
+                for p in points]
+    build = time.time() - start
+    analytical = None
+    if first['top'] is None:
+        analytical = F.option.european_price()
+    ret = []
+    for p in points:
+        row = dict(p, idx_spot=F.idx[0], idx_var=F.idx[1],
+                   analytical=analytical, build_seconds=build)
+        start = time.time()
+        try:
+            V = solve(F, p, F.grid.domain[0].copy())
+            row.update(price=float(V[F.idx]), error=None)
+        except Exception as e:
+            row.update(price=None, error="%s: %s" % (type(e).__name__, e))
+        row['seconds'] = time.time() - start
+        del F.grid.domain[1:]
+        ret.append(row)
+    return ret
+
+
+def load_checkpoint(fn):
+    """The rows in checkpoint @fn@ (none if it does not exist)."""
+    if fn is None or not os.path.exists(fn):
+        return []
+    ret = []
+    with open(fn) as f:
+        for line in f:
+            try:
+                ret.append(json.loads(line))
+            except ValueError:
+                # A line cut short by a crash
+                pass
+    return ret
+
+
+def _append(fn, rows):
+    with open(fn, 'ab+') as f:
+        f.seek(0, os.SEEK_END)
+        if f.tell():
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != '\n':
+                # Do not run on from a line cut short
+                f.write('\n')
+        for r in rows:
+            f.write(json.dumps(r, sort_keys=True) + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def run(points, processes=None, checkpoint=None, verbose=False):
+    """
+    Result rows for @points@ in their order, from @checkpoint@ (a JSON lines
+    file) if they are in it without an error, otherwise priced by run_group()
+    on @processes@ workers (one per CPU by default, none if 1), appending
+    each finished group to @checkpoint@.
+    """
+    points = [service.normalize(p) for p in points]
+    done = {}
+    for r in load_checkpoint(checkpoint):
+        if r.get('error') is None:
+            done[point_key(r)] = r
+    todo = [p for p in points if point_key(p) not in done]
+    groups = sorted(group(todo), key=cost, reverse=True)
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    if verbose:
+        print "%i points, %i done, %i groups on %i processes" % (
+            len(points), len(points) - len(todo), len(groups), processes)
+    pool = None
+    if processes > 1 and len(groups) > 1:
+        pool = multiprocessing.Pool(processes)
+        results = pool.imap_unordered(run_group, groups, chunksize=1)
+    else:
+        results = it.imap(run_group, groups)
+    try:
+        for i, rows in enumerate(results):
+            if checkpoint is not None:
+                _append(checkpoint, rows)
+            for r in rows:
+                done[point_key(r)] = r
+            if verbose:
+                print "%i/%i groups" % (i + 1, len(groups))
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return [done[point_key(p)] for p in points]
+
+
+def save_table(rows, fn, columns=COLUMNS):
+    """The consolidated results as CSV."""
+    save_csv(rows, fn, columns)
+
+
+def save_store(rows, store):
+    """
+    Append @rows@ to @store@ (a ResultStore or its directory), with their
+    moneyness for queries.
+    """
+    if isinstance(store, basestring):
+        store = ResultStore(store)
+    return store.append([dict(r, moneyness=r['spot'] / r['strike'])
+                         for r in rows])
@@ -68,6 +68,15 @@ class BarrierOption_test(unittest.TestCase):
         npt.assert_array_equal(self.state, res)
 
 
+    def test_knockin_starts_out(self):
+        self.option.top = (True, 3.0)
+        state = self.option.monte_carlo_state(10)
+        npt.assert_array_equal(state, np.zeros(10))
+        self.option.monte_carlo_callback(self.s, state)
+        res = np.array((1,0,1,0,1,1,0,1,0,0), dtype=bool)
+        npt.assert_array_equal(state, res)
+
+
 class BlackScholesOption_test(unittest.TestCase):
 
     def setUp(self):
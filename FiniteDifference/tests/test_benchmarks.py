@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# coding: utf8
+
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import numpy.testing as npt
+
+from FiniteDifference import benchmarks
+
+
+class benchmarks_test(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+
+    def test_run_case(self):
+        case = dict(scheme='hv', nspots=20, nvols=20, steps=10)
+        r = benchmarks.run_case(case, repeat=1)
+        for k in benchmarks.COLUMNS:
+            assert k in r, k
+        assert r['time_per_step'] * 10 == r['solve_time']
+        assert r['gridpoint_steps_per_second'] > 0
+        assert r['peak_rss_mb'] > 0 and r['memory_mb'] >= 0
+        assert np.isfinite(r['price'])
+
+
+    def test_save(self):
+        results = [dict(scheme='i', nspots=10, nvols=10, steps=5,
+                        build_time=0.1, solve_time=0.2, time_per_step=0.04,
+                        gridpoint_steps_per_second=2500.0, peak_rss_mb=50.0,
+                        memory_mb=1.0, price=10.0)]
+        fn = os.path.join(self.dir, 'b.json')
+        benchmarks.save_json(results, fn)
+        assert benchmarks.load_json(fn) == results
+        assert 'machine' in json.load(open(fn))
+        fn = os.path.join(self.dir, 'b.csv')
+        benchmarks.save_csv(results, fn)
+        lines = open(fn).read().splitlines()
+        assert lines[0] == ','.join(benchmarks.COLUMNS)
+        assert len(lines) == 2
+
+
+    def test_compare(self):
+        def result(scheme, t, price=10.0):
+            return dict(scheme=scheme, nspots=10, nvols=10, steps=5,
+                        time_per_step=t, price=price)
+        baseline = [result('i', 1.0), result('d', 1.0), result('hv', 1.0),
+                    result('cs', 1.0)]
+        results = [result('i', 1.05), result('d', 1.5), result('hv', 0.5),
+                   result('cs', 1.0, price=10.1), result('cs2', 1.0)]
+        status = [r['status'] for r in
+                  benchmarks.compare(results, baseline, tolerance=0.1)]
+        assert status == ['ok', 'slower', 'faster', 'changed', 'new'], status
+        bad = benchmarks.regressions(benchmarks.compare(results, baseline))
+        assert [r['scheme'] for r in bad] == ['d', 'cs']
+        assert len(list(benchmarks.report(benchmarks.compare(results,
+                                                             baseline)))) == 6
+
+
+    def test_accuracy_case(self):
+        options = benchmarks.products()
+        case = dict(product='vanilla', scheme='hv', theta=0.6, nspots=30,
+                    nvols=15, steps=10, smoothing=1)
+        ref = benchmarks.reference(options['vanilla'])
+        r = benchmarks.run_accuracy_case(case, options['vanilla'], ref)
+        for k in benchmarks.ACCURACY_COLUMNS:
+            assert k in r, k
+        assert r['error'] == abs(r['price'] - ref)
+        assert r['error'] < 0.1 * ref, r
+        # Smoothing with theta 0.6 is solve_smooth()
+        F = benchmarks.engine(options['vanilla'], 30, 15)
+        V = F.solve_smooth(10, 0.1, F.grid.domain[0].copy(),
+                           smoothing_steps=1)
+        npt.assert_allclose(V[F.idx], r['price'], rtol=1e-12)
+
+
+    def test_accuracy_cases(self):
+        cases = benchmarks.accuracy_cases(schemes=['i', 'hv'],
+                                          thetas=(0.5, 1.0),
+                                          sizes=((20, 10),), steps=(5,),
+                                          smoothing=(0, 1))
+        # 2 products x (1 + 2 thetas) x 2 smoothing
+        assert len(cases) == 12, len(cases)
+        assert set(c['theta'] for c in cases if c['scheme'] == 'i') == set([None])
+
+
+    def test_pareto(self):
+        def result(product, t, e):
+            return dict(product=product, time=t, error=e)
+        results = [result('vanilla', 1.0, 0.1), result('vanilla', 2.0, 0.2),
+                   result('vanilla', 3.0, 0.01), result('vanilla', 0.5, 1.0),
+                   result('vanilla', 3.0, 0.05), result('barrier', 1.0, 0.3)]
+        front = benchmarks.pareto(results)
+        assert sorted(front) == ['barrier', 'vanilla']
+        assert ([(r['time'], r['error']) for r in front['vanilla']]
+                == [(0.5, 1.0), (1.0, 0.1), (3.0, 0.01)]), front
+        assert benchmarks.cheapest(front['vanilla'], 0.1)['time'] == 1.0
+        assert benchmarks.cheapest(front['barrier'], 0.1) is None
+
+
+def main():
+    """Run main."""
+    import nose
+    nose.main()
+    return 0
+
+if __name__ == '__main__':
+    main()
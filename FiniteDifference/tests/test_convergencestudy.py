@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# coding: utf8
+
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import numpy.testing as npt
+
+from FiniteDifference import convergencestudy
+from FiniteDifference.resultstore import ResultStore
+from FiniteDifference.heston import HestonOption, HestonFiniteDifferenceEngine
+
+POINT = dict(strike=100.0, nspots=30, nvols=15, steps=4, smoothing=1,
+             theta=0.5 + np.sqrt(3) / 6)
+
+
+class ConvergenceStudy_test(unittest.TestCase):
+
+    def test_refinements(self):
+        ps = convergencestudy.refinements(POINT, 'dt', levels=3, reference=2)
+        assert [p['steps'] for p in ps] == [4, 8, 16, 64]
+        assert set(p['nspots'] for p in ps) == set([30])
+        ps = convergencestudy.refinements(POINT, 'both', levels=2)
+        assert [(p['nspots'], p['nvols'], p['steps']) for p in ps] == [
+            (30, 15, 4), (60, 30, 8), (240, 120, 32)]
+        self.assertRaises(ValueError, convergencestudy.refinements, POINT,
+                          'dz')
+
+
+    def test_fit_order(self):
+        hs = 0.5**np.arange(5)
+        npt.assert_allclose(convergencestudy.fit_order(hs, 3 * hs**2), 2)
+        npt.assert_allclose(convergencestudy.fit_order(hs, -hs), 1)
+        assert np.isnan(convergencestudy.fit_order(hs, 0 * hs))
+
+
+    def test_dt(self):
+        study = convergencestudy.run(POINT, 'dt', levels=4, reference=3,
+                                     processes=1)
+        # All levels share one engine
+        assert study['engines'] == 1
+        rows = study['rows']
+        assert [r['steps'] for r in rows] == [4, 8, 16, 32]
+        assert study['reference']['steps'] == 256
+        # Each level prices as a fresh engine would
+        option = HestonOption(spot=100.0, strike=100.0)
+        F = HestonFiniteDifferenceEngine(option, nspots=30, nvols=15,
+                                         cache=False, verbose=False)
+        V = F.solve_implicit(2, 1 / 16.0, F.grid.domain[0].copy())
+        V = F.solve_hundsdorferverwer(7, 1 / 8.0, V, theta=POINT['theta'])
+        npt.assert_allclose(rows[1]['price'], V[F.idx], rtol=1e-12)
+        errors = [abs(r['error']) for r in rows]
+        assert errors == sorted(errors, reverse=True), errors
+        assert 1.3 < study['order'] < 2.2, study['order']
+        assert 1.1 < rows[-1]['richardson_order'] < 2.2, rows
+        assert 'Fitted order in dt' in convergencestudy.report(study)
+
+
+    def test_orders_zero(self):
+        rows = [dict(nspots=n, spot_max=1500.0, price=1.0, error=e)
+                for n, e in ((30, 0.1), (60, 0.0), (120, 0.01))]
+        convergencestudy.orders(rows, 'dx')
+        assert np.isnan(rows[1]['order']) and np.isnan(rows[2]['order'])
+        assert np.isnan(rows[2]['richardson_order'])
+
+
+    def test_dx_nested(self):
+        point = dict(POINT, steps=50)
+        study = convergencestudy.run(point, 'dx', levels=3, reference=1,
+                                     processes=1)
+        rows = study['rows']
+        engines = convergencestudy.engines(
+            convergencestudy.refinements(point, 'dx', 3, 1), 'dx')
+        meshes = sorted((len(F.spots), len(F.vars))
+                        for F, _ in engines.values())
+        assert meshes == [(r['spot_nodes'], r['var_nodes'])
+                          for r in rows + [study['reference']]], meshes
+        # Nested meshes converge regularly
+        assert all(1.8 < r['order'] < 2.5 for r in rows[1:]), rows
+        assert 1.8 < study['richardson_order'] < 2.2, study
+
+
+    def test_pool(self):
+        serial = convergencestudy.run(POINT, 'dx', levels=2, processes=1)
+        parallel = convergencestudy.run(POINT, 'dx', levels=2, processes=2)
+        assert serial['engines'] == parallel['engines'] == 3
+        assert ([r['price'] for r in serial['rows']] ==
+                [r['price'] for r in parallel['rows']])
+        assert serial['target'] == parallel['target']
+
+
+    def test_exact_and_save(self):
+        exact = HestonOption(spot=100.0, strike=100.0).european_price()
+        study = convergencestudy.run(POINT, 'dt', levels=3, exact=exact,
+                                     processes=1)
+        assert study['target'] == exact
+        npt.assert_allclose(study['reference']['error'],
+                            study['reference']['price'] - exact)
+        d = tempfile.mkdtemp()
+        try:
+            convergencestudy.save(study, d)
+            s = ResultStore(d)
+            assert list(s.select(mode='dt', level=-1)) == [3]
+            npt.assert_array_equal(s.columns['steps'], [4, 8, 16, 64])
+        finally:
+            shutil.rmtree(d)
+
+
+def main():
+    """Run main."""
+    import nose
+    nose.main()
+    return 0
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+# coding: utf8
+
+import unittest
+
+import numpy as np
+import numpy.testing as npt
+
+from FiniteDifference.heston import HestonOption, HestonCos, HestonFundamental, hs_call_vector, HestonFiniteDifferenceEngine, nested
+
+
+class hs_call_vector_test(unittest.TestCase):
+
+    def setUp(self):
+        self.spots = np.linspace(0, 300, 40)
+        self.vols = np.sqrt(np.linspace(0, 1, 25))
+        self.params = (99.0, 0.06, self.vols, 1.0, 1.0, 0.04, 0.2, -0.3)
+
+
+    def test_chunking_is_invisible(self):
+        whole = hs_call_vector(self.spots, *self.params, cache=False,
+                               memory_budget=2**40, processes=1)
+        tiny = hs_call_vector(self.spots, *self.params, cache=False,
+                              memory_budget=1, processes=1)
+        npt.assert_array_equal(whole, tiny)
+
+
+    def test_pool_matches_serial(self):
+        serial = hs_call_vector(self.spots, *self.params, cache=False,
+                                memory_budget=2**20, processes=1)
+        pooled = hs_call_vector(self.spots, *self.params, cache=False,
+                                memory_budget=2**20, processes=2)
+        npt.assert_array_equal(serial, pooled)
+
+
+    def test_zero_spot_row(self):
+        res = hs_call_vector(self.spots, *self.params, cache=False, processes=1)
+        npt.assert_array_equal(res[0,:], 0)
+        single = HestonCos(self.spots[1:], 99.0, 0.06, self.vols, 1.0, 1.0,
+                           0.04, 0.2, -0.3).solve(cache=False)
+        npt.assert_array_equal(res[1:,:], single)
+
+
+class HestonCos_test(unittest.TestCase):
+
+    def setUp(self):
+        self.spots = np.linspace(1, 300, 40)
+        self.vols = np.sqrt(np.linspace(0.01, 1, 10))
+
+
+    def test_adaptive_within_tol(self):
+        for t, sigma, rho in ((1.0, 0.2, -0.3), (0.05, 0.3, 0.5), (5.0, 0.5, -0.7)):
+            params = (99.0, 0.06, self.vols, t, 1.5, 0.04, sigma, rho)
+            ref = HestonFundamental(self.spots, *params, tol=1e-12).solve(cache=False)
+            for tol in (1e-4, 1e-6):
+                res = HestonCos(self.spots, *params, tol=tol).solve(cache=False)
+                npt.assert_allclose(res, ref, rtol=0, atol=tol)
+
+
+    def test_adaptive_uses_fewer_terms(self):
+        H = HestonCos(self.spots, 99.0, 0.06, self.vols, 1.0, 1.0, 0.04, 0.2,
+                      -0.3, tol=1e-4)
+        H.solve(cache=False)
+        assert H.nterms < H.N, H.nterms
+
+
+    def test_adaptive_memory_estimate(self):
+        # Adaptive mode may keep up to max_terms terms
+        assert (HestonCos.bytes_per_point(tol=1e-6)
+                == HestonCos.bytes_per_point(N=HestonCos.max_terms))
+        assert (HestonCos.bytes_per_point(tol=1e-6)
+                > HestonCos.bytes_per_point())
+
+
+    def test_cache_key(self):
+        args = (self.spots, 99.0, 0.06, self.vols, 1.0, 1.0, 0.04, 0.2, -0.3)
+        assert (HestonCos(*args).cache_key()
+                != HestonCos(*args, tol=1e-6).cache_key())
+        assert (HestonCos(*args, tol=1e-6).cache_key()
+                != HestonCos(*args, tol=1e-8).cache_key())
+
+
+    def test_hs_call_vector_passes_tol(self):
+        params = (self.spots, 99.0, 0.06, self.vols, 1.0, 1.0, 0.04, 0.2, -0.3)
+        res = hs_call_vector(*params, cache=False, processes=1, tol=1e-6)
+        npt.assert_array_equal(res, HestonCos(*params, tol=1e-6).solve(cache=False))
+
+
+class HestonFundamental_test(unittest.TestCase):
+
+    def test_matches_cos(self):
+        spots = np.linspace(0, 300, 40)
+        vols = np.sqrt(np.linspace(0, 1, 25))
+        for t, rho in ((1.0, -0.3), (0.1, 0.5), (2.75, -0.7)):
+            params = (99.0, 0.06, vols, t, 1.5, 0.04, 0.3, rho)
+            cos = hs_call_vector(spots, *params, HFUNC=HestonCos,
+                                 cache=False, processes=1)
+            fun = hs_call_vector(spots, *params, HFUNC=HestonFundamental,
+                                 cache=False, processes=1)
+            # Skip the degenerate zero variance column
+            npt.assert_allclose(fun[:,1:], cos[:,1:], atol=1e-5)
+
+
+    def test_scalar(self):
+        H = HestonFundamental(100.0, 99.0, 0.06, 0.2, 1.0, 1.0, 0.04, 0.2, 0.0)
+        c = HestonCos(100.0, 99.0, 0.06, 0.2, 1.0, 1.0, 0.04, 0.2, 0.0)
+        npt.assert_allclose(H.solve(cache=False), c.solve(cache=False), atol=1e-7)
+
+
+class HestonFiniteDifferenceEngine_test(unittest.TestCase):
+
+    def test_grid_analytical_memoized(self):
+        option = HestonOption(spot=100, strike=99, volatility=0.2,
+                              mean_variance=0.04, vol_of_variance=0.2)
+        F = HestonFiniteDifferenceEngine(option, nspots=20, nvols=10,
+                                         cache=False, verbose=False)
+        a = F.grid_analytical
+        assert F.grid_analytical is a
+        assert not a.flags.writeable
+        option.variance.mean = 0.05
+        b = F.grid_analytical
+        assert b is not a
+        assert not np.allclose(a, b)
+
+
+    def test_nested(self):
+        x = np.arange(10.0)
+        npt.assert_array_equal(nested(x, 4), [0, 2, 4, 6, 8, 9])
+        npt.assert_array_equal(nested(x, 3), [0, 1, 3, 5, 7, 9])
+        npt.assert_array_equal(nested(x[:9], 4), [0, 2, 4, 6, 8])
+        option = HestonOption(spot=100, strike=99)
+        F = HestonFiniteDifferenceEngine(option, nspots=30, nvols=16,
+                                         cache=False, verbose=False)
+        C = F.nested_engine()
+        assert C.spots[C.idx[0]] == 100
+        assert C.vars[C.idx[1]] == F.vars[F.idx[1]]
+        assert set(C.spots) <= set(F.spots) and set(C.vars) <= set(F.vars)
+        assert len(C.spots) in (15, 16, 17), len(C.spots)
+        # Upwinding switches at the same place on the nested mesh
+        F = HestonFiniteDifferenceEngine(option, nspots=30, nvols=16,
+                                         flip_idx_spot=True, flip_idx_var=True,
+                                         cache=False, verbose=False)
+        C = F.nested_engine()
+        for dim, fine, coarse in ((0, F.spots, C.spots), (1, F.vars, C.vars)):
+            f = F.schemes[(dim,)][1]['from']
+            c = C.schemes[(dim,)][1]['from']
+            assert C.schemes[(dim,)][1]['scheme'] == F.schemes[(dim,)][1]['scheme']
+            assert coarse[c - 1] < fine[f] <= coarse[c], (dim, f, c)
+
+
+    def test_price_extrapolated_time(self):
+        option = HestonOption(spot=100, strike=99)
+        F = HestonFiniteDifferenceEngine(option, nspots=30, nvols=15,
+                                         cache=False, verbose=False)
+        r = F.price_extrapolated(8, theta=0.6)
+        V = F.solve_implicit(2, 1 / 16.0, F.grid.domain[0].copy())
+        V = F.solve_hundsdorferverwer(7, 1 / 8.0, V, theta=0.6)
+        assert r['fine'] == V[F.idx]
+        V = F.solve_implicit(2, 1 / 8.0, F.grid.domain[0].copy())
+        V = F.solve_hundsdorferverwer(3, 1 / 4.0, V, theta=0.6)
+        assert r['coarse'] == V[F.idx]
+        npt.assert_allclose(r['price'], (4 * r['fine'] - r['coarse']) / 3)
+        npt.assert_allclose(r['fine_error'], abs(r['fine'] - r['coarse']) / 3)
+        assert F.price_extrapolated(8, theta=0.6, parallel=True) == r
+        r = F.price_extrapolated(8, scheme='i', smoothing=0)
+        npt.assert_allclose(r['price'], 2 * r['fine'] - r['coarse'])
+        self.assertRaises(ValueError, F.price_extrapolated, 7)
+        self.assertRaises(ValueError, F.price_extrapolated, 4, smoothing=2)
+        # First order in time, second in space
+        self.assertRaises(ValueError, F.price_extrapolated, 8, scheme='d',
+                          mode='both')
+        r = F.price_extrapolated(8, scheme='d', mode='both', order=1)
+        assert r['order'] == 1
+
+
+    def test_price_extrapolated_space(self):
+        option = HestonOption(spot=100, strike=100, variance=0.04,
+                              mean_variance=0.04, vol_of_variance=0.4,
+                              correlation=-0.5)
+        exact = option.european_price()
+        F = HestonFiniteDifferenceEngine(option, nspots=100, nvols=50,
+                                         cache=False, verbose=False)
+        r = F.price_extrapolated(100, theta=0.5 + np.sqrt(3) / 6,
+                                 mode='space')
+        fine = abs(r['fine'] - exact)
+        assert abs(r['price'] - exact) < fine / 3, (r, exact)
+        assert fine / 3 < r['fine_error'] < 3 * fine, (r, exact)
+
+
+def main():
+    """Run main."""
+    import nose
+    nose.main()
+    return 0
+
+if __name__ == '__main__':
+    main()
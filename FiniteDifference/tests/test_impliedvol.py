@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# coding: utf8
+
+import unittest
+import warnings
+
+import numpy as np
+import numpy.testing as npt
+
+from FiniteDifference.blackscholes import bs_call_delta
+from FiniteDifference.impliedvol import implied_volatility
+
+
+class implied_volatility_test(unittest.TestCase):
+
+    def setUp(self):
+        rs = np.random.RandomState(0)
+        n = 10000
+        self.s = 100.0
+        self.r = 0.03
+        self.k = rs.uniform(40, 250, n)
+        self.t = rs.uniform(0.02, 5, n)
+        self.vol = rs.uniform(0.03, 1.5, n)
+        self.price, _, self.vega = bs_call_delta(self.s, self.k, self.r,
+                                                 self.vol, self.t)
+
+
+    def test_roundtrip(self):
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            iv = implied_volatility(self.price, self.s, self.k, self.r,
+                                    self.t)
+        # Where the price still carries information about the vol
+        ok = self.vega > 1e-2
+        npt.assert_allclose(iv[ok], self.vol[ok], rtol=1e-8)
+        repriced = bs_call_delta(self.s, self.k, self.r, iv, self.t)[0]
+        found = np.isfinite(iv)
+        npt.assert_allclose(repriced[found], self.price[found], rtol=0, atol=1e-10)
+
+
+    def test_unconverged(self):
+        iv = implied_volatility(self.price, self.s, self.k, self.r, self.t,
+                                maxiter=3)
+        full = implied_volatility(self.price, self.s, self.k, self.r, self.t)
+        # No best effort guesses, only converged vols or nan
+        assert np.isnan(iv).sum() > np.isnan(full).sum()
+        found = np.isfinite(iv)
+        npt.assert_allclose(iv[found], full[found], rtol=1e-8)
+        assert np.isnan(implied_volatility(self.price, self.s, self.k, self.r,
+                                           self.t, maxiter=0)).all()
+
+
+    def test_broadcast(self):
+        k = np.array([80.0, 100.0, 120.0])
+        t = np.array([[0.5], [2.0]])
+        price = bs_call_delta(100.0, k, 0.06, 0.25, t)[0]
+        iv = implied_volatility(price, 100.0, k, 0.06, t)
+        assert iv.shape == (2, 3)
+        npt.assert_allclose(iv, 0.25)
+
+
+    def test_arbitrage_bounds(self):
+        iv = implied_volatility([10.0, 0.5, 100.0, 5.0], 100.0, 95.0, 0.0,
+                                [1.0, 1.0, 1.0, 0.0])
+        assert np.isfinite(iv[0])
+        assert np.isnan(iv[1:]).all()
+
+
+def main():
+    """Run main."""
+    import nose
+    nose.main()
+    return 0
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# coding: utf8
+
+import threading
+import unittest
+from StringIO import StringIO
+
+import numpy as np
+import numpy.testing as npt
+
+from FiniteDifference import instrument
+from FiniteDifference.heston import HestonOption, HestonFiniteDifferenceEngine
+
+
+class Instrument_test(unittest.TestCase):
+
+    def test_nested_spans(self):
+        I = instrument.Instrument()
+        with I.span('a'):
+            with I.span('b'):
+                I.count('x')
+            with I.span('b'):
+                I.count('x', 2)
+        with I.span('b'):
+            pass
+        r = I.results()
+        assert sorted(r['spans']) == ['a', 'a/b', 'b'], r
+        assert r['spans']['a/b']['calls'] == 2
+        assert r['spans']['a']['seconds'] >= r['spans']['a/b']['seconds']
+        assert r['counters'] == {'x': 3}
+        I.reset()
+        assert I.results() == {'spans': {}, 'counters': {}}
+
+
+    def test_exception_closes_span(self):
+        I = instrument.Instrument()
+        try:
+            with I.span('a'):
+                raise ValueError
+        except ValueError:
+            pass
+        with I.span('b'):
+            pass
+        assert sorted(I.results()['spans']) == ['a', 'b']
+
+
+    def test_threads(self):
+        I = instrument.Instrument()
+        def work():
+            for _ in range(100):
+                with I.span('outer'):
+                    with I.span('inner'):
+                        I.count('n')
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        r = I.results()
+        assert sorted(r['spans']) == ['outer', 'outer/inner'], r
+        assert r['spans']['outer/inner']['calls'] == 400
+        assert r['counters']['n'] == 400
+
+
+    def test_null(self):
+        N = instrument.NULL
+        with N.span('a'):
+            N.count('x')
+            N.step('s', 0, 1)
+        ops = [object()]
+        assert N.timed(ops) is ops
+        assert N.results() == {'spans': {}, 'counters': {}}
+
+
+    def test_reporter(self):
+        out = StringIO()
+        I = instrument.Instrument(reporter=instrument.Reporter(out))
+        with I.span('solve'):
+            with I.span('apply'):
+                pass
+            for k in range(20):
+                I.step('Douglas', k, 20)
+        lines = out.getvalue().splitlines()
+        assert lines[0].startswith('solve: '), lines
+        assert len(lines) == 1, lines
+        assert I.results()['counters']['steps'] == 20
+
+
+class Engine_test(unittest.TestCase):
+
+    def setUp(self):
+        self.option = HestonOption(spot=100, strike=100, interest_rate=0.03,
+                                   volatility=0.2, tenor=1.0,
+                                   mean_reversion=1, mean_variance=0.12,
+                                   vol_of_variance=0.3, correlation=0.4)
+
+
+    def engine(self, instrument=None):
+        F = HestonFiniteDifferenceEngine(self.option, nspots=30, nvols=20,
+                                         cache=False, verbose=False,
+                                         instrument=instrument)
+        F.init()
+        return F
+
+
+    def test_default_is_null(self):
+        F = self.engine()
+        assert F.instrument is None
+        assert F.instrumentation == {'spans': {}, 'counters': {}}
+
+
+    def test_spans(self):
+        I = instrument.Instrument()
+        F = self.engine(I)
+        V = F.solve_douglas(10, 0.1, F.grid.domain[0].copy(), theta=0.65)
+        spans = F.instrumentation['spans']
+        for k in ('grid', 'init', 'init/templates', 'init/mixed_derivatives',
+                  'init/scale_and_combine', 'douglas', 'douglas/setup',
+                  'douglas/fold', 'douglas/unfold', 'douglas/apply',
+                  'douglas/solve'):
+            assert k in spans, (k, sorted(spans))
+        assert spans['douglas/solve']['calls'] == 10 * 2
+        counters = F.instrumentation['counters']
+        assert counters['steps'] == 10
+        assert counters['operator_copies'] > 0
+        assert counters['temporaries'] > 0
+        # The same answer as without
+        G = self.engine()
+        W = G.solve_douglas(10, 0.1, G.grid.domain[0].copy(), theta=0.65)
+        npt.assert_array_equal(V, W)
+        assert not any(L.is_folded() for L in F.operators.values())
+
+
+    def test_schemes(self):
+        I = instrument.Instrument()
+        F = self.engine(I)
+        for name, f in [('implicit', F.solve_implicit),
+                        ('hundsdorferverwer', F.solve_hundsdorferverwer),
+                        ('craigsneyd', F.solve_craigsneyd),
+                        ('craigsneyd2', F.solve_craigsneyd2)]:
+            f(5, 0.1, F.grid.domain[0].copy())
+            assert name + '/solve' in F.instrumentation['spans'], name
+        assert 'craigsneyd/cross' in F.instrumentation['spans']
+        assert F.instrumentation['counters']['steps'] == 20
+        F.solve_smooth(5, 0.1, F.grid.domain[0].copy(), smoothing_steps=1)
+        assert 'smooth/implicit' in F.instrumentation['spans']
+        assert 'smooth/hundsdorferverwer' in F.instrumentation['spans']
+
+
+def main():
+    """Run main."""
+    import nose
+    nose.main()
+    return 0
+
+if __name__ == '__main__':
+    main()
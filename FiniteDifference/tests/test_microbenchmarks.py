@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# coding: utf8
+
+import unittest
+
+import numpy as np
+
+from FiniteDifference import microbenchmarks as mb
+from FiniteDifference import benchmarks
+
+
+class microbenchmarks_test(unittest.TestCase):
+
+    def test_operator(self):
+        B = mb.operator(3, 20, 'penta')
+        assert B.shape == (60, 60) and B.blocks == 3
+        assert tuple(B.D.offsets) == (2, 1, 0, -1, -2)
+        assert not B.is_folded()
+        F = mb.operator(3, 20, 'penta', folded=True)
+        assert F.is_folded() and F.is_tridiagonal()
+        V = np.random.RandomState(2).random_sample(60)
+        np.testing.assert_allclose(F.apply(V), B.apply(V), rtol=1e-12)
+        np.testing.assert_allclose(F.solve(V), B.solve(V), rtol=1e-10)
+        self.assertRaises(ValueError, mb.operator, 1, 20, 'tri', True)
+
+
+    def test_sweep(self):
+        results = mb.sweep(blocks=(2,), block_lens=(20,), min_time=1e-6)
+        for r in results:
+            for k in mb.COLUMNS:
+                assert k in r, k
+            assert r['points'] == 40
+            # Every primitive really ran; a fast one may time as 0
+            assert 0 <= r['ns_per_point'] < np.inf, r
+            assert r['calls'] >= 1, r
+        done = set((r['bandwidth'], r['folded'], r['primitive'])
+                   for r in results)
+        assert ('tri', False, 'splice_with') in done
+        assert ('penta', False, 'diagonalize') in done
+        assert ('penta', True, 'fold_vector') in done
+        assert ('tri', False, 'diagonalize') not in done
+        # Not defined on folded operators
+        assert ('penta', True, 'add_operator') not in done
+        comparison = benchmarks.compare(results, results, key=mb.KEY,
+                                        metric='ns_per_point')
+        assert set(r['status'] for r in comparison) == set(['ok'])
+        lines = list(benchmarks.report(comparison, key=mb.KEY))
+        assert len(lines) == len(results) + 1
+
+
+    def test_primitive_subset(self):
+        results = mb.run_case(1, 20, 'tri', False, names=('apply',),
+                              min_time=1e-6)
+        assert [r['primitive'] for r in results] == ['apply']
+        assert np.isfinite(results[0]['ns_per_point'])
+        assert results[0]['calls'] >= 1
+
+
+def main():
+    """Run main."""
+    import nose
+    nose.main()
+    return 0
+
+if __name__ == '__main__':
+    main()
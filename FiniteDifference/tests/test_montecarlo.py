@@ -0,0 +1,381 @@
+#!/usr/bin/env python
+# coding: utf8
+
+import cPickle
+import unittest
+
+import numpy as np
+import numpy.testing as npt
+
+from FiniteDifference import montecarlo
+from FiniteDifference.heston import (HestonOption, HestonBarrierOption,
+                                     HestonCos)
+from FiniteDifference.blackscholes import BlackScholesBarrierOption
+
+
+class RunningStats_test(unittest.TestCase):
+
+    def test_matches_numpy(self):
+        rs = np.random.RandomState(0)
+        x = rs.standard_normal(10001) * 3 + 1e6
+        stats = montecarlo.RunningStats()
+        for b in np.array_split(x, 7):
+            stats.push(b)
+        assert stats.n == x.size
+        npt.assert_allclose(stats.mean, x.mean(), rtol=1e-14)
+        npt.assert_allclose(stats.std, x.std(), rtol=1e-9)
+        npt.assert_allclose(stats.error, x.std() / np.sqrt(x.size), rtol=1e-9)
+
+
+    def test_columns_and_merge(self):
+        rs = np.random.RandomState(1)
+        x = rs.standard_normal((1000, 3))
+        a = montecarlo.RunningStats().push(x[:300])
+        b = montecarlo.RunningStats().push(x[300:])
+        a.merge(b)
+        npt.assert_allclose(a.mean, x.mean(axis=0))
+        npt.assert_allclose(a.variance, x.var(axis=0))
+        npt.assert_allclose(a.covariance, np.cov(x.T, bias=1), atol=1e-14)
+
+
+    def test_histogram(self):
+        x = np.arange(10.0)
+        edges = np.array([0.0, 5.0, 10.0])
+        stats = montecarlo.RunningStats(edges)
+        stats.push(x[:4]).push(x[4:])
+        npt.assert_array_equal(stats.counts, [5, 5])
+
+
+class montecarlo_test(unittest.TestCase):
+
+    def setUp(self):
+        self.option = HestonOption(spot=100, strike=99, volatility=0.2,
+                                   mean_variance=0.04, vol_of_variance=0.3,
+                                   correlation=-0.5)
+
+
+    def test_spawn(self):
+        a = montecarlo.spawn(42, 4)
+        assert len(a) == 4
+        for x, y in zip(a, montecarlo.spawn(42, 4)):
+            npt.assert_array_equal(x, y)
+        assert not np.array_equal(a[0], a[1])
+        assert not np.array_equal(a[0], montecarlo.spawn(43, 1)[0])
+
+
+    def test_split(self):
+        assert montecarlo.split(10, 3) == [4, 3, 3]
+        assert sum(montecarlo.split(1001, 8)) == 1001
+
+
+    def test_reproducible(self):
+        a = montecarlo.paths(self.option, 0.05, 1001, seed=7, processes=1, chunks=3)
+        b = montecarlo.paths(self.option, 0.05, 1001, seed=7, processes=1, chunks=3)
+        c = montecarlo.paths(self.option, 0.05, 1001, seed=8, processes=1, chunks=3)
+        assert a.shape == (1001,)
+        npt.assert_array_equal(a, b)
+        assert not np.array_equal(a, c)
+
+
+    def test_pool_matches_serial(self):
+        serial = montecarlo.paths(self.option, 0.05, 1000, seed=7,
+                                  processes=1, chunks=2)
+        pooled = montecarlo.paths(self.option, 0.05, 1000, seed=7,
+                                  processes=2)
+        npt.assert_array_equal(serial, pooled)
+
+
+    def test_monte_carlo(self):
+        res = self.option.monte_carlo(dt=0.05, npaths=20000, seed=1, processes=2)
+        again = self.option.monte_carlo(dt=0.05, npaths=20000, seed=1, processes=2)
+        assert res['n'] == 20000
+        assert res['expected'] == again['expected']
+        an = self.option.analytical
+        assert abs(res['expected'] - an) < 4*res['error'], (res, an)
+
+
+    def test_streaming(self):
+        edges = np.linspace(0, 100, 11)
+        res = self.option.monte_carlo(dt=0.05, npaths=20001, seed=1,
+                                      batch_size=1000, edges=edges)
+        again = self.option.monte_carlo(dt=0.05, npaths=20001, seed=1,
+                                        batch_size=1000, edges=edges)
+        assert res['n'] == 20001
+        assert res['expected'] == again['expected']
+        counts, e = res['histogram']
+        assert counts.sum() <= 20001
+        an = self.option.analytical
+        assert abs(res['expected'] - an) < 4*res['error'], (res, an)
+        self.assertRaises(ValueError, self.option.monte_carlo, npaths=10,
+                          batch_size=5, with_payoff=True)
+
+
+    def test_target_error(self):
+        target = 0.05
+        res = self.option.monte_carlo(dt=0.1, seed=3, batch_size=2000,
+                                      target_error=target)
+        assert 1.96 * res['error'] <= target
+        assert res['n'] % 2000 == 0
+        again = self.option.monte_carlo(dt=0.1, seed=3, batch_size=2000,
+                                        target_error=target)
+        assert res['expected'] == again['expected']
+        assert res['n'] == again['n']
+
+        capped = self.option.monte_carlo(dt=0.1, seed=3, batch_size=2000,
+                                         target_error=1e-9, max_paths=5000)
+        assert capped['n'] == 5000
+
+
+    def test_variance_reduction(self):
+        an = self.option.analytical
+        res = self.option.monte_carlo(dt=0.05, npaths=20000, seed=1,
+                                      processes=1, antithetic=True,
+                                      control_variate=True, conditional=True)
+        assert res['n'] == 20000
+        for name in ('plain', 'antithetic', 'control', 'conditional'):
+            expected, error = res['estimates'][name]
+            assert abs(expected - an) < 4*error, (name, expected, error, an)
+        vrf = res['variance_reduction']
+        assert vrf['conditional'] > vrf['antithetic'] > 1, vrf
+        assert vrf['control'] >= vrf['conditional'], vrf
+        assert res['expected'] == res['estimates']['control'][0]
+
+
+    def test_qmc(self):
+        an = self.option.analytical
+        res = self.option.monte_carlo(dt=0.1, npaths=4096, seed=1,
+                                      processes=1, randomizations=8)
+        again = self.option.monte_carlo(dt=0.1, npaths=4096, seed=1,
+                                        processes=2, randomizations=8)
+        assert res['expected'] == again['expected']
+        assert res['randomizations'] == 8
+        assert abs(res['expected'] - an) < 4*res['error'], (res, an)
+        plain = self.option.monte_carlo(dt=0.1, npaths=8*4096, seed=1,
+                                        processes=1, batch_size=4096)
+        assert res['error'] < plain['error'] / 4, (res, plain)
+        self.assertRaises(ValueError, self.option.monte_carlo, npaths=16,
+                          randomizations=2, antithetic=True)
+
+
+    def test_barrier_control_variate(self):
+        option = HestonBarrierOption(spot=100, strike=99, volatility=0.2,
+                                     mean_variance=0.04, vol_of_variance=0.3,
+                                     correlation=-0.5, top=(False, 130.0))
+        plain = option.monte_carlo(dt=0.05, npaths=20000, seed=2,
+                                   processes=1, batch_size=5000)
+        res = option.monte_carlo(dt=0.05, npaths=20000, seed=2, processes=1,
+                                 batch_size=5000, control_variate=True)
+        assert res['variance_reduction']['control'] > 1
+        npt.assert_allclose(res['estimates']['plain'][0], plain['expected'],
+                            rtol=1e-12)
+        assert (abs(res['expected'] - plain['expected'])
+                < 4*plain['error']), (res, plain)
+        self.assertRaises(ValueError, option.monte_carlo, npaths=10,
+                          conditional=True)
+
+
+    def test_greeks(self):
+        o = self.option
+        def cos(spot=o.spot, vol=o.volatility):
+            return HestonCos(spot, o.strike, o.interest_rate.value, vol,
+                             o.tenor, o.variance.reversion, o.variance.mean,
+                             o.variance.volatility, o.correlation).solve()
+        h = 1e-3
+        delta = (cos(spot=o.spot + h) - cos(spot=o.spot - h)) / (2*h)
+        vega = (cos(vol=o.volatility + h) - cos(vol=o.volatility - h)) / (2*h)
+        res = o.monte_carlo(dt=0.05, npaths=20000, seed=1, processes=1,
+                            antithetic=True, greeks='vega')
+        deltas = o.monte_carlo(dt=0.05, npaths=20000, seed=1, processes=1,
+                               antithetic=True, greeks=True)
+        plain = o.monte_carlo(dt=0.05, npaths=20000, seed=1, processes=1,
+                              antithetic=True)
+        npt.assert_allclose(res['expected'], plain['expected'], rtol=1e-12)
+        for name, an in (('delta', delta), ('delta_lr', delta),
+                         ('vega', vega)):
+            assert abs(res[name] - an) < 4*res[name + '_error'], (name, res, an)
+        assert res['delta_error'] < res['delta_lr_error'] / 4
+        # Without the shadow paths the deltas come from the same draws
+        assert 'vega' not in deltas
+        for name in ('expected', 'delta', 'delta_lr'):
+            npt.assert_allclose(deltas[name], res[name], rtol=1e-12)
+
+
+    def test_barrier_greeks(self):
+        option = HestonBarrierOption(spot=100, strike=99, volatility=0.2,
+                                     mean_variance=0.04, vol_of_variance=0.3,
+                                     correlation=-0.5, top=(False, 130.0))
+        res = option.monte_carlo(dt=0.05, npaths=20000, seed=2, processes=1,
+                                 greeks='vega')
+        assert res['delta'] == res['delta_lr']
+        # Knocking out more paths as the volatility rises
+        assert res['vega'] < -4*res['vega_error'], res
+        self.assertRaises(ValueError, option.monte_carlo, npaths=10,
+                          greeks=True, bridge=True)
+
+
+    def test_barrier_monitor(self):
+        s = np.linspace(80.0, 120.0, 9)
+        monitor = montecarlo.BarrierMonitor(bottom=(False, 90.0),
+                                            top=(True, 110.0))
+        state = np.zeros(9, dtype=bool)
+        hits = -np.ones(9, dtype=int)
+        monitor(s, state, hits, 4)
+        npt.assert_array_equal(state, (s > 90) & (s >= 110))
+        npt.assert_array_equal(hits, np.where(s >= 110, 4, -1))
+        assert not monitor.compact
+        monitor(s - 30, state, hits, 5)
+        npt.assert_array_equal(state, np.zeros(9, dtype=bool))
+        # First changes only
+        npt.assert_array_equal(hits, np.where(s >= 110, 4, -1))
+        out = montecarlo.BarrierMonitor(top=(False, 110.0))
+        state = np.ones(9, dtype=bool)
+        out(s, state)
+        npt.assert_array_equal(state, s < 110)
+        assert out.compact
+
+
+    def test_compaction(self):
+        option = HestonBarrierOption(spot=100, strike=99, volatility=0.2,
+                                     mean_variance=0.04, vol_of_variance=0.3,
+                                     correlation=-0.5, top=(False, 110.0),
+                                     bottom=(False, 90.0))
+        monitor = option.monte_carlo_callback
+        ret = []
+        for compact in (False, True):
+            St, Vt, state, intV, score = option._simulate(
+                0.01, 2000, monitor, False, np.random.RandomState(4),
+                compact=compact)
+            ret.append(St * state)
+        assert 0 < np.count_nonzero(ret[0]) < 1000
+        npt.assert_array_equal(ret[0], ret[1])
+        s, t = option.monte_carlo_paths(0.01, 2000, monitor, verbose=False,
+                                        random_state=np.random.RandomState(4),
+                                        first_hit=True)
+        npt.assert_array_equal(s, ret[0])
+        npt.assert_array_equal(np.isinf(t), s > 0)
+
+
+    def test_step_size(self):
+        for t in (1.0, 0.3, 2.75, 1/3.):
+            for steps in (1, 3, 10, 1024, 3000):
+                assert int(t / montecarlo.step_size(t, steps)) == steps
+
+
+    def test_coupled_normals(self):
+        fine = montecarlo.CoupledNormals(np.random.RandomState(4))
+        coarse = montecarlo.CoupledNormals(np.random.RandomState(4), True)
+        f = list(fine.draws(4, 10))
+        c = list(coarse.draws(2, 10))
+        for i in range(2):
+            for j in range(2):
+                npt.assert_allclose(c[i][j],
+                        (f[2*i][j] + f[2*i+1][j]) / np.sqrt(2))
+            npt.assert_allclose(c[i][2], montecarlo.ndtr(c[i][1]))
+
+
+    def test_bridge(self):
+        # A barrier that is never near is never crossed
+        far = HestonBarrierOption(top=(False, 1e6))
+        a = far.monte_carlo_samples(0.1, 1000, far.monte_carlo_callback,
+                                    random_state=np.random.RandomState(1),
+                                    bridge=True)
+        b = far.monte_carlo_samples(0.1, 1000, far.monte_carlo_callback,
+                                    random_state=np.random.RandomState(1))
+        npt.assert_array_equal(a, b)
+        # In and out make the vanilla
+        samples = []
+        for knockin in (True, False):
+            option = HestonBarrierOption(top=(knockin, 115.0))
+            samples.append(option.monte_carlo_samples(
+                0.1, 1000, None, random_state=np.random.RandomState(1),
+                bridge=True))
+        npt.assert_allclose(samples[0] + samples[1], b)
+        self.assertRaises(ValueError, self.option.monte_carlo_samples, 0.1,
+                          10, None, bridge=True)
+
+
+    def test_mlmc(self):
+        target = 0.1
+        res = self.option.monte_carlo(dt=0.25, target_error=target, seed=1,
+                                      processes=1, multilevel=True)
+        again = self.option.monte_carlo(dt=0.25, target_error=target, seed=1,
+                                        processes=1, multilevel=True)
+        assert res['expected'] == again['expected']
+        assert res['converged']
+        assert len(res['levels']) >= 3
+        assert 1.96 * res['error'] <= target / np.sqrt(2) * 1.01
+        an = self.option.analytical
+        assert abs(res['expected'] - an) < target, (res, an)
+        # Finer levels need fewer paths
+        n = [l['n'] for l in res['levels']]
+        assert n == sorted(n, reverse=True), n
+
+
+    def test_mlmc_cost(self):
+        res = self.option.monte_carlo(dt=0.25, target_error=0.1, seed=1,
+                                      processes=1, multilevel=True)
+        levels = res['levels']
+        # The corrections vary much less than the payoff and decay with dt
+        v = [l['variance'] for l in levels]
+        assert v[1] < v[0] / 10, v
+        assert v[-1] < v[1], v
+        # Plain MC at the finest step for the same standard error
+        plain = v[0] / res['error']**2 * levels[-1]['steps']
+        assert res['cost'] < plain, (res['cost'], plain)
+
+
+    def test_pickle_barrier(self):
+        option = HestonBarrierOption(top=(False, 120.0))
+        p = cPickle.loads(cPickle.dumps(option, -1))
+        s = np.array([100.0, 130.0])
+        state = np.ones(2, dtype=bool)
+        p.monte_carlo_callback(s, state)
+        npt.assert_array_equal(state, [True, False])
+
+
+class BlackScholesBarrier_test(unittest.TestCase):
+
+    def test_matches_analytical(self):
+        # The bridge makes even a single step exact
+        for barrier in (dict(top=(False, 120.0)), dict(top=(True, 120.0)),
+                        dict(bottom=(False, 90.0)), dict(bottom=(True, 90.0))):
+            option = BlackScholesBarrierOption(strike=99, **barrier)
+            an = option.analytical
+            for dt in (1.0, 0.1):
+                res = option.monte_carlo(dt=dt, npaths=50000, seed=1)
+                assert abs(res['expected'] - an) < 4*res['error'], (barrier, dt, res, an)
+
+
+    def test_in_plus_out(self):
+        prices = []
+        for knockin in (True, False):
+            option = BlackScholesBarrierOption(strike=99, top=(knockin, 110.0))
+            prices.append(option.monte_carlo_paths(
+                0.25, 1000, option.monte_carlo_callback,
+                random_state=np.random.RandomState(3)))
+        # Every path is either knocked in or still alive
+        npt.assert_array_equal((prices[0] > 0) ^ (prices[1] > 0), True)
+
+
+    def test_double_barrier_crossings(self):
+        # With one long step some paths cross both barriers; each crossing
+        # must reach the callback.
+        option = BlackScholesBarrierOption(strike=99, top=(True, 105.0))
+        # The constructor refuses double barriers, which have no analytical
+        # price, but the simulation handles them.
+        option.bottom = (True, 95.0)
+        seen = []
+        option.monte_carlo_paths(1.0, 10000, lambda s, state: seen.append(s),
+                                 random_state=np.random.RandomState(3))
+        assert len(seen) == 2
+        assert ((seen[0] == 95.0) & (seen[1] == 105.0)).any()
+
+
+def main():
+    """Run main."""
+    import nose
+    nose.main()
+    return 0
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# coding: utf8
+
+import warnings
+import unittest
+from StringIO import StringIO
+
+import numpy as np
+import numpy.testing as npt
+
+from FiniteDifference import observers
+from FiniteDifference.heston import HestonOption, HestonFiniteDifferenceEngine
+
+
+class Observers_test(unittest.TestCase):
+
+    def setUp(self):
+        option = HestonOption(spot=100, strike=100, interest_rate=0.03,
+                              volatility=0.2, tenor=1.0, mean_reversion=1,
+                              mean_variance=0.12, vol_of_variance=0.3,
+                              correlation=0.4)
+        self.F = HestonFiniteDifferenceEngine(option, nspots=30, nvols=20,
+                                              cache=False, verbose=False)
+        self.F.init()
+        self.V0 = self.F.grid.domain[0].copy()
+
+
+    def test_default_none(self):
+        assert self.F.observers is None
+        V = self.F.solve_douglas(10, 0.1, self.V0)
+        self.F.observers = [observers.Observer()]
+        W = self.F.solve_douglas(10, 0.1, self.V0)
+        npt.assert_array_equal(V, W)
+
+
+    def test_every(self):
+        calls = []
+        class Watch(observers.Observer):
+            every = 3
+            def on_start(self, engine, label, n, dt, V):
+                calls.append(('start', label, n))
+            def on_step(self, engine, k, V):
+                calls.append(('step', k))
+            def on_finish(self, engine, k, V):
+                calls.append(('finish', k))
+        self.F.observers = [Watch()]
+        self.F.solve_hundsdorferverwer(10, 0.1, self.V0)
+        assert calls == [('start', 'Hundsdorfer-Verwer', 10), ('step', 0),
+                         ('step', 3), ('step', 6), ('step', 9),
+                         ('finish', 10)], calls
+
+
+    def test_nan_guard(self):
+        V0 = self.V0.copy()
+        V0[5, 5] = np.nan
+        for check in ('full', 'checksum'):
+            guard = observers.NaNGuard(every=1, check=check)
+            self.F.observers = [guard]
+            with warnings.catch_warnings(record=True) as w:
+                warnings.simplefilter('always')
+                self.F.solve_douglas(10, 0.1, V0)
+            assert guard.failed == 0, (check, guard.failed)
+            assert 'Douglas fail' in str(w[0].message)
+        # A NaN spreads, so sampling catches it a few steps later
+        guard = observers.NaNGuard(every=1, check='sample', samples=16)
+        snaps = observers.Snapshots(every=0)
+        self.F.observers = [guard, snaps]
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            self.F.solve_explicit(20, 0.0001, V0)
+        assert 0 < guard.failed < 20, guard.failed
+        assert snaps.snapshots[-1][0] == guard.failed
+        guard = observers.NaNGuard(every=1, check='full', action='raise')
+        self.F.observers = [guard]
+        self.assertRaises(FloatingPointError, self.F.solve_implicit, 5, 0.1, V0)
+        self.assertRaises(ValueError, observers.NaNGuard, check='none')
+        # Stopped solves still unfold their operators
+        assert not any(L.is_folded() for L in self.F.operators.values())
+
+
+    def test_inf_guard(self):
+        V = self.V0.copy()
+        # The first point is always among the samples
+        V.flat[0] = np.inf
+        for check in ('sample', 'checksum', 'full'):
+            guard = observers.NaNGuard(check=check)
+            guard.on_start(self.F, 'test', 1, 0.1, V)
+            assert guard.finite(self.V0), check
+            assert not guard.finite(V), check
+
+
+    def test_progress(self):
+        out = StringIO()
+        self.F.observers = [observers.Progress(stream=out)]
+        self.F.solve_craigsneyd2(20, 0.05, self.V0)
+        assert out.getvalue() == "Craig-Sneyd 2:\t0 10 20 30 40 50 60 70 80 90 \n"
+
+
+    def test_snapshots_and_timer(self):
+        snaps = observers.Snapshots(every=5)
+        timer = observers.Timer()
+        self.F.observers = [snaps, timer]
+        V = self.F.solve_smooth(10, 0.1, self.V0, smoothing_steps=1)
+        # The two implicit half steps, then nine Hundsdorfer-Verwer steps
+        assert [(k, t) for k, t, _ in snaps.snapshots] == [
+            (0, 0.1), (2, 0.0), (0, 0.9), (5, 0.4), (9, 0.0)], snaps.snapshots
+        npt.assert_array_equal(snaps.snapshots[-1][2], V)
+        npt.assert_array_equal(snaps.snapshots[0][2], self.V0)
+        assert [r['label'] for r in timer.runs] == ['solve_implicit',
+                                                    'Hundsdorfer-Verwer']
+        assert [r['steps'] for r in timer.runs] == [2, 9]
+        assert all(r['seconds'] > 0 for r in timer.runs)
+
+
+def main():
+    """Run main."""
+    import nose
+    nose.main()
+    return 0
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# coding: utf8
+
+import unittest
+
+import numpy as np
+import numpy.testing as npt
+from numpy import exp, log, sqrt
+
+from FiniteDifference.qe import QEStepper, SHI_CRT
+
+
+def reference_step(S, V, Z0, Z1, u, r, kpp, tht, epp, rho, dt):
+    """Andersen's QE step written out branch by branch."""
+    gmm1 = gmm2 = 0.5
+    m = tht + (V-tht)*exp(-kpp*dt)
+    s2 = (V*epp**2*exp(-kpp*dt)*(1-exp(-kpp*dt))/kpp
+          + tht*epp**2*(1-exp(-kpp*dt))**2/(2*kpp))
+    shi = s2/m**2
+    C1 = gmm1*dt*(kpp*rho/epp-0.5) - rho/epp
+    C2 = gmm2*dt*(kpp*rho/epp-0.5) + rho/epp
+    C3 = sqrt((1-rho**2)*dt)
+    A = C2 + 0.5*C3**2*gmm2
+    quad = shi <= SHI_CRT
+    with np.errstate(all='ignore'):
+        c4 = 2/shi
+        b2 = np.maximum(c4-1+sqrt(c4*(c4-1)), 0)
+        a = m/(1+b2)
+        Vq = a*(sqrt(b2)+Z1)**2
+        Cq = -A*b2*a/(1-2*A*a) + 0.5*log(1-2*A*a)
+        p = (shi-1)/(shi+1)
+        bet = (1-p)/m
+        Ve = log((1-p)/(1-u))/bet*(u > p)
+        Ce = -log(p+bet*(1-p)/(bet-A))
+    Vdt = np.where(quad, Vq, Ve)
+    C00 = np.where(quad, Cq, Ce) - (C1+0.5*C3**2*gmm1)*V
+    Sdt = S*exp(r*dt + C00 + C1*V + C2*Vdt + C3*sqrt(gmm1*V+gmm2*Vdt)*Z0)
+    return Sdt, Vdt, quad
+
+
+class QEStepper_test(unittest.TestCase):
+
+    def test_matches_reference(self):
+        rs = np.random.RandomState(0)
+        n = 10000
+        branches = []
+        for params in ((0.06, 1.0, 0.04, 0.3, -0.5, 0.01),
+                       (0.06, 2.0, 0.04, 1.5, -0.7, 0.1)):
+            V = rs.exponential(0.04, n) * rs.random_sample(n)**3
+            V[:10] = 0
+            S = 100*np.exp(0.2*rs.standard_normal(n))
+            Z0, Z1 = rs.standard_normal((2, n))
+            u = rs.random_sample(n)
+            S_out, V_out = np.empty(n), np.empty(n)
+            QEStepper(*params).step(S, V, Z0, Z1, u, S_out, V_out)
+            Sdt, Vdt, quad = reference_step(S, V, Z0, Z1, u, *params)
+            npt.assert_allclose(V_out, Vdt, rtol=1e-12, atol=1e-15)
+            npt.assert_allclose(S_out, Sdt, rtol=1e-12)
+            branches.append(quad)
+        # Both branches were exercised
+        branches = np.concatenate(branches)
+        assert branches.any() and not branches.all()
+
+
+    def test_run(self):
+        class Source(object):
+            def draws(self, nsteps, npaths):
+                rs = np.random.RandomState(1)
+                for i in range(nsteps):
+                    yield (rs.standard_normal(npaths),
+                           rs.standard_normal(npaths), rs.random_sample(npaths))
+        stepper = QEStepper(0.06, 1.0, 0.04, 0.3, -0.5, 0.1)
+        S, V = np.empty(100), np.empty(100)
+        S[:], V[:] = 100.0, 0.04
+        S_out, V_out = np.empty(100), np.empty(100)
+        steps = list(Source().draws(10, 100))
+        for i, (s, v, s_prev, v_prev) in enumerate(
+                stepper.run(100.0, 0.04, 10, 100, Source())):
+            stepper.step(S, V, steps[i][0], steps[i][1], steps[i][2],
+                         S_out, V_out)
+            npt.assert_array_equal(s_prev, S)
+            npt.assert_array_equal(s, S_out)
+            npt.assert_array_equal(v, V_out)
+            S, S_out = S_out.copy(), S
+            V, V_out = V_out.copy(), V
+        assert i == 9
+
+
+def main():
+    """Run main."""
+    import nose
+    nose.main()
+    return 0
+
+if __name__ == '__main__':
+    main()
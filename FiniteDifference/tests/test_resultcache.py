@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# coding: utf8
+
+import os
+import shutil
+import pickle
+import tempfile
+import unittest
+
+import numpy as np
+import numpy.testing as npt
+
+from FiniteDifference.resultcache import ResultCache, digest
+
+
+class digest_test(unittest.TestCase):
+
+    def test_stable(self):
+        a = np.linspace(0, 1, 7)
+        self.assertEqual(digest('x', a, 0.1, 3), digest('x', a.copy(), 0.1, 3.0))
+
+
+    def test_exact_floats(self):
+        a = np.linspace(0, 1, 7)
+        b = a.copy()
+        b[3] = np.nextafter(b[3], 2)
+        self.assertNotEqual(digest(a), digest(b))
+        self.assertNotEqual(digest(0.1), digest(np.nextafter(0.1, 1)))
+
+
+    def test_shape_and_order_matter(self):
+        a = np.arange(6.0)
+        self.assertNotEqual(digest(a), digest(a.reshape(2, 3)))
+        self.assertNotEqual(digest(1.0, 2.0), digest(2.0, 1.0))
+        self.assertNotEqual(digest('ab', 'c'), digest('a', 'bc'))
+
+
+class ResultCache_test(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.cache = ResultCache(os.path.join(self.dir, 'cache'))
+
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+
+    def test_roundtrip_disk(self):
+        a = np.random.random((4, 5))
+        self.cache.put('k', a)
+        fresh = ResultCache(self.cache.directory)
+        b = fresh.get('k')
+        npt.assert_array_equal(a, b)
+        assert isinstance(b, np.memmap)
+        assert not b.flags.writeable
+        assert fresh.get('missing') is None
+
+
+    def test_memory_tier(self):
+        a = np.arange(10.0)
+        b = self.cache.put('k', a)
+        assert b is not a
+        assert not b.flags.writeable
+        os.remove(self.cache.path('k'))
+        npt.assert_array_equal(self.cache.get('k'), a)
+        a[0] = 99
+        self.assertEqual(self.cache.get('k')[0], 0)
+
+
+    def test_no_partial_files(self):
+        self.cache.put('k', np.arange(10.0))
+        self.assertEqual(os.listdir(self.cache.directory), ['k.npy'])
+
+
+    def test_lru_eviction(self):
+        a = np.zeros(1000)
+        self.cache.max_bytes = 3 * 8000 + 3 * 200
+        for i, k in enumerate('abcd'):
+            self.cache.put(k, a + i)
+            os.utime(self.cache.path(k), (i, i))
+            if k == 'c':
+                # Touch 'a' so that 'b' is the least recently used
+                self.cache.memory_bytes = 0
+                self.cache._memory.clear()
+                self.cache.get('a')
+        names = sorted(os.listdir(self.cache.directory))
+        self.assertEqual(names, ['a.npy', 'c.npy', 'd.npy'])
+
+
+    def test_pickle(self):
+        self.cache.put('k', np.arange(3.0))
+        other = pickle.loads(pickle.dumps(self.cache))
+        self.assertEqual(other.directory, self.cache.directory)
+        npt.assert_array_equal(other.get('k'), np.arange(3.0))
+
+
+def main():
+    """Run main."""
+    import nose
+    nose.main()
+    return 0
+
+if __name__ == '__main__':
+    main()
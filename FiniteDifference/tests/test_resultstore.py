@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+# coding: utf8
+
+import os
+import glob
+import time
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import numpy.testing as npt
+
+from FiniteDifference import resultstore
+from FiniteDifference.resultstore import ResultStore
+from FiniteDifference.heston import HestonOption, HestonBarrierOption
+
+
+class ResultStore_test(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.store = ResultStore(os.path.join(self.dir, 'store'))
+
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+
+    def runs(self, scheme, n, start=0):
+        return [dict(scheme=scheme, moneyness=m, steps=2**i, price=m + i,
+                     error=None, sequence=np.arange(i + 1) * 0.5,
+                     surface=np.ones((3, 2)) * i)
+                for i in range(start, start + n)
+                for m in (0.93, 1.0, 100 / 94.34)]
+
+
+    def test_roundtrip(self):
+        rows = self.runs('hv', 3)
+        self.store.append(rows)
+        self.store.append([dict(scheme=u'd', steps=7, error=u'Failed',
+                                top=150.0)])
+        assert len(self.store) == 10
+        cols = self.store.columns
+        assert cols['steps'].dtype == np.int64
+        assert cols['scheme'][-1] == 'd'
+        assert np.isnan(cols['price'][-1])
+        back = self.store.rows(range(9), arrays=True)
+        for r, b in zip(rows, back):
+            npt.assert_array_equal(r.pop('sequence'), b.pop('sequence'))
+            npt.assert_array_equal(r.pop('surface'), b.pop('surface'))
+            assert b.pop('top') is None
+            assert r == b, (r, b)
+        last = self.store.rows([9], arrays=True)[0]
+        assert last['error'] == 'Failed' and last['price'] is None
+        assert last['surface'] is None
+        # Arrays come back memory mapped
+        assert isinstance(self.store.array('surface', 4).base, np.memmap)
+        self.assertRaises(IndexError, self.store.array, 'surface', 10)
+        self.assertRaises(ValueError, self.store.append, [{'a.b': 1}])
+        self.assertRaises(ValueError, self.store.append, [{'a': object()}])
+
+
+    def test_typed_missing(self):
+        # Integers and booleans keep their type with None in them, within a
+        # shard and across shards lacking the column.
+        self.store.append([dict(steps=4, ok=True), dict(steps=None, ok=None),
+                           dict(steps=2**53 + 1, ok=False)])
+        self.store.append([dict(price=1.0)])
+        rows = [dict(steps=4, ok=True, price=None),
+                dict(steps=None, ok=None, price=None),
+                dict(steps=2**53 + 1, ok=False, price=None),
+                dict(steps=None, ok=None, price=1.0)]
+        for store in (self.store, ResultStore(self.store.directory)):
+            cols = store.columns
+            assert cols['steps'].dtype == np.int64
+            assert cols['ok'].dtype == bool
+            assert store.rows() == rows, store.rows()
+            npt.assert_array_equal(store.missing('steps'),
+                                   [False, True, False, True])
+            npt.assert_array_equal(store.missing('price', [0, 3]),
+                                   [True, False])
+            assert list(store.select(ok=None)) == [1, 3]
+            assert list(store.select(ok=False)) == [2]
+            assert list(store.select(steps=0)) == []
+            self.store.compact()
+        assert ResultStore(self.store.directory).rows() == rows
+
+
+    def test_select(self):
+        self.store.append(self.runs('hv', 4))
+        self.store.append(self.runs('d', 4))
+        hv = self.store.select(scheme='hv', moneyness=1.06, rtol=1e-3)
+        assert len(hv) == 4
+        t = self.store.table(hv, ['steps', 'scheme'])
+        assert list(t['steps']) == [1, 2, 4, 8]
+        assert set(t['scheme']) == set(['hv'])
+        assert len(self.store.select(moneyness=1.06)) == 0
+        assert len(self.store.select(scheme=['hv', 'd'], steps=[1, 8])) == 12
+        assert len(self.store.select(steps=lambda s: s > 2)) == 12
+        assert len(self.store.select(error=None)) == 24
+        self.assertRaises(KeyError, self.store.select, colour='red')
+
+
+    def test_readers_see_appends(self):
+        reader = ResultStore(self.store.directory)
+        assert len(reader) == 0
+        self.store.append(self.runs('hv', 1))
+        assert len(reader) == 3
+        self.store.append(self.runs('hv', 1, start=1))
+        assert len(reader.select(steps=2)) == 3
+        npt.assert_array_equal(reader.array('sequence', 5), [0, 0.5])
+
+
+    def test_compact(self):
+        for i in range(50):
+            self.store.append(self.runs('hv', 1, start=i))
+        before = self.store.rows(arrays=True)
+        self.store.compact()
+        assert self.store.shard_names() == ['shard-000050']
+        after = ResultStore(self.store.directory).rows(arrays=True)
+        assert len(after) == len(before) == 150
+        for b, a in zip(before, after):
+            npt.assert_array_equal(b.pop('surface'), a.pop('surface'))
+            npt.assert_array_equal(b.pop('sequence'), a.pop('sequence'))
+            assert a == b
+        # Loading and querying a compacted store is cheap
+        start = time.time()
+        s = ResultStore(self.store.directory)
+        assert len(s.select(scheme='hv', moneyness=1.0)) == 50
+        assert time.time() - start < 0.1
+
+
+    def test_option_columns(self):
+        o = HestonBarrierOption(spot=90, strike=100, top=(False, 150.0))
+        row = resultstore.option_columns(o)
+        assert row['top'] == 150.0 and row['moneyness'] == 0.9
+        assert row['product'] == 'HestonBarrierOption'
+        row = resultstore.option_columns(HestonOption(interest_rate=0.03))
+        assert row['top'] is None and row['interest_rate'] == 0.03
+        self.store.append([row])
+
+
+    def test_convergence_rows(self):
+        d = os.path.join(os.path.dirname(__file__), '..', '..',
+                         'data_convergence_old')
+        fns = sorted(glob.glob(os.path.join(d, '*.py')))
+        if not fns:
+            raise unittest.SkipTest("No old convergence data")
+        for fn in fns:
+            self.store.append(resultstore.convergence_rows(fn))
+        i = self.store.select(scheme='hv', mode='dt', strike=100.0)
+        assert len(i) == 1
+        npt.assert_array_equal(self.store.array('sequence', i[0]),
+                               0.5**np.arange(1, 7))
+
+
+def main():
+    """Run main."""
+    import nose
+    nose.main()
+    return 0
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# coding: utf8
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+import numpy as np
+import numpy.testing as npt
+
+from FiniteDifference import service
+from FiniteDifference.heston import HestonOption, HestonFiniteDifferenceEngine
+
+SMALL = dict(nspots=30, nvols=20, steps=10)
+
+
+class PricingService_test(unittest.TestCase):
+
+    def setUp(self):
+        self.service = service.PricingService()
+
+
+    def test_price_at_strike(self):
+        r = self.service.price(dict(SMALL, spot=99.0, strike=99.0, id=7))
+        option = HestonOption(spot=99.0, strike=99.0)
+        F = HestonFiniteDifferenceEngine(option, nspots=30, nvols=20,
+                                         cache=False, verbose=False)
+        V = F.solve_hundsdorferverwer(10, 0.1, F.grid.domain[0].copy())
+        npt.assert_allclose(r['price'], V[F.idx], rtol=1e-12)
+        assert r['id'] == 7
+
+
+    def test_spots_share_a_solve(self):
+        prices = [self.service.price(dict(SMALL, spot=s))['price']
+                  for s in (90.0, 100.0, 110.0)]
+        assert prices[0] < prices[1] < prices[2], prices
+        assert self.service.stats['solves'] == 1
+        assert self.service.stats['engines'] == 1
+        # Another scheme reuses the engine
+        self.service.price(dict(SMALL, scheme='d'))
+        assert self.service.stats['solves'] == 2
+        assert self.service.stats['engines'] == 1
+
+
+    def test_reused_engine(self):
+        # A second solve on a warm engine starts from the same initial domain
+        self.service.price(dict(SMALL, spot=100.0))
+        warm = self.service.price(dict(SMALL, spot=100.0, steps=20))
+        fresh = service.PricingService().price(dict(SMALL, spot=100.0,
+                                                    steps=20))
+        assert warm == fresh, (warm, fresh)
+        assert self.service.stats['engines'] == 1
+
+
+    def test_coalesce(self):
+        results = []
+        start = threading.Event()
+        def work(spot):
+            start.wait()
+            results.append(self.service.price(dict(SMALL, spot=spot)))
+        threads = [threading.Thread(target=work, args=(s,))
+                   for s in np.linspace(90, 110, 6)]
+        for t in threads:
+            t.start()
+        start.set()
+        for t in threads:
+            t.join()
+        stats = self.service.stats
+        assert len(results) == 6
+        assert stats['solves'] == 1, stats
+        assert stats['coalesced'] + stats['surface_hits'] == 5, stats
+
+
+    def test_errors(self):
+        responses = self.service.price_many([
+            dict(SMALL, spot=100.0),
+            dict(SMALL, spot=1e6),
+            dict(SMALL, scheme='nope', id='x'),
+            dict(SMALL, colour='red'),
+            'not a request'])
+        assert 'price' in responses[0]
+        assert 'outside the grid' in responses[1]['error']
+        assert responses[2]['id'] == 'x' and 'scheme' in responses[2]['error']
+        assert 'colour' in responses[3]['error']
+        assert 'error' in responses[4]
+        assert self.service.stats['errors'] == 4
+
+
+    def test_barrier(self):
+        up = self.service.price(dict(SMALL, spot=100.0, top=150.0))['price']
+        vanilla = self.service.price(dict(SMALL, spot=100.0))['price']
+        assert 0 < up < vanilla, (up, vanilla)
+
+
+    def test_eviction(self):
+        s = service.PricingService(max_engines=1, max_surfaces=1)
+        s.price(dict(SMALL, strike=90.0))
+        s.price(dict(SMALL, strike=100.0))
+        s.price(dict(SMALL, strike=90.0))
+        assert s.stats['engines'] == 3
+        assert len(s.engines) == 1 and len(s.surfaces) == 1
+
+
+class Server_test(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.address = os.path.join(self.dir, 'pricing.sock')
+        self.server = service.serve(self.address)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.dir)
+
+
+    def test_client(self):
+        with service.Client(self.address, timeout=60) as c:
+            p = c.price(spot=100.0, **SMALL)
+            rs = c.price_many([dict(SMALL, spot=100.0, id=1),
+                               dict(SMALL, spot=-5.0, id=2)])
+            assert rs[0] == {'id': 1, 'spot': 100.0, 'price': p}, rs
+            assert rs[1]['id'] == 2 and 'error' in rs[1]
+            self.assertRaises(service.ServiceError, c.price, scheme='nope')
+            stats = c.stats()
+        assert stats['solves'] == 1, stats
+        assert stats['requests'] == 4, stats
+
+
+def main():
+    """Run main."""
+    import nose
+    nose.main()
+    return 0
+
+if __name__ == '__main__':
+    main()
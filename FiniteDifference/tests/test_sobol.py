@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# coding: utf8
+
+import unittest
+
+import numpy as np
+import numpy.testing as npt
+
+from FiniteDifference import sobol
+
+
+class Sobol_test(unittest.TestCase):
+
+    def test_first_points(self):
+        u = sobol.Sobol(3).draw(4) - 0.5 / 2**32
+        npt.assert_array_equal(u, [[0, 0, 0], [0.5, 0.5, 0.5],
+                                   [0.75, 0.25, 0.25], [0.25, 0.75, 0.75]])
+
+
+    def test_batches_continue(self):
+        whole = sobol.Sobol(8, np.random.RandomState(3)).draw(1000)
+        s = sobol.Sobol(8, np.random.RandomState(3))
+        parts = np.vstack((s.draw(1), s.draw(300), s.draw(699)))
+        npt.assert_array_equal(whole, parts)
+
+
+    def test_scrambled_is_stratified(self):
+        # Every dimension of the first 2**k points hits each of 2**k
+        # intervals once, and the first two dimensions (a (0, 2) net) each
+        # of 2**k squares of side 2**(-k/2) once.
+        u = sobol.Sobol(sobol.MAX_DIM, np.random.RandomState(5)).draw(1024)
+        assert (u > 0).all() and (u < 1).all()
+        cells = np.floor(u * 1024).astype(int)
+        for d in range(sobol.MAX_DIM):
+            assert len(set(cells[:,d])) == 1024, d
+        squares = np.floor(u * 32).astype(int)
+        assert len(set(zip(squares[:,0], squares[:,1]))) == 1024
+        assert not np.array_equal(
+            u, sobol.Sobol(sobol.MAX_DIM, np.random.RandomState(6)).draw(1024))
+
+
+    def test_bridge_increments(self):
+        for n in (1, 2, 7, 16):
+            plan = sobol.bridge(n)
+            assert sorted(p[0] for p in plan) == range(1, n + 1)
+            # Linear in z: the increments of unit vectors give the
+            # covariance, which must be the identity.
+            m = sobol.bridge_increments(np.eye(n), plan)
+            npt.assert_allclose(np.dot(m, m.T), np.eye(n), atol=1e-12)
+            npt.assert_allclose(m.sum(axis=0)[0], np.sqrt(n))
+
+
+    def test_source(self):
+        source = sobol.SobolBridge(np.random.RandomState(1))
+        draws = list(source.draws(40, 512))
+        assert len(draws) == 40
+        z0, z1, u = map(np.array, zip(*draws))
+        npt.assert_allclose(u, sobol.ndtr(z1))
+        assert abs(z0.mean()) < 0.05 and abs(z0.std() - 1) < 0.05
+        self.assertRaises(ValueError, list, source.draws(20, 512))
+
+
+def main():
+    """Run main."""
+    import nose
+    nose.main()
+    return 0
+
+if __name__ == '__main__':
+    main()
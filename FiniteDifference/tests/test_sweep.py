@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# coding: utf8
+
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import numpy.testing as npt
+
+from FiniteDifference import sweep
+from FiniteDifference.resultstore import ResultStore
+from FiniteDifference.heston import HestonOption, HestonFiniteDifferenceEngine
+
+
+class sweep_test(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.points = sweep.product(strike=[95.0, 105.0], nspots=[30],
+                                    nvols=[20], steps=[5, 10])
+
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+
+    def test_group(self):
+        assert len(self.points) == 4
+        groups = sweep.group(self.points)
+        assert [len(g) for g in groups] == [2, 2]
+        for g in groups:
+            assert len(set(p['strike'] for p in g)) == 1
+            assert set(p['steps'] for p in g) == set([5, 10])
+
+
+    def test_run(self):
+        rows = sweep.run(self.points, processes=1)
+        assert [(r['strike'], r['steps']) for r in rows] == [
+            (p['strike'], p['steps']) for p in self.points]
+        option = HestonOption(spot=100, strike=95.0)
+        F = HestonFiniteDifferenceEngine(option, nspots=30, nvols=20,
+                                         cache=False, verbose=False)
+        V = F.solve_hundsdorferverwer(10, 0.1, F.grid.domain[0].copy())
+        r, = [r for r in rows if r['strike'] == 95.0 and r['steps'] == 10]
+        npt.assert_allclose(r['price'], V[F.idx], rtol=1e-12)
+        assert (r['idx_spot'], r['idx_var']) == F.idx
+        npt.assert_allclose(r['analytical'], option.european_price())
+        assert all(r['error'] is None for r in rows)
+
+
+    def test_pool(self):
+        serial = sweep.run(self.points, processes=1)
+        parallel = sweep.run(self.points, processes=2)
+        assert [r['price'] for r in serial] == [r['price'] for r in parallel]
+
+
+    def test_checkpoint(self):
+        fn = os.path.join(self.dir, 'sweep.jsonl')
+        rows = sweep.run(self.points[:2], processes=1, checkpoint=fn)
+        assert len(sweep.load_checkpoint(fn)) == 2
+        # Tamper with the checkpoint to see that it is used
+        lines = [json.loads(l) for l in open(fn)]
+        lines[0]['price'] = -1.0
+        with open(fn, 'w') as f:
+            for l in lines:
+                f.write(json.dumps(l) + '\n')
+            f.write('{"cut short')
+        rows = sweep.run(self.points, processes=1, checkpoint=fn)
+        assert -1.0 in [r['price'] for r in rows[:2]]
+        assert all(r['price'] > 0 for r in rows[2:])
+        assert len(sweep.load_checkpoint(fn)) == 4
+        out = os.path.join(self.dir, 'sweep.csv')
+        sweep.save_table(rows, out)
+        lines = open(out).read().splitlines()
+        assert lines[0] == ','.join(sweep.COLUMNS)
+        assert len(lines) == 5
+        # Checkpointed rows have unicode keys and values
+        store = os.path.join(self.dir, 'store')
+        sweep.save_store(rows, store)
+        s = ResultStore(store)
+        i = s.select(scheme='hv', strike=95.0, steps=10)
+        r, = [r for r in rows if r['strike'] == 95.0 and r['steps'] == 10]
+        # Columns that are None throughout are not stored
+        expected = dict((k, v) for k, v in r.items() if v is not None)
+        assert s.rows(i) == [dict(expected, moneyness=100 / 95.0)]
+
+
+    def test_errors(self):
+        points = sweep.product(nspots=[30], nvols=[20], steps=[5],
+                               top=[150.0, None], spot=[100.0, 200.0])
+        rows = sweep.run(points, processes=1)
+        errors = [(r['top'], r['spot']) for r in rows if r['error']]
+        # Above the barrier there is no grid
+        assert (150.0, 200.0) in errors, rows
+        assert (None, 100.0) not in errors
+
+
+def main():
+    """Run main."""
+    import nose
+    nose.main()
+    return 0
+
+if __name__ == '__main__':
+    main()
@@ -8,8 +8,6 @@ import argparse
 from FiniteDifference import utils
 
 from FiniteDifference.Grid import Grid
-from FiniteDifference.FiniteDifferenceEngineGPU import FiniteDifferenceEngineADI as FDE_ADI_GPU
-from FiniteDifference.FiniteDifferenceEngineGPU import HestonFiniteDifferenceEngine as HestonFDEGPU
 from FiniteDifference.heston import HestonOption, HestonBarrierOption, hs_call_vector, HestonFiniteDifferenceEngine
 from FiniteDifference.blackscholes import BlackScholesOption
 
@@ -80,6 +78,8 @@ def create_cpu(nspots=30, nvols=30):
     return F
 
 def create_gpu(nspots=30, nvols=30):
+    # Only needed here, so the CPU benchmarks run without CUDA
+    from FiniteDifference.FiniteDifferenceEngineGPU import HestonFiniteDifferenceEngine as HestonFDEGPU
     F = HestonFDEGPU(H, nspots=nspots,
                      nvols=nvols, spotdensity=10, varexp=4,
                      var_max=12, verbose=False)
@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+# coding: utf8
+"""Micro-benchmark the BandedOperator primitives in ns per grid point.
+
+    $ python benchmark_operators.py --json operators.json
+    $ python benchmark_operators.py --primitives solve apply --baseline operators.json
+"""
+
+import sys
+import argparse
+import warnings
+
+from FiniteDifference import benchmarks
+from FiniteDifference import microbenchmarks as mb
+
+
+def read_args():
+    parser = argparse.ArgumentParser(description="Time the BandedOperator primitives")
+    parser.add_argument('--blocks', default=[1, 10, 100], metavar='int', nargs='+', type=int, help="Numbers of blocks")
+    parser.add_argument('--block-lens', default=[100, 1000], metavar='int', nargs='+', type=int, help="Block lengths")
+    parser.add_argument('--bandwidths', default=['tri', 'penta'], nargs='+', choices=['tri', 'penta'])
+    parser.add_argument('--primitives', default=list(mb.PRIMITIVES), nargs='+', choices=mb.PRIMITIVES)
+    parser.add_argument('--min-time', default=0.02, metavar='FLOAT', type=float, help="Seconds to spend per primitive and case")
+    parser.add_argument('--json', metavar='FILE', help="Save the results as JSON (usable as a baseline)")
+    parser.add_argument('--csv', metavar='FILE', help="Save the results as CSV")
+    parser.add_argument('--baseline', metavar='FILE', help="JSON results to compare against")
+    parser.add_argument('--tolerance', default=0.2, metavar='FLOAT', type=float, help="Allowed relative slowdown")
+    return parser.parse_args()
+
+
+def main():
+    opt = read_args()
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        results = mb.sweep(opt.blocks, opt.block_lens, opt.bandwidths,
+                           opt.primitives, opt.min_time)
+    for line in mb.report(results):
+        print line
+    if opt.json:
+        benchmarks.save_json(results, opt.json)
+    if opt.csv:
+        benchmarks.save_csv(results, opt.csv, columns=mb.COLUMNS)
+    if opt.baseline:
+        comparison = benchmarks.compare(results, benchmarks.load_json(opt.baseline),
+                                        tolerance=opt.tolerance,
+                                        metric='ns_per_point', key=mb.KEY)
+        print
+        for line in benchmarks.report(comparison, key=mb.KEY):
+            print line
+        if benchmarks.regressions(comparison):
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
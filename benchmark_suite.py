@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# coding: utf8
+"""Benchmark the CPU ADI schemes over grid sizes and step counts.
+
+    $ python benchmark_suite.py --json baseline.json
+    ... change the operator code ...
+    $ python benchmark_suite.py --baseline baseline.json --tolerance 0.1
+
+Exits with status 1 if a case got slower than the tolerance allows or its
+price changed.
+
+    $ python benchmark_suite.py --pareto --json accuracy.json
+
+prices a vanilla and an up-and-out call with every combination of scheme,
+theta, grid, steps and smoothing steps instead, and prints the configurations
+on each product's runtime/error Pareto frontier.
+"""
+
+import sys
+import argparse
+
+from FiniteDifference import benchmarks
+
+
+def read_args():
+    parser = argparse.ArgumentParser(description="Run the CPU benchmark suite")
+    parser.add_argument('--schemes', help="Comma separated schemes (%s, or %s with --pareto)" % (','.join(sorted(benchmarks.SCHEMES)), ','.join(sorted(benchmarks.SOLVERS))))
+    parser.add_argument('--sizes', default=[50, 100, 200], metavar='int', nargs='+', type=int, help="nspots = nvols of the grids, nspots with --pareto")
+    parser.add_argument('--steps', metavar='int', nargs='+', type=int, help="Numbers of time steps (50 200, or 25 50 100 200 with --pareto)")
+    parser.add_argument('--pareto', action='store_true', help="Measure price errors and find the Pareto frontier of runtime and error")
+    parser.add_argument('--products', default='vanilla,up-and-out', help="Comma separated products with --pareto (%(default)s)")
+    parser.add_argument('--thetas', default=[0.5, 0.65], metavar='float', nargs='+', type=float, help="Thetas of the ADI schemes with --pareto")
+    parser.add_argument('--nvols', metavar='int', nargs='+', type=int, help="nvols of the grids with --pareto (default half of each size)")
+    parser.add_argument('--smoothing', default=[0, 1], metavar='int', nargs='+', type=int, help="Smoothing steps with --pareto")
+    parser.add_argument('--targets', default=[1e-2, 1e-3], metavar='float', nargs='+', type=float, help="Errors to find the cheapest configuration for with --pareto")
+    parser.add_argument('--repeat', default=3, metavar='int', type=int, help="Solves per case, the fastest counts")
+    parser.add_argument('--json', metavar='FILE', help="Save the results as JSON (usable as a baseline)")
+    parser.add_argument('--csv', metavar='FILE', help="Save the results as CSV")
+    parser.add_argument('--baseline', metavar='FILE', help="JSON results to compare against")
+    parser.add_argument('--tolerance', default=0.1, metavar='FLOAT', type=float, help="Allowed relative slowdown per step")
+    parser.add_argument('--no-isolate', action='store_const', dest='isolate', default=True, const=False, help="Run all cases in this process")
+    opt = parser.parse_args()
+    schemes = benchmarks.SOLVERS if opt.pareto else benchmarks.SCHEMES
+    if opt.schemes is None:
+        opt.schemes = sorted(schemes)
+    else:
+        opt.schemes = opt.schemes.split(',')
+    for s in opt.schemes:
+        if s not in schemes:
+            parser.error("Unknown scheme: %s" % s)
+    if opt.steps is None:
+        opt.steps = [25, 50, 100, 200] if opt.pareto else [50, 200]
+    opt.products = opt.products.split(',')
+    for p in opt.products:
+        if p not in benchmarks.products():
+            parser.error("Unknown product: %s" % p)
+    if opt.nvols is None:
+        opt.nvols = [n // 2 for n in opt.sizes]
+    elif len(opt.nvols) != len(opt.sizes):
+        parser.error("Need one --nvols per size.")
+    return opt
+
+
+def pareto(opt):
+    cases = benchmarks.accuracy_cases(opt.products, opt.schemes, opt.thetas,
+                                      zip(opt.sizes, opt.nvols), opt.steps,
+                                      opt.smoothing)
+    options = benchmarks.products()
+    references = {}
+    for p in opt.products:
+        references[p] = benchmarks.reference(options[p])
+        print "%s reference: %.10g" % (p, references[p])
+    header = "%-10s %-6s %6s %6s %6s %6s %6s %9s %12s" % (
+        'product', 'scheme', 'theta', 'nspots', 'nvols', 'steps', 'smooth', 'time', 'error')
+    line = "%-10s %-6s %6s %6i %6i %6i %6i %8.3fs %12.4g"
+    def fmt(r):
+        theta = '-' if r['theta'] is None else "%.3g" % r['theta']
+        return line % (r['product'], r['scheme'], theta, r['nspots'], r['nvols'],
+                       r['steps'], r['smoothing'], r['time'], r['error'])
+    print header
+    results = []
+    for case in cases:
+        r = benchmarks.accuracy_suite([case], references)[0]
+        print fmt(r)
+        sys.stdout.flush()
+        results.append(r)
+    if opt.json:
+        benchmarks.save_json(results, opt.json)
+    if opt.csv:
+        benchmarks.save_csv(results, opt.csv, columns=benchmarks.ACCURACY_COLUMNS)
+    for p, front in sorted(benchmarks.pareto(results).items()):
+        print
+        print "Pareto frontier, %s:" % p
+        print header
+        for r in front:
+            print fmt(r)
+        for target in opt.targets:
+            r = benchmarks.cheapest(front, target)
+            print "Cheapest within %g: %s" % (target, "none" if r is None else fmt(r))
+    return 0
+
+
+def main():
+    opt = read_args()
+    if opt.pareto:
+        return pareto(opt)
+    cases = benchmarks.cases(opt.schemes, opt.sizes, opt.steps)
+    results = []
+    print "%-7s %6s %6s %6s %9s %12s %12s %9s" % (
+        'scheme', 'nspots', 'nvols', 'steps', 'build', 'per step', 'pts*steps/s', 'MB')
+    for case in cases:
+        r = benchmarks.suite([case], opt.repeat, isolate=opt.isolate)[0]
+        print "%-7s %6i %6i %6i %8.3fs %11.3gs %12.4g %9.1f" % (
+            r['scheme'], r['nspots'], r['nvols'], r['steps'], r['build_time'],
+            r['time_per_step'], r['gridpoint_steps_per_second'], r['memory_mb'])
+        sys.stdout.flush()
+        results.append(r)
+    if opt.json:
+        benchmarks.save_json(results, opt.json)
+    if opt.csv:
+        benchmarks.save_csv(results, opt.csv)
+    if opt.baseline:
+        comparison = benchmarks.compare(results, benchmarks.load_json(opt.baseline),
+                                        tolerance=opt.tolerance)
+        print
+        for line in benchmarks.report(comparison):
+            print line
+        if benchmarks.regressions(comparison):
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
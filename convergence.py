@@ -19,6 +19,7 @@ from FiniteDifference.visualize import surface, wireframe
 from FiniteDifference.heston import HestonOption, hs_call_vector, HestonFiniteDifferenceEngine
 from FiniteDifference.blackscholes import BlackScholesOption, BlackScholesFiniteDifferenceEngine
 from FiniteDifference.Option import MeanRevertingProcess
+from FiniteDifference.resultstore import ResultStore, option_columns
 
 array = np.array
 
@@ -131,6 +132,24 @@ class ConvergenceTest(object):
             fout.write(repr(self))
 
 
+    def save(self, store):
+        """Append this test to @store@, a ResultStore or its directory."""
+        if isinstance(store, basestring):
+            store = ResultStore(store)
+        row = option_columns(self.option)
+        spots, vars = self.mesh
+        ref = self.reference_solution
+        if ref is not None:
+            # A price in dx mode, a surface in dt mode
+            ref = np.atleast_1d(ref)
+        row.update(scheme=self.scheme, mode=self.mode, backend=self.backend,
+                   state=self.state, spots=spots, vars=vars,
+                   reference_solution=ref,
+                   sequence=self.result[self.mode]['sequence'],
+                   errors=self.result[self.mode]['error'])
+        return store.append([row])
+
+
     def make_file_name(self):
         fn = os.path.join("data_convergence", "{type}_strike-{k}_{scheme}_{mode}_{backend}.py")
         return fn.format(type=self.option.Type,
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# coding: utf8
+"""Observed order of convergence of a scheme in dt, dx or both.
+
+    $ python convergence_study.py --mode dt --scheme hv -nx 100 50 -nt 16 --levels 5
+
+The levels share their engine where they share a mesh and run on a process
+pool next to the fine reference. Use --exact to measure errors against the
+COS price of the vanilla instead of the reference level.
+"""
+
+from __future__ import division
+
+import sys
+import argparse
+import multiprocessing
+
+from FiniteDifference import convergencestudy
+from FiniteDifference.heston import HestonOption, SOLVERS
+
+
+def read_args():
+    parser = argparse.ArgumentParser(description="Run a convergence study")
+    parser.add_argument('--mode', default='dt', choices=convergencestudy.MODES)
+    parser.add_argument('--scheme', default='hv', choices=sorted(SOLVERS))
+    parser.add_argument('--theta', default=0.5, metavar='FLOAT', type=float)
+    parser.add_argument('--smoothing', default=1, metavar='INT', type=int, help="Implicit smoothing steps (%(default)s)")
+    parser.add_argument('-s', '--spot', metavar='FLOAT', type=float, default=100.0)
+    parser.add_argument('-k', '--strike', metavar='FLOAT', type=float, default=99.0)
+    parser.add_argument('-t', '--tenor', metavar='FLOAT', type=float, default=1.0)
+    parser.add_argument('-r', '--interest-rate', metavar='FLOAT', type=float, default=0.06)
+    parser.add_argument('--mean-reversion', metavar='FLOAT', type=float, default=1.0)
+    parser.add_argument('--variance', metavar='FLOAT', type=float, default=0.04)
+    parser.add_argument('-o', '--vol-of-var', metavar='FLOAT', type=float, default=0.4)
+    parser.add_argument('-p', '--correlation', metavar='FLOAT', type=float, default=0.0)
+    parser.add_argument('--top', metavar='FLOAT', type=float, default=None, help="Up-and-out barrier")
+    parser.add_argument('-nx', default=[50, 25], metavar='int', nargs=2, type=int, help="nspots/nvols of the coarsest level")
+    parser.add_argument('-nt', default=16, metavar='int', type=int, help="Time steps of the coarsest level")
+    parser.add_argument('--levels', default=5, metavar='int', type=int)
+    parser.add_argument('--reference', default=2, metavar='int', type=int, help="Refinements of the reference beyond the finest level (%(default)s)")
+    parser.add_argument('--exact', action='store_true', help="Errors against the COS price (vanillas only)")
+    parser.add_argument('--processes', default=multiprocessing.cpu_count(), metavar='int', type=int)
+    parser.add_argument('--store', default=None, metavar='DIR', help="Append the levels to this result store")
+    parser.add_argument('-v', action='count', dest='verbose')
+    opt = parser.parse_args()
+    if opt.exact and opt.top is not None:
+        parser.error("--exact needs a vanilla, there is no COS price with --top")
+    return opt
+
+
+def main():
+    opt = read_args()
+    point = dict(spot=opt.spot, strike=opt.strike, tenor=opt.tenor,
+                 interest_rate=opt.interest_rate,
+                 mean_reversion=opt.mean_reversion, variance=opt.variance,
+                 vol_of_variance=opt.vol_of_var, correlation=opt.correlation,
+                 top=opt.top, nspots=opt.nx[0], nvols=opt.nx[1],
+                 steps=opt.nt, scheme=opt.scheme, theta=opt.theta,
+                 smoothing=opt.smoothing)
+    exact = None
+    if opt.exact:
+        exact = HestonOption(spot=opt.spot, strike=opt.strike,
+                             interest_rate=opt.interest_rate,
+                             variance=opt.variance, tenor=opt.tenor,
+                             mean_reversion=opt.mean_reversion,
+                             vol_of_variance=opt.vol_of_var,
+                             correlation=opt.correlation).european_price()
+    study = convergencestudy.run(point, mode=opt.mode, levels=opt.levels,
+                                 reference=opt.reference, exact=exact,
+                                 processes=opt.processes,
+                                 verbose=opt.verbose)
+    print convergencestudy.report(study)
+    if opt.store:
+        convergencestudy.save(study, opt.store)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
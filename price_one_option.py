@@ -15,6 +15,7 @@ import cPickle
 
 import convergence as cv
 import FiniteDifference as FD
+from FiniteDifference.resultstore import ResultStore, option_columns
 # from FiniteDifference.FiniteDifferenceEngineGPU import FiniteDifferenceEngineADI as FDEGPU
 from FiniteDifference.FiniteDifferenceEngineGPU import HestonFiniteDifferenceEngine as FDEGPU
 import FiniteDifference.visualize as vis
@@ -64,9 +65,13 @@ def read_args():
     parser.add_argument('-nx', required=True, metavar='int', help='nspots/vols', nargs=2, type=int)
     parser.add_argument('-nt', required=True, metavar='int', help='timesteps', type=int)
     parser.add_argument('-v', action='count', dest='verbose')
+    parser.add_argument('--store', metavar='DIR', default=None, help="Append the FD result to this result store instead of pickling it")
     parser.add_argument('--gpu', action='store_const', default=None, const=engineGPU)
     parser.add_argument('--cpu', action='store_const', default=None, const=engineCPU)
     parser.add_argument('--mc', metavar='int', type=int, help="Number of MC paths", default=0)
+    parser.add_argument('--mc-target', metavar='FLOAT', type=float, help="Run MC until the 95%% interval half width is below this, with --mc as the path limit", default=None)
+    parser.add_argument('--seed', metavar='int', type=int, help="MC seed, for reproducible runs", default=None)
+    parser.add_argument('--processes', metavar='int', type=int, help="MC worker processes", default=1)
     opt = parser.parse_args()
     if opt.top:
         assert opt.option is FD.heston.HestonBarrierOption, ("--barrier required with --top")
@@ -145,8 +150,18 @@ def run(opt):
         print "FD:", e.grid.domain[-1][s,v]
     else:
         option = new_option(opt)
-        if opt.mc:
-            res = option.monte_carlo(npaths=opt.mc, dt=(opt.tenor / opt.nt))
+        if opt.mc_target:
+            res = option.monte_carlo(dt=(opt.tenor / opt.nt),
+                                     target_error=opt.mc_target,
+                                     max_paths=opt.mc or None,
+                                     seed=opt.seed, processes=opt.processes)
+            e = res
+            print
+            print "MC:", res['expected'], "±", 1.96 * res['error']
+            print "MC paths: %i (%.2fs)" % (res['n'], res['duration'])
+        elif opt.mc:
+            res = option.monte_carlo(npaths=opt.mc, dt=(opt.tenor / opt.nt),
+                                     seed=opt.seed, processes=opt.processes)
             e = res
             print
             print "MC:", res['expected'], "±", 1.96 * res['error']
@@ -192,6 +207,27 @@ def filestring(opt, e):
     return fn
 
 
+def store_row(opt, e):
+    """The FD result of @e@ as a result store row."""
+    row = option_columns(e.option)
+    idxs, idxv = e.idx
+    row.update(backend="gpu" if opt.gpu == engineGPU else "cpu",
+               scheme=opt.scheme, nspots=opt.nx[0], nvols=opt.nx[1],
+               steps=opt.nt, idx_spot=idxs, idx_var=idxv,
+               price=float(e.grid.domain[-1][idxs, idxv]),
+               spots=e.grid.mesh[0], vars=e.grid.mesh[1],
+               surface=e.grid.domain[-1])
+    return row
+
+
+def save_result(opt, res):
+    if opt.store:
+        ResultStore(opt.store).append([store_row(opt, res)])
+    else:
+        with open(filestring(opt, res), 'w') as fn:
+            cPickle.dump([res.grid.mesh, res.grid.domain[-1]], fn, -1)
+
+
 def main():
     opt = read_args()
     if opt.verbose:
@@ -199,14 +235,12 @@ def main():
     if opt.cpu:
         opt.engine = opt.cpu
         res = run(opt)
-        with open(filestring(opt, res), 'w') as fn:
-            cPickle.dump([res.grid.mesh, res.grid.domain[-1]], fn, -1)
+        save_result(opt, res)
     if opt.gpu:
         opt.engine = opt.gpu
         res = run(opt)
-        with open(filestring(opt, res), 'w') as fn:
-            cPickle.dump([res.grid.mesh, res.grid.domain[-1]], fn, -1)
-    if opt.mc:
+        save_result(opt, res)
+    if opt.mc or opt.mc_target:
         opt.engine = None
         res = run(opt)
 
@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+# coding: utf8
+"""Serve prices from warm engines.
+
+    $ python price_server.py --socket /tmp/pricing.sock &
+    $ python -c "from FiniteDifference import service; \\
+    >   print service.Client('/tmp/pricing.sock').price(spot=100, steps=200)"
+
+See FiniteDifference/service.py for the protocol.
+"""
+
+import sys
+import argparse
+
+from FiniteDifference import service
+
+
+def read_args():
+    parser = argparse.ArgumentParser(description="Run the local pricing service")
+    parser.add_argument('--socket', metavar='PATH', help="Listen on this Unix socket")
+    parser.add_argument('--host', default='127.0.0.1', help="Listen on this host without --socket (%(default)s)")
+    parser.add_argument('--port', default=7878, metavar='int', type=int, help="Listen on this port without --socket (%(default)s)")
+    parser.add_argument('--max-engines', default=8, metavar='int', type=int, help="Warm engines to keep")
+    parser.add_argument('--max-surfaces', default=64, metavar='int', type=int, help="Solved surfaces to keep")
+    parser.add_argument('-v', action='count', dest='verbose')
+    opt = parser.parse_args()
+    return opt
+
+
+def main():
+    opt = read_args()
+    address = opt.socket or (opt.host, opt.port)
+    server = service.serve(address, service.PricingService(opt.max_engines,
+                                                           opt.max_surfaces))
+    if opt.verbose:
+        print "Serving on", address
+        sys.stdout.flush()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
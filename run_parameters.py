@@ -1,52 +1,38 @@
 #!/usr/bin/env python
 # coding: utf8
+"""Price the convergence parameter grid with the Hundsdorfer-Verwer scheme.
+
+    $ python run_parameters.py --processes 8
+
+Points sharing a model and grid share an engine, groups run in parallel,
+and finished groups go to the checkpoint, so an interrupted sweep picks up
+where it stopped. The results end up in one CSV table.
+"""
 
 from __future__ import division
 
-import sys
 import os
-import itertools as it
-import subprocess
-import multiprocessing as m
+import sys
+import argparse
+import multiprocessing
 
-import numpy as np
+from FiniteDifference import sweep
 
-from price_one_option import data_dir
+data_dir = os.path.expanduser("~/cudafd/src/fd_pricer/py_adi/data_convergence/")
 
-def price_one(params):
-    mon, ir, vol, volvol, corr, rev, tenor, (ns, nv), nt = params
-    spot = 100
-    strike = np.round(spot / mon, decimals=2)
-    cmd = 'python'
-    args = [cmd, 'price_one_option.py', '--scheme', 'hv', '-s', spot, '-k',
-            strike, '-t', tenor, '-r', ir, '--mean-reversion', rev,
-            '--variance', vol**2, '-o', volvol, '--mean-variance', vol**2,
-            '-p', corr, '-nx', ns, nv, '-nt', nt, '-v', back]
-    args = map(str, args)
-    print args
-    try:
-        ret = subprocess.call(args)
-    except AssertionError:
-        print "PROBLEM! ASSERTION ERROR"
-    except e:
-        print "Something Crazy", e
-        sys.exit(1)
-    if ret != 0:
-        print "PROBLEM! EXIT CODE", ret
-    return 0
 
+def read_args():
+    parser = argparse.ArgumentParser(description="Run the parameter sweep")
+    parser.add_argument('--processes', default=multiprocessing.cpu_count(), metavar='int', type=int, help="Worker processes (%(default)s)")
+    parser.add_argument('--checkpoint', default=os.path.join(data_dir, 'sweep_checkpoint.jsonl'), metavar='FILE', help="Finished points (%(default)s)")
+    parser.add_argument('--out', default=os.path.join(data_dir, 'sweep.csv'), metavar='FILE', help="Results table (%(default)s)")
+    parser.add_argument('--store', default=None, metavar='DIR', help="Also append the results to this result store")
+    parser.add_argument('-v', action='count', dest='verbose')
+    return parser.parse_args()
 
-def main():
-    """Run main."""
-    print sys.argv
-    global back
-    try:
-        back = sys.argv[1]
-    except IndexError:
-        back = '--cpu'
-
-    os.chdir(os.path.join(data_dir, '..'))
 
+def points():
+    spot = 100
     moneyness = [0.93, 1, 1.06]
     ir = [0.01, 0.1]
 
@@ -59,33 +45,40 @@ def main():
     space = [int(2**i) for i in range(6, 11)]
     time = [int(2**i) for i in range(6, 11)]
 
-    params = list(it.product(
-        moneyness,
-        ir,
-        vol,
-        volvol,
-        corr,
-        rev,
-        tenor,
-        [(s, s // 2) for s in space],
-        time
-    ))
-
-    if back == '--gpu':
-        procs = 1
-    else:
-        procs = m.cpu_count()
-    procs = 1
-
-    pool = m.Pool(processes=procs)
-    pool.map(price_one, params)
+    ret = []
+    for v in vol:
+        for s in space:
+            ret.extend(sweep.product(
+                spot=[spot],
+                strike=[round(spot / mon, 2) for mon in moneyness],
+                interest_rate=ir,
+                variance=[v**2],
+                mean_variance=[v**2],
+                vol_of_variance=volvol,
+                correlation=corr,
+                mean_reversion=rev,
+                tenor=tenor,
+                nspots=[s],
+                nvols=[s // 2],
+                scheme=['hv'],
+                steps=time))
+    return ret
+
+
+def main():
+    opt = read_args()
+    for fn in (opt.checkpoint, opt.out):
+        d = os.path.dirname(fn)
+        if d and not os.path.isdir(d):
+            os.makedirs(d)
+    rows = sweep.run(points(), processes=opt.processes,
+                     checkpoint=opt.checkpoint, verbose=opt.verbose)
+    sweep.save_table(rows, opt.out)
+    if opt.store:
+        sweep.save_store(rows, opt.store)
+    failed = [r for r in rows if r['error'] is not None]
+    print "%i points, %i failed, results in %s" % (len(rows), len(failed), opt.out)
+    return 1 if failed else 0
 
 if __name__ == '__main__':
-    main()
-
-# usage: price_one_option.py [-h] [--scheme {i,d,hv,s}] [-s FLOAT] [-k FLOAT]
-                            # [-t FLOAT] [-r FLOAT] [--mean-reversion FLOAT]
-                            # [--variance FLOAT] [-o FLOAT]
-                            # [--mean-variance FLOAT] [-p FLOAT] [--min_i INT]
-                            # [--max_i INT] [--top TOP] [--barrier] -nx int int
-                            # -nt int [-v] [--gpu] [--cpu]
+    sys.exit(main())